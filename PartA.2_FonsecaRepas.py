@@ -1,44 +1,574 @@
+import argparse
 import logging
+import os
 import sys
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from neo4j.exceptions import ClientError
+
+from sdm.app import BaseApp
+from sdm.dataset import (BATCH_SIZE, EDGES, INDEXES, NODES, batched, convert_batches, cypher_value, edge_rows,
+                         iter_rows, key_types, keyed_rows, property_types, read_batches)
+from sdm.delta import MANIFEST, Manifest
+from sdm.impact import journal_year_rows
+from sdm.metrics import LoadMetrics
+
+PROGRESS_EVERY = 10
+WORKERS = 4
+# Edge files the citation statistics stored on papers and authors are derived from
+CITATION_FILES = ["cites.csv", "wrote.csv", "published_in_edition.csv", "contains.csv",
+                  "happened_in.csv", "volume_published_in_year.csv"]
+
+# A unit of the load plan: it runs once every step in deps has finished and
+# no running step holds one of its locks (labels whose nodes it writes to).
+Step = namedtuple("Step", ["name", "work", "deps", "locks"])
+
+
+def run_dag(steps, workers=WORKERS):
+    pending = {step.name: step for step in steps}
+    done = set()
+    held = set()
+    running = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while pending or running:
+            for name, step in list(pending.items()):
+                if len(running) >= workers:
+                    break
+                if done.issuperset(step.deps) and not held & step.locks:
+                    del pending[name]
+                    held |= step.locks
+                    running[pool.submit(step.work)] = (step, time.time())
+            if not running:
+                raise ValueError("Steps with unsatisfiable dependencies: %s" % ", ".join(sorted(pending)))
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                step, start = running.pop(future)
+                held -= step.locks
+                future.result()
+                done.add(step.name)
+                print("Step '%s' finished in %.1fs" % (step.name, time.time() - start))
+
+
+def node_batch_query(label, properties):
+    assignments = ", ".join("%s: row[%d]" % (prop, i) for i, prop in enumerate(properties))
+    return "UNWIND $rows AS row CREATE (:%s {%s});" % (label, assignments)
+
+
+def node_load_csv_query(filename, label, properties):
+    types = property_types(label, properties)
+    assignments = ", ".join("%s: %s" % (prop, cypher_value("row." + column, value_type))
+                            for (prop, column), value_type in zip(properties.items(), types))
+    return "LOAD CSV WITH HEADERS FROM 'file:///%s' AS row CREATE (:%s {%s});" % (filename, label, assignments)
+
+
+def edge_load_csv_query(filename, rel_type, start, end):
+    start_type, end_type = key_types(start, end)
+    return (
+        "LOAD CSV WITH HEADERS FROM 'file:///%s' AS row "
+        "MATCH (a:%s {%s: %s}) "
+        "MATCH (b:%s {%s: %s}) "
+        "CREATE (a)-[:%s]->(b);" % (filename, start[0], start[1], cypher_value("row." + start[2], start_type),
+                                    end[0], end[1], cypher_value("row." + end[2], end_type), rel_type)
+        )
+
+
+def index_query(label):
+    key, name = INDEXES[label]
+    return "CREATE INDEX %s IF NOT EXISTS FOR (n:%s) ON (n.%s)" % (name, label, key)
+
+
+def edge_batch_query(rel_type, start, end, operation="CREATE", return_key=False):
+    # return_key: rows end with a key, returned for the rows whose two endpoints were found
+    return (
+        "UNWIND $rows AS row "
+        "MATCH (a:%s {%s: row[0]}) "
+        "MATCH (b:%s {%s: row[1]}) "
+        "%s (a)-[:%s]->(b)%s;" % (start[0], start[1], end[0], end[1], operation, rel_type,
+                                  " RETURN row[2] AS key" if return_key else "")
+        )
+
+
+def node_merge_query(label, properties):
+    key = INDEXES[label][0]
+    names = list(properties)
+    query = "UNWIND $rows AS row MERGE (n:%s {%s: row[%d]})" % (label, key, names.index(key))
+    updates = ["n.%s = row[%d]" % (prop, i) for i, prop in enumerate(names) if prop != key]
+    if updates:
+        query += " SET " + ", ".join(updates)
+    return query + ";"
+
+
+def node_delete_query(label):
+    return "UNWIND $rows AS row MATCH (n:%s {%s: row[0]}) DETACH DELETE n;" % (label, INDEXES[label][0])
+
+
+def edge_delete_query(rel_type, start, end):
+    return (
+        "UNWIND $rows AS row "
+        "MATCH (:%s {%s: row[0]})-[r:%s]->(:%s {%s: row[1]}) "
+        "DELETE r;" % (start[0], start[1], rel_type, end[0], end[1])
+        )
+
+class App(BaseApp):
+
+    def __init__(self, uri=None, user=None, password=None, metrics=None, driver=None, bookmarks=None, config=None):
+        super().__init__(uri, user, password, driver, bookmarks=bookmarks, config=config)
+        self.metrics = metrics or LoadMetrics()
 
-from neo4j import GraphDatabase
+    def clean_db(self):
+        with self.driver.session() as session:
+            self._step(session, "clean_db", self._clean_db)
+        self.bump_epoch()
 
-class App:
+    @staticmethod
+    def _clean_db(tx):
+        query = ("MATCH (n) DETACH DELETE n;")
+        summary = tx.run(query).consume()
+        print("Database emptied")
+        return summary
 
-    def __init__(self, uri, user, password):
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
+    def clean_db_batched(self, batch_size=BATCH_SIZE, workers=WORKERS):
+        # Deletes relationships per type, then nodes per label, each batch in its own
+        # transaction. Committed batches stay deleted, so an interrupted wipe is resumed
+        # by calling this again.
+        with self.driver.session() as session:
+            rel_types = session.read_transaction(
+                self._list_names, "CALL db.relationshipTypes() YIELD relationshipType AS name")
+            labels = session.read_transaction(self._list_names, "CALL db.labels() YIELD label AS name")
+        steps = []
+        for rel_type in rel_types:
+            query = "MATCH ()-[r:`%s`]->() WITH r LIMIT $limit DELETE r RETURN count(*) AS deleted" % rel_type
+            work = self._session_work(self._delete_batches, ":" + rel_type, query, batch_size)
+            steps.append(Step("delete :" + rel_type, work, (), frozenset()))
+        rel_steps = tuple(step.name for step in steps)
+        for label in labels:
+            query = "MATCH (n:`%s`) WITH n LIMIT $limit DETACH DELETE n RETURN count(*) AS deleted" % label
+            work = self._session_work(self._delete_batches, label, query, batch_size)
+            steps.append(Step("delete " + label, work, rel_steps, frozenset()))
+        query = "MATCH (n) WITH n LIMIT $limit DETACH DELETE n RETURN count(*) AS deleted"
+        steps.append(Step("delete remaining nodes",
+                          self._session_work(self._delete_batches, "unlabeled nodes", query, batch_size),
+                          tuple(step.name for step in steps), frozenset()))
+        run_dag(steps, workers)
+        self.bump_epoch()
+        print("Database emptied")
 
-    def close(self):
-        # Don't forget to close the driver connection when you are finished with it
-        self.driver.close()
+    def recreate_db(self, database="neo4j"):
+        # Fast path: replace the whole store instead of deleting its contents. Needs a server
+        # that supports CREATE OR REPLACE DATABASE (Enterprise 4.2+); indexes are dropped too.
+        try:
+            with self.driver.session(database="system") as session:
+                session.run("CREATE OR REPLACE DATABASE `%s` WAIT" % database).consume()
+        except ClientError as error:
+            print("Could not recreate database %s: %s" % (database, error.message))
+            return False
+        self.bump_epoch()
+        print("Database %s recreated" % database)
+        return True
 
     @staticmethod
-    def enable_log(level, output_stream):
-        handler = logging.StreamHandler(output_stream)
-        handler.setLevel(level)
-        logging.getLogger("neo4j").addHandler(handler)
-        logging.getLogger("neo4j").setLevel(level)
+    def _list_names(tx, query):
+        return [row["name"] for row in tx.run(query)]
+
+    def _delete_batches(self, session, name, query, batch_size):
+        start = time.time()
+        total = 0
+        batches = 0
+        while True:
+            deleted = session.write_transaction(self._delete_batch, query, batch_size)
+            total += deleted
+            batches += 1
+            if batches % PROGRESS_EVERY == 0:
+                print("%s: %d deleted (%.0f/s)" % (name, total, total / (time.time() - start)))
+            if deleted < batch_size:
+                break
+        print("%s: %d deleted in %.1fs" % (name, total, time.time() - start))
+        self.metrics.record("delete " + name, time.time() - start, rows=total)
 
-    def clean_db(self):
+    @staticmethod
+    def _delete_batch(tx, query, batch_size):
+        return tx.run(query, limit=batch_size).single()["deleted"]
+
+    def load_nodes(self):
         with self.driver.session() as session:
-            session.write_transaction(self._clean_db)
+            self._step(session, "Author nodes", self._load_authors, filename="authors.csv")
+            self._step(session, "Edition nodes", self._load_editions, filename="editions.csv")
+            self._step(session, "Journal nodes", self._load_journals, filename="journals.csv")
+            self._step(session, "Keyword nodes", self._load_keywords, filename="keywords.csv")
+            self._step(session, "Paper nodes", self._load_papers, filename="papers.csv")
+            self._step(session, "Conference nodes", self._load_conferences, filename="conferences.csv")
+            self._step(session, "Volume nodes", self._load_volumes, filename="volumes.csv")
+            self._step(session, "Year nodes", self._load_years, filename="years.csv")
+        self.bump_epoch()
+
+    def load_nodes_batched(self, import_dir, batch_size=BATCH_SIZE):
+        with self.driver.session() as session:
+            for filename, label, properties in NODES:
+                query = node_batch_query(label, properties)
+                batches = read_batches(os.path.join(import_dir, filename), list(properties.values()), batch_size,
+                                       property_types(label, properties))
+                self._load_batches(session, label + " nodes", query, batches)
+        self.bump_epoch()
+
+    def load_edges_batched(self, import_dir, batch_size=BATCH_SIZE):
+        with self.driver.session() as session:
+            for filename, rel_type, start, end in EDGES:
+                query = edge_batch_query(rel_type, start, end)
+                batches = read_batches(os.path.join(import_dir, filename), [start[2], end[2]], batch_size,
+                                       key_types(start, end))
+                self._load_batches(session, "%s (%s)" % (rel_type, filename), query, batches)
+        self.load_author_published_in_edition(batch_size=batch_size)
+        self.load_citation_stats(batch_size=batch_size)
+
+    def _load_batches(self, session, name, query, batches, unmatched=None):
+        # With unmatched, query returns the keys of the rows it matched (see edge_batch_query),
+        # and the keys of the other rows are added to unmatched
+        start = time.time()
+        rows = 0
+        summaries = []
+        for i, batch in enumerate(batches, 1):
+            if unmatched is None:
+                summaries.append(session.write_transaction(self._write_batch, query, batch))
+            else:
+                summary, matched = session.write_transaction(self._write_matched, query, batch)
+                summaries.append(summary)
+                unmatched.extend(row[-1] for row in batch if row[-1] not in matched)
+            rows += len(batch)
+            if i % PROGRESS_EVERY == 0:
+                print("%s: %d rows sent (%.0f rows/s)" % (name, rows, rows / (time.time() - start)))
+        elapsed = time.time() - start
+        if rows:
+            print("%s loaded: %d rows in %.1fs (%.0f rows/s)" % (name, rows, elapsed, rows / elapsed))
+        else:
+            print("%s: no rows" % name)
+        self.metrics.record(name, elapsed, summaries, rows)
+        return rows
 
     @staticmethod
-    def _clean_db(tx):
-        query = ("MATCH (n) DETACH DELETE n;")
-        tx.run(query)
-        print("Database emptied")
+    def _write_batch(tx, query, rows):
+        return tx.run(query, rows=rows).consume()
 
-    def load_nodes(self):
+    @staticmethod
+    def _write_matched(tx, query, rows):
+        result = tx.run(query, rows=rows)
+        matched = {record["key"] for record in result}
+        return result.consume(), matched
+
+    def _step(self, session, name, tx_function, *args, filename=None):
+        self.metrics.count(filename)
+        start = time.time()
+        summary = session.write_transaction(tx_function, *args)
+        self.metrics.record(name, time.time() - start, [summary], filename=filename)
+        return summary
+
+    def load_incremental(self, import_dir, manifest_path=MANIFEST, batch_size=BATCH_SIZE):
+        # Applies only the rows that changed since the last incremental load; the first run
+        # against an empty manifest merges everything. The manifest is only updated once all
+        # changes are in the database, so an interrupted refresh can simply be run again.
+        # Returns the changed keys of every edge file, or None for files loaded in full.
+        manifest = Manifest(manifest_path)
+        changed = {}
+        try:
+            with self.driver.session() as session:
+                for label in INDEXES:
+                    self._run_query(session, label + " index", index_query(label))
+                for filename, label, properties in NODES:
+                    key_index = list(properties).index(INDEXES[label][0])
+                    rows = iter_rows(os.path.join(import_dir, filename), list(properties.values()))
+                    manifest.stage(filename, keyed_rows(rows, key_index, property_types(label, properties)[key_index]),
+                                   [key_index])
+                    self._load_batches(session, label + " upserts", node_merge_query(label, properties),
+                                       convert_batches(manifest.upserts(filename, batch_size),
+                                                       property_types(label, properties)))
+                for filename, rel_type, start, end in EDGES:
+                    manifest.stage(filename, edge_rows(os.path.join(import_dir, filename), [start[2], end[2]]), [0, 1])
+                    changed[filename] = set(manifest.changed_keys(filename)) if manifest.has_applied(filename) else None
+                    types = key_types(start, end)
+                    # Rows with an endpoint that is not loaded are not recorded as applied
+                    unmatched = []
+                    self._load_batches(session, "%s (%s) upserts" % (rel_type, filename),
+                                       edge_batch_query(rel_type, start, end, "MERGE", return_key=True),
+                                       convert_batches(manifest.upserts(filename, batch_size, with_key=True),
+                                                       types + [None]),
+                                       unmatched)
+                    if unmatched:
+                        print("%s: %d rows without both endpoints, kept for the next load" % (filename, len(unmatched)))
+                        manifest.unstage(filename, unmatched)
+                    self._load_batches(session, "%s (%s) deletes" % (rel_type, filename),
+                                       edge_delete_query(rel_type, start, end),
+                                       convert_batches(manifest.deletes(filename, batch_size), types))
+                for filename, label, properties in NODES:
+                    self._load_batches(session, label + " deletes", node_delete_query(label),
+                                       convert_batches(manifest.deletes(filename, batch_size),
+                                                       property_types(label, [INDEXES[label][0]])))
+
+                wrote, published_in = changed["wrote.csv"], changed["published_in_edition.csv"]
+                if wrote is None or published_in is None:
+                    self._materialize_author_published_in_edition(session, None, batch_size)
+                else:
+                    authors = {author for author, paper in wrote}
+                    authors.update(self._authors_of_papers(session, {paper for paper, edition in published_in}, batch_size))
+                    self._materialize_author_published_in_edition(session, authors, batch_size)
+                self._refresh_citation_stats(session, changed, batch_size)
+
+            for filename in [node[0] for node in NODES] + [edge[0] for edge in EDGES]:
+                manifest.commit(filename)
+        finally:
+            manifest.close()
+        self.bump_epoch()
+        return changed
+
+    def load_author_published_in_edition(self, author_ids=None, batch_size=BATCH_SIZE):
+        with self.driver.session() as session:
+            self._materialize_author_published_in_edition(session, author_ids, batch_size)
+        self.bump_epoch()
+
+    def _materialize_author_published_in_edition(self, session, author_ids, batch_size):
+        # Keeps one (author)-[:Published_in {papers}]->(edition) edge per pair. Each batch of
+        # authors drops and recomputes its own edges, so refreshing a few authors only touches them.
+        if author_ids is None:
+            batches = self._id_batches(session, "Author", batch_size)
+        else:
+            batches = batched(sorted(author_ids), batch_size)
+        query = (
+            "UNWIND $rows AS id "
+            "MATCH (a:Author {id: id}) "
+            "OPTIONAL MATCH (a)-[old:Published_in]->(:Edition) "
+            "DELETE old "
+            "WITH DISTINCT a "
+            "MATCH (a)-[:Wrote]->(p:Paper)-[:Published_in]->(e:Edition) "
+            "WITH a, e, count(DISTINCT p) AS papers "
+            "CREATE (a)-[:Published_in {papers: papers}]->(e);"
+            )
+        self._load_batches(session, "Edge (author)-[PUBLISHED_IN]->(edition) for authors", query, batches)
+
+    def load_citation_stats(self, paper_ids=None, author_ids=None, journal_ids=None, batch_size=BATCH_SIZE):
+        # Stores the citation counts on the papers, then the aggregates of their authors and the
+        # impact factors of their journals. None recomputes every paper, author or journal; the
+        # B queries read these properties.
         with self.driver.session() as session:
-            session.write_transaction(self._load_authors)
-            session.write_transaction(self._load_editions)
-            session.write_transaction(self._load_journals)
-            session.write_transaction(self._load_keywords)
-            session.write_transaction(self._load_papers)
-            session.write_transaction(self._load_conferences)
-            session.write_transaction(self._load_volumes)
-            session.write_transaction(self._load_years)
+            self._materialize_paper_citations(session, paper_ids, batch_size)
+            self._materialize_author_citations(session, author_ids, batch_size)
+            self._materialize_journal_years(session, journal_ids, batch_size)
+        self.bump_epoch()
+
+    def _refresh_citation_stats(self, session, changed, batch_size):
+        # Recomputes the papers whose citations or citing years changed, the authors of those
+        # papers and the journals of those papers or of changed volumes. Citing years come from
+        # the citing paper's edition or volume, so a changed edition or volume year, or any
+        # file loaded in full, recomputes everything.
+        if (any(changed[filename] is None for filename in CITATION_FILES + ["has_volume.csv"])
+                or changed["happened_in.csv"] or changed["volume_published_in_year.csv"]):
+            self._materialize_paper_citations(session, None, batch_size)
+            self._materialize_author_citations(session, None, batch_size)
+            self._materialize_journal_years(session, None, batch_size)
+            return
+        papers = {reference for paper, reference in changed["cites.csv"]}
+        moved = {paper for paper, edition in changed["published_in_edition.csv"]}
+        moved.update(paper for volume, paper in changed["contains.csv"])
+        papers.update(self._references_of_papers(session, moved, batch_size))
+        self._materialize_paper_citations(session, papers, batch_size)
+        authors = {author for author, paper in changed["wrote.csv"]}
+        authors.update(self._authors_of_papers(session, papers, batch_size))
+        self._materialize_author_citations(session, authors, batch_size)
+        journals = {journal for journal, volume in changed["has_volume.csv"]}
+        journals.update(self._journals_of_volumes(session, {volume for volume, paper in changed["contains.csv"]},
+                                                  batch_size))
+        journals.update(self._journals_of_papers(session, papers, batch_size))
+        self._materialize_journal_years(session, journals, batch_size)
+
+    def _materialize_paper_citations(self, session, paper_ids, batch_size):
+        # p.citations is the number of citing papers; p.citation_years and p.citations_per_year
+        # are the years those papers were published in and the count for each year, by year.
+        # A citing paper counts in a single year: that of its edition, else that of its volume.
+        if paper_ids is None:
+            batches = self._id_batches(session, "Paper", batch_size)
+        else:
+            batches = batched(sorted(paper_ids), batch_size)
+        query = (
+            "UNWIND $rows AS id "
+            "MATCH (p:Paper {id: id}) "
+            "OPTIONAL MATCH (citing:Paper)-[:Cites]->(p) "
+            "OPTIONAL MATCH (citing)-[:Published_in]->(:Edition)-[:Happened_in]->(edition_year:Year) "
+            "OPTIONAL MATCH (citing)<-[:Contains]-(:Volume)-[:Published_in]->(volume_year:Year) "
+            "WITH p, citing, coalesce(min(edition_year.year), min(volume_year.year)) AS year "
+            "WITH p, year, count(citing) AS citations "
+            "ORDER BY year "
+            "WITH p, sum(citations) AS total, "
+            "collect(CASE WHEN year IS NOT NULL AND citations > 0 THEN [year, citations] END) AS per_year "
+            "SET p.citations = total, "
+            "p.citation_years = [pair IN per_year | pair[0]], "
+            "p.citations_per_year = [pair IN per_year | pair[1]];"
+            )
+        self._load_batches(session, "Citation counts of papers", query, batches)
+
+    def _materialize_author_citations(self, session, author_ids, batch_size):
+        # a.papers, a.citations (sum over the papers) and a.h_index from the stored paper counts
+        if author_ids is None:
+            batches = self._id_batches(session, "Author", batch_size)
+        else:
+            batches = batched(sorted(author_ids), batch_size)
+        query = (
+            "UNWIND $rows AS id "
+            "MATCH (a:Author {id: id}) "
+            "OPTIONAL MATCH (a)-[:Wrote]->(p:Paper) "
+            "WITH DISTINCT a, p "
+            "WITH a, p, coalesce(p.citations, 0) AS citations "
+            "ORDER BY citations DESC "
+            "WITH a, count(p) AS papers, collect(CASE WHEN p IS NOT NULL THEN citations END) AS counts "
+            "SET a.papers = papers, "
+            "a.citations = reduce(total = 0, c IN counts | total + c), "
+            "a.h_index = size([i IN range(1, size(counts)) WHERE counts[i - 1] >= i]);"
+            )
+        self._load_batches(session, "Citation statistics of authors", query, batches)
+
+    def _materialize_journal_years(self, session, journal_ids, batch_size):
+        # Keeps one (journal)-[:Has_year]->(:JournalYear) node per volume year and the two years
+        # after it, holding the papers of that year, the citations they received per citing year
+        # and the impact factor of the year (see sdm.impact). It is computed from the counts
+        # stored on the papers in one pass over them, without matching a single citation.
+        if journal_ids is None:
+            batches = self._id_batches(session, "Journal", batch_size)
+        else:
+            batches = batched(sorted(journal_ids), batch_size)
+        query = (
+            "UNWIND $rows AS row "
+            "MATCH (j:Journal {id: row[0]}) "
+            "OPTIONAL MATCH (j)-[:Has_year]->(old:JournalYear) "
+            "DETACH DELETE old "
+            "WITH DISTINCT j, row "
+            "UNWIND row[1] AS stats "
+            "CREATE (j)-[:Has_year]->(:JournalYear {year: stats[0], papers: stats[1], citation_years: stats[2], "
+            "citations_per_year: stats[3], impact_factor: stats[4]});"
+            )
+        rows = (self._journal_year_rows(session, ids) for ids in batches)
+        self._load_batches(session, "Impact factors of journals", query, rows)
+
+    def _journal_year_rows(self, session, journal_ids):
+        # Journals without papers still get a row, so their old statistics are dropped
+        rows = journal_year_rows(session.read_transaction(self._read_journal_papers, journal_ids))
+        found = {row[0] for row in rows}
+        return rows + [[journal, []] for journal in journal_ids if journal not in found]
+
+    @staticmethod
+    def _read_journal_papers(tx, journal_ids):
+        query = (
+            "UNWIND $ids AS id "
+            "MATCH (j:Journal {id: id})-[:Has]->(v:Volume)-[:Published_in]->(y:Year) "
+            "MATCH (v)-[:Contains]->(p:Paper) "
+            "WITH DISTINCT j, y, p "
+            "RETURN j.id AS journal, y.year AS year, p.citation_years AS citation_years, "
+            "p.citations_per_year AS citations_per_year"
+            )
+        return [tuple(row.values()) for row in tx.run(query, ids=journal_ids)]
+
+    def _id_batches(self, session, label, batch_size):
+        # Pages through the ids of a label in index order, so no id list is held in full
+        query = "MATCH (n:%s) WHERE n.id > $after RETURN n.id AS id ORDER BY id LIMIT $limit" % label
+        for rows in self.pages(query, batch_size, session=session):
+            yield [row[0] for row in rows]
+
+    def _authors_of_papers(self, session, paper_ids, batch_size):
+        return self._related_ids(session, paper_ids, batch_size, (
+            "UNWIND $ids AS id "
+            "MATCH (:Paper {id: id})<-[:Wrote]-(a:Author) "
+            "RETURN DISTINCT a.id AS id"))
+
+    def _references_of_papers(self, session, paper_ids, batch_size):
+        return self._related_ids(session, paper_ids, batch_size, (
+            "UNWIND $ids AS id "
+            "MATCH (:Paper {id: id})-[:Cites]->(reference:Paper) "
+            "RETURN DISTINCT reference.id AS id"))
+
+    def _journals_of_papers(self, session, paper_ids, batch_size):
+        return self._related_ids(session, paper_ids, batch_size, (
+            "UNWIND $ids AS id "
+            "MATCH (:Paper {id: id})<-[:Contains]-(:Volume)<-[:Has]-(j:Journal) "
+            "RETURN DISTINCT j.id AS id"))
+
+    def _journals_of_volumes(self, session, volume_ids, batch_size):
+        return self._related_ids(session, volume_ids, batch_size, (
+            "UNWIND $ids AS id "
+            "MATCH (:Volume {id: id})<-[:Has]-(j:Journal) "
+            "RETURN DISTINCT j.id AS id"))
+
+    def _related_ids(self, session, ids, batch_size, query):
+        related = set()
+        for batch in batched(sorted(ids), batch_size):
+            related.update(session.read_transaction(self._read_ids, query, batch))
+        return related
+
+    @staticmethod
+    def _read_ids(tx, query, ids):
+        return [row["id"] for row in tx.run(query, ids=ids)]
+
+    def load_parallel(self, workers=WORKERS, import_dir=None, batch_size=BATCH_SIZE):
+        # Loads nodes, indexes and edges as a dependency graph on a pool of sessions.
+        # Uses LOAD CSV unless import_dir is given, in which case rows are sent in batches.
+        run_dag(self._load_steps(import_dir, batch_size), workers)
+        self.bump_epoch()
+
+    def _load_steps(self, import_dir, batch_size):
+        steps = []
+        for filename, label, properties in NODES:
+            if import_dir is None:
+                work = self._session_work(self._run_query, label + " nodes",
+                                          node_load_csv_query(filename, label, properties), filename)
+            else:
+                batches = read_batches(os.path.join(import_dir, filename), list(properties.values()), batch_size,
+                                       property_types(label, properties))
+                work = self._session_work(self._load_batches, label + " nodes", node_batch_query(label, properties), batches)
+            steps.append(Step("load " + label, work, (), frozenset()))
+            work = self._session_work(self._run_query, label + " index", index_query(label))
+            steps.append(Step("index " + label, work, ("load " + label,), frozenset([label])))
+
+        edge_steps = {}
+        for filename, rel_type, start, end in EDGES:
+            if import_dir is None:
+                work = self._session_work(self._run_query, "%s (%s)" % (rel_type, filename),
+                                          edge_load_csv_query(filename, rel_type, start, end), filename)
+            else:
+                batches = read_batches(os.path.join(import_dir, filename), [start[2], end[2]], batch_size,
+                                       key_types(start, end))
+                work = self._session_work(self._load_batches, "%s (%s)" % (rel_type, filename),
+                                          edge_batch_query(rel_type, start, end), batches)
+            edge_steps[filename] = Step("edges " + filename, work, ("index " + start[0], "index " + end[0]),
+                                        frozenset([start[0], end[0]]))
+        steps.extend(edge_steps.values())
+
+        steps.append(Step("edges Author-Published_in->Edition",
+                          self._session_work(self._materialize_author_published_in_edition, None, batch_size),
+                          (edge_steps["wrote.csv"].name, edge_steps["published_in_edition.csv"].name),
+                          frozenset(["Author", "Edition"])))
+        paper_citations = Step("citation counts of papers",
+                               self._session_work(self._materialize_paper_citations, None, batch_size),
+                               tuple(edge_steps[filename].name for filename in CITATION_FILES if filename != "wrote.csv"),
+                               frozenset(["Paper"]))
+        steps.append(paper_citations)
+        steps.append(Step("citation statistics of authors",
+                          self._session_work(self._materialize_author_citations, None, batch_size),
+                          (paper_citations.name, edge_steps["wrote.csv"].name),
+                          frozenset(["Author"])))
+        steps.append(Step("impact factors of journals",
+                          self._session_work(self._materialize_journal_years, None, batch_size),
+                          (paper_citations.name, edge_steps["has_volume.csv"].name),
+                          frozenset(["Journal"])))
+        return steps
+
+    def _session_work(self, fn, *args):
+        def work():
+            with self.driver.session() as session:
+                fn(session, *args)
+        return work
+
+    def _run_query(self, session, name, query, filename=None):
+        self._step(session, name, self._write_query, query, filename=filename)
+
+    @staticmethod
+    def _write_query(tx, query):
+        return tx.run(query).consume()
 
     @staticmethod
     def _load_authors(tx):
@@ -46,17 +576,19 @@ class App:
             "LOAD CSV WITH HEADERS FROM 'file:///authors.csv' AS row "
             "CREATE (:Author {id: row._id, name: row.name});"
             )
-        tx.run(query)
+        summary = tx.run(query).consume()
         print("Authors loaded")
+        return summary
 
     @staticmethod
     def _load_editions(tx):
         query = (
             "LOAD CSV WITH HEADERS FROM 'file:///editions.csv' AS row "
-            "CREATE (:Edition {id: row._id, name: row.name, number: row.number, city: row.city});"
+            "CREATE (:Edition {id: row._id, name: row.name, number: toInteger(row.number), city: row.city});"
             )
-        tx.run(query)
+        summary = tx.run(query).consume()
         print("Editions loaded")
+        return summary
 
     @staticmethod
     def _load_journals(tx):
@@ -64,8 +596,9 @@ class App:
             "LOAD CSV WITH HEADERS FROM 'file:///journals.csv' AS row "
             "CREATE (:Journal {id: row._id, name: row.name});"
             )
-        tx.run(query)
+        summary = tx.run(query).consume()
         print("Journals loaded")
+        return summary
 
     @staticmethod
     def _load_keywords(tx):
@@ -73,17 +606,20 @@ class App:
             "LOAD CSV WITH HEADERS FROM 'file:///keywords.csv' AS row "
             "CREATE (:Keyword {id: row._id, keyword: row.keyword});"
             )
-        tx.run(query)
+        summary = tx.run(query).consume()
         print("Keywords loaded")
+        return summary
 
     @staticmethod
     def _load_papers(tx):
         query = (
             "LOAD CSV WITH HEADERS FROM 'file:///papers.csv' AS row "
-            "CREATE (:Paper {id: row._id, title: row.title, language: row.lang, isbn: row.isbn, abstract: row.abstract});"
+            "CREATE (:Paper {id: row._id, title: row.title, language: row.lang, "
+            "isbn: replace(replace(toUpper(row.isbn), '-', ''), ' ', ''), abstract: row.abstract});"
             )
-        tx.run(query)
+        summary = tx.run(query).consume()
         print("Papers loaded")
+        return summary
 
     @staticmethod
     def _load_conferences(tx):
@@ -91,8 +627,9 @@ class App:
             "LOAD CSV WITH HEADERS FROM 'file:///conferences.csv' AS row "
             "CREATE (:Conference {id: row._id, name: row.name});"
             )
-        tx.run(query)
+        summary = tx.run(query).consume()
         print("Conferences loaded")
+        return summary
 
     @staticmethod
     def _load_volumes(tx):
@@ -100,93 +637,42 @@ class App:
             "LOAD CSV WITH HEADERS FROM 'file:///volumes.csv' AS row "
             "CREATE (:Volume {id: row._id, title: row.title});"
             )
-        tx.run(query)
+        summary = tx.run(query).consume()
         print("Volumes loaded")
+        return summary
         
     @staticmethod
     def _load_years(tx):
         query = (
             "LOAD CSV WITH HEADERS FROM 'file:///years.csv' AS row "
-            "CREATE (:Year {year: row.year});"
+            "CREATE (:Year {year: toInteger(row.year)});"
             )
-        tx.run(query)
+        summary = tx.run(query).consume()
         print("Years loaded")
+        return summary
 
     def create_indexes(self):
+        # IF NOT EXISTS, so a rerun against a wiped database that kept its schema goes through
         with self.driver.session() as session:
-            session.write_transaction(self._create_index_authorid)
-            session.write_transaction(self._create_index_editionid)
-            session.write_transaction(self._create_index_journalid)
-            session.write_transaction(self._create_index_keywordid)
-            session.write_transaction(self._create_index_paperid)
-            session.write_transaction(self._create_index_conferenceid)
-            session.write_transaction(self._create_index_volumeid)
-            session.write_transaction(self._create_index_year)
-
-    @staticmethod
-    def _create_index_authorid(tx):
-        query = ("CREATE INDEX authorid_index FOR (n:Author) ON (n.id)")
-        tx.run(query)
-        print("Created index on Author.id")
-    
-    @staticmethod
-    def _create_index_editionid(tx):
-        query = ("CREATE INDEX editionid_index FOR (n:Edition) ON (n.id)")
-        tx.run(query)
-        print("Created index on Edition.id")
-
-    @staticmethod
-    def _create_index_journalid(tx):
-        query = ("CREATE INDEX journalid_index FOR (n:Journal) ON (n.id)")
-        tx.run(query)
-        print("Created index on Journal.id")
-
-    @staticmethod
-    def _create_index_keywordid(tx):
-        query = ("CREATE INDEX keywordid_index FOR (n:Keyword) ON (n.id)")
-        tx.run(query)
-        print("Created index on Keyword.id")
-
-    @staticmethod
-    def _create_index_paperid(tx):
-        query = ("CREATE INDEX paperid_index FOR (n:Paper) ON (n.id)")
-        tx.run(query)
-        print("Created index on Paper.id")
-
-    @staticmethod
-    def _create_index_conferenceid(tx):
-        query = ("CREATE INDEX conferenceid_index FOR (n:Conference) ON (n.id)")
-        tx.run(query)
-        print("Created index on Conference.id")
-
-    @staticmethod
-    def _create_index_volumeid(tx):
-        query = ("CREATE INDEX volumeid_index FOR (n:Volume) ON (n.id)")
-        tx.run(query)
-        print("Created index on Volume.id")
-
-    @staticmethod
-    def _create_index_year(tx):
-        query = ("CREATE INDEX year_index FOR (n:Year) ON (n.year)")
-        tx.run(query)
-        print("Created index on Year.year")
-
+            for label, (key, _) in INDEXES.items():
+                self._run_query(session, label + " index", index_query(label))
+                print("Created index on %s.%s" % (label, key))
 
     def load_edges(self):
         with self.driver.session() as session:
-            session.write_transaction(self._load_author_wrote_paper)
-            session.write_transaction(self._load_author_reviewed_paper)
-            session.write_transaction(self._load_author_corresponding_paper)
-            session.write_transaction(self._load_paper_has_keywords)
-            session.write_transaction(self._load_paper_cites_paper)
-            session.write_transaction(self._load_conference_has_edition)
-            session.write_transaction(self._load_edition_happened_in_year)
-            session.write_transaction(self._load_volume_published_in_year)
-            session.write_transaction(self._load_volume_contains_paper)
-            session.write_transaction(self._load_journal_has_volume)
-            session.write_transaction(self._load_paper_published_in_edition)
-            session.write_transaction(self._load_author_published_in_edition)
-            
+            self._step(session, "Wrote (wrote.csv)", self._load_author_wrote_paper, filename="wrote.csv")
+            self._step(session, "Reviewed (reviewed.csv)", self._load_author_reviewed_paper, filename="reviewed.csv")
+            self._step(session, "Corresponding (corresponding.csv)", self._load_author_corresponding_paper, filename="corresponding.csv")
+            self._step(session, "Has (has_keyword.csv)", self._load_paper_has_keywords, filename="has_keyword.csv")
+            self._step(session, "Cites (cites.csv)", self._load_paper_cites_paper, filename="cites.csv")
+            self._step(session, "Has (has_edition.csv)", self._load_conference_has_edition, filename="has_edition.csv")
+            self._step(session, "Happened_in (happened_in.csv)", self._load_edition_happened_in_year, filename="happened_in.csv")
+            self._step(session, "Published_in (volume_published_in_year.csv)", self._load_volume_published_in_year, filename="volume_published_in_year.csv")
+            self._step(session, "Contains (contains.csv)", self._load_volume_contains_paper, filename="contains.csv")
+            self._step(session, "Has (has_volume.csv)", self._load_journal_has_volume, filename="has_volume.csv")
+            self._step(session, "Published_in (published_in_edition.csv)", self._load_paper_published_in_edition, filename="published_in_edition.csv")
+        self.load_author_published_in_edition()
+        self.load_citation_stats()
 
     @staticmethod
     def _load_author_wrote_paper(tx):
@@ -196,8 +682,9 @@ class App:
             "MATCH (p:Paper {id: row.paperid}) "
             "CREATE (a)-[:Wrote]->(p);"
             )
-        tx.run(query)
+        summary = tx.run(query).consume()
         print("Edge (author)-[WROTE]->(paper) loaded")
+        return summary
     
     @staticmethod
     def _load_author_reviewed_paper(tx):
@@ -207,8 +694,9 @@ class App:
             "MATCH (p:Paper {id: row.paperid}) "
             "CREATE (a)-[:Reviewed]->(p);"
             )
-        tx.run(query)
+        summary = tx.run(query).consume()
         print("Edge (author)-[REVIEWED]->(paper) loaded")
+        return summary
 
     @staticmethod
     def _load_author_corresponding_paper(tx):
@@ -218,17 +706,9 @@ class App:
             "MATCH (p:Paper {id: row.paperid}) "
             "CREATE (a)-[:Corresponding]->(p);"
             )
-        tx.run(query)
+        summary = tx.run(query).consume()
         print("Edge (author)-[CORRESPONDING]->(paper) loaded")
-
-    @staticmethod
-    def _load_author_published_in_edition(tx):
-        query = (
-            "MATCH (a:Author)-[:Wrote]->(p:Paper)-[:Published_in]->(e:Edition)"
-            "CREATE (a)-[:Published_in]->(e)"
-            )
-        tx.run(query)
-        print("Edge (author)-[PUBLISHED_IN]->(edition) loaded")
+        return summary
 
     @staticmethod
     def _load_paper_has_keywords(tx):
@@ -238,8 +718,9 @@ class App:
             "MATCH (k:Keyword {id: row.keywordid}) "
             "CREATE (p)-[:Has]->(k);"
             )
-        tx.run(query)
+        summary = tx.run(query).consume()
         print("Edge (paper)-[HAS]->(keyword) loaded")
+        return summary
 
     @staticmethod
     def _load_paper_cites_paper(tx):
@@ -249,8 +730,9 @@ class App:
             "MATCH (p2:Paper {id: row.referenceid}) "
             "CREATE (p1)-[:Cites]->(p2);"
             )
-        tx.run(query)
+        summary = tx.run(query).consume()
         print("Edge (paper)-[CITES]->(paper) loaded")
+        return summary
 
     @staticmethod
     def _load_conference_has_edition(tx):
@@ -260,30 +742,33 @@ class App:
             "MATCH (e:Edition {id: row.editionid}) "
             "CREATE (c)-[:Has]->(e);"
             )
-        tx.run(query)
+        summary = tx.run(query).consume()
         print("Edge (conference)-[HAS]->(edition) loaded")
+        return summary
 
     @staticmethod
     def _load_edition_happened_in_year(tx):
         query = (
             "LOAD CSV WITH HEADERS FROM 'file:///happened_in.csv' AS row "
             "MATCH (e:Edition {id: row.editionid}) " 
-            "MATCH (y:Year {year: row.year}) "
+            "MATCH (y:Year {year: toInteger(row.year)}) "
             "CREATE (e)-[:Happened_in]->(y);"
             )
-        tx.run(query)
+        summary = tx.run(query).consume()
         print("Edge (edition)-[HAPPENED_IN]->(year) loaded")
+        return summary
 
     @staticmethod
     def _load_volume_published_in_year(tx):
         query = (
             "LOAD CSV WITH HEADERS FROM 'file:///volume_published_in_year.csv' AS row "
             "MATCH (v:Volume {id: row.volumeid}) "
-            "MATCH (y:Year {year: row.year}) "
+            "MATCH (y:Year {year: toInteger(row.year)}) "
             "CREATE (v)-[:Published_in]->(y);"
             )
-        tx.run(query)
+        summary = tx.run(query).consume()
         print("Edge (volume)-[PUBLISHED_IN]->(year) loaded")
+        return summary
 
     @staticmethod
     def _load_volume_contains_paper(tx):
@@ -293,8 +778,9 @@ class App:
             "MATCH (p:Paper {id: row.paperid}) "
             "CREATE (v)-[:Contains]->(p);"
             )
-        tx.run(query)
+        summary = tx.run(query).consume()
         print("Edge (volume)-[CONTAINS]->(paper) loaded")
+        return summary
 
     @staticmethod
     def _load_journal_has_volume(tx):
@@ -304,8 +790,9 @@ class App:
             "MATCH (v:Volume {id: row.volumeid}) "
             "CREATE (j)-[:Has]->(v);"
             )
-        tx.run(query)
+        summary = tx.run(query).consume()
         print("Edge (joural)-[HAS]->(volume) loaded")
+        return summary
 
     @staticmethod
     def _load_paper_published_in_edition(tx):
@@ -315,18 +802,57 @@ class App:
             "MATCH (e:Edition {id: row.editionid}) "
             "CREATE (p)-[:Published_in]->(e);"
             )
-        tx.run(query)
+        summary = tx.run(query).consume()
         print("Edge (paper)-[PUBLISHED_IN]->(year) loaded")
+        return summary
+
+
+def add_load_arguments(parser):
+    parser.add_argument("--batched", action="store_true",
+                        help="stream the CSVs from this machine in UNWIND batches instead of LOAD CSV")
+    parser.add_argument("--import-dir", default=".", help="local directory holding the CSV files")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--wipe", choices=["transaction", "batched", "recreate"], default="transaction",
+                        help="how clean_db empties the database: one transaction, bounded batches, "
+                             "or CREATE OR REPLACE DATABASE falling back to batches")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only apply the rows that changed since the last incremental load (no clean_db)")
+    parser.add_argument("--manifest", default=MANIFEST, help="state file of the incremental loads")
+    parser.add_argument("--parallel", action="store_true",
+                        help="run independent node, index and edge steps concurrently")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+
+
+def run_load(app, args):
+    if args.incremental:
+        app.load_incremental(args.import_dir, args.manifest, args.batch_size)
+        return
+    if args.wipe == "transaction":
+        app.clean_db()
+    elif args.wipe == "batched" or not app.recreate_db():
+        app.clean_db_batched(args.batch_size, args.workers)
+    if args.parallel:
+        app.load_parallel(args.workers, args.import_dir if args.batched else None, args.batch_size)
+    elif args.batched:
+        app.load_nodes_batched(args.import_dir, args.batch_size)
+        app.create_indexes()
+        app.load_edges_batched(args.import_dir, args.batch_size)
+    else:
+        app.load_nodes()
+        app.create_indexes()
+        app.load_edges()
 
 
 if __name__ == "__main__":
-    bolt_url = "bolt://localhost:7687"
-    user = "neo4j"
-    password = "sdm123"
+    parser = argparse.ArgumentParser()
+    add_load_arguments(parser)
+    parser.add_argument("--metrics-jsonl", help="append one JSON line per finished step to this file")
+    parser.add_argument("--metrics-prom", help="write the step metrics in Prometheus text format to this file")
+    args = parser.parse_args()
+
     App.enable_log(logging.INFO, sys.stdout)
-    app = App(bolt_url, user, password)
-    app.clean_db()
-    app.load_nodes()
-    app.create_indexes()
-    app.load_edges()
-    app.close()
\ No newline at end of file
+    metrics = LoadMetrics(args.metrics_jsonl, args.metrics_prom, args.import_dir)
+    app = App(metrics=metrics)
+    run_load(app, args)
+    metrics.report()
+    app.close()
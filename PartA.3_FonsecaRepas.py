@@ -1,81 +1,96 @@
+import argparse
 import logging
 import sys
+import time
 
-from neo4j import GraphDatabase
+from sdm.app import BaseApp
+from sdm.metrics import LoadMetrics
 
-class App:
+REVIEWS_QUERY = (
+    "LOAD CSV WITH HEADERS FROM 'file:///reviewed_v2.csv' AS row "
+    "MATCH (:Author {id: row.authorid})-[r:Reviewed]->(:Paper {id: row.paperid}) "
+    "SET r.content = row.review, r.decision = row.suggested_decision;"
+)
 
-    def __init__(self, uri, user, password):
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
+AFFILIATIONS_QUERY = (
+    "LOAD CSV WITH HEADERS FROM 'file:///affiliation.csv' AS row "
+    "CREATE (:Affiliation {id: row._id, name: row.name});"
+)
 
-    def close(self):
-        # Don't forget to close the driver connection when you are finished with it
-        self.driver.close()
+AFFILIATION_INDEX_QUERY = "CREATE INDEX affiliationid_index IF NOT EXISTS FOR (n:Affiliation) ON (n.id)"
 
-    @staticmethod
-    def enable_log(level, output_stream):
-        handler = logging.StreamHandler(output_stream)
-        handler.setLevel(level)
-        logging.getLogger("neo4j").addHandler(handler)
-        logging.getLogger("neo4j").setLevel(level)
+AFFILIATED_QUERY = (
+    "LOAD CSV WITH HEADERS FROM 'file:///affiliated.csv' AS row "
+    "MATCH (au:Author {id: row.authorid}) "
+    "MATCH (af:Affiliation {id: row.affiliationid}) "
+    "CREATE (au)-[:Affiliated]->(af);"
+)
+
+
+class App(BaseApp):
+
+    def __init__(self, uri=None, user=None, password=None, metrics=None, driver=None, bookmarks=None, config=None):
+        super().__init__(uri, user, password, driver, bookmarks=bookmarks, config=config)
+        self.metrics = metrics or LoadMetrics()
 
     def add_reviews(self):
         with self.driver.session() as session:
-            session.write_transaction(self._add_reviews)
+            self._step(session, "Reviewed (reviewed_v2.csv)", self._add_reviews, filename="reviewed_v2.csv")
+        self.bump_epoch()
 
     @staticmethod
     def _add_reviews(tx):
-        query = (
-            "LOAD CSV WITH HEADERS FROM 'file:///reviewed_v2.csv' AS row "
-            "MATCH (:Author {id: row.authorid})-[r:Reviewed]->(:Paper {id: row.paperid})"
-            "SET r.content = row.review, r.decision = row.suggested_decision;"
-        )
-        tx.run(query)
+        summary = tx.run(REVIEWS_QUERY).consume()
         print("Edge (author)-[REVIEWED]->(paper) updated")
+        return summary
 
     def add_affiliations(self):
         with self.driver.session() as session:
-            session.write_transaction(self._add_affiliations)
+            self._step(session, "Affiliation nodes", self._add_affiliations, filename="affiliation.csv")
 
         with self.driver.session() as session:
-            session.write_transaction(self._create_index_affiliationid)
+            self._step(session, "Affiliation index", self._create_index_affiliationid)
 
         with self.driver.session() as session:
-            session.write_transaction(self._add_affiliated)
+            self._step(session, "Affiliated (affiliated.csv)", self._add_affiliated, filename="affiliated.csv")
+        self.bump_epoch()
+
+    def _step(self, session, name, tx_function, filename=None):
+        self.metrics.count(filename)
+        start = time.time()
+        summary = session.write_transaction(tx_function)
+        self.metrics.record(name, time.time() - start, [summary], filename=filename)
 
     @staticmethod
     def _add_affiliations(tx):
-        query = (
-            "LOAD CSV WITH HEADERS FROM 'file:///affiliation.csv' AS row "
-            "CREATE (:Affiliation {id: row._id, name: row.name});"
-            )
-        tx.run(query)
+        summary = tx.run(AFFILIATIONS_QUERY).consume()
         print("Affiliations loaded")
+        return summary
 
     @staticmethod
     def _create_index_affiliationid(tx):
-        query = ("CREATE INDEX affiliationid_index FOR (n:Affiliation) ON (n.id)")
-        tx.run(query)
+        summary = tx.run(AFFILIATION_INDEX_QUERY).consume()
         print("Created index on Affiliation.id")
+        return summary
 
     @staticmethod
     def _add_affiliated(tx):
-        query = (
-            "LOAD CSV WITH HEADERS FROM 'file:///affiliated.csv' AS row "
-            "MATCH (au:Author {id: row.authorid})"
-            "MATCH (af:Affiliation {id: row.affiliationid})"
-            "CREATE (au)-[:Affiliated]->(af);"
-            )
-        tx.run(query)
+        summary = tx.run(AFFILIATED_QUERY).consume()
         print("Edge (author)-[AFFILIATED]->(affiliation) loaded")
+        return summary
 
 
 if __name__ == "__main__":
-    bolt_url = "bolt://localhost:11005"
-    user = "neo4j"
-    password = "sdm123"
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--import-dir", help="local copy of the CSV files, used to count the rows read")
+    parser.add_argument("--metrics-jsonl", help="append one JSON line per finished step to this file")
+    parser.add_argument("--metrics-prom", help="write the step metrics in Prometheus text format to this file")
+    args = parser.parse_args()
+
     App.enable_log(logging.INFO, sys.stdout)
-    app = App(bolt_url, user, password)
+    metrics = LoadMetrics(args.metrics_jsonl, args.metrics_prom, args.import_dir)
+    app = App(metrics=metrics)
     app.add_reviews()
     app.add_affiliations()
-    app.close()
\ No newline at end of file
+    metrics.report()
+    app.close()
@@ -1,49 +1,31 @@
 import logging
 import sys
+from collections import namedtuple
 
-from neo4j import GraphDatabase
-
-class App:
-
-    def __init__(self, uri, user, password):
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
-
-    def close(self):
-        # Don't forget to close the driver connection when you are finished with it
-        self.driver.close()
-
-    @staticmethod
-    def enable_log(level, output_stream):
-        handler = logging.StreamHandler(output_stream)
-        handler.setLevel(level)
-        logging.getLogger("neo4j").addHandler(handler)
-        logging.getLogger("neo4j").setLevel(level)
-
-    
-    def find_top3_papers_of_conference(self):
-        with self.driver.session() as session:
-            result = session.write_transaction(self._find_conference_communities)
-            print("\n Showing first 10 rows of the result \n")
-            for row in result[:10]:
-                print(row)
-
-    @staticmethod
-    def _find_top3_papers_of_conference(tx):
-        query = (
-            "MATCH (p:Paper)-[:Published_in]->(:Edition)<-[:Has]-(conference:Conference)"
-            "MATCH (:Paper)-[c:Cites]->(p:Paper)"
-            "WITH conference, p, COUNT(c) AS citations"
-            "ORDER BY citations DESC"
-            "RETURN conference, collect(p)[..3] as topThree"
-        )
-        result = tx.run(query)
-        return [{'conference': row['conference']['name'], 'top3': row['topThree']} for row in result]
+from sdm.app import BaseApp
+
+# p.citations is stored by the loader (PartA.2 load_citation_stats)
+TOP3_PAPERS_QUERY = (
+    "MATCH (p:Paper)-[:Published_in]->(:Edition)<-[:Has]-(conference:Conference) "
+    "WHERE p.citations > 0 "
+    "WITH conference, p "
+    "ORDER BY p.citations DESC "
+    "RETURN conference.name AS conference, collect(p.title)[..3] AS top3"
+)
+
+ConferenceTopPapers = namedtuple("ConferenceTopPapers", ["conference", "top3"])
+
+
+class App(BaseApp):
+
+    def find_top3_papers_of_conference(self, limit=10):
+        self.show(self.top3_papers_of_conference(limit), limit)
+
+    def top3_papers_of_conference(self, limit=None, skip=0):
+        return self.stream(TOP3_PAPERS_QUERY, ConferenceTopPapers, skip, limit)
 
 if __name__ == "__main__":
-    bolt_url = "bolt://localhost:7687"
-    user = "neo4j"
-    password = "sdm123"
     App.enable_log(logging.INFO, sys.stdout)
-    app = App(bolt_url, user, password)
-    app.find_conference_communities()
+    app = App()
+    app.find_top3_papers_of_conference()
     app.close()
@@ -1,52 +1,132 @@
+import argparse
 import logging
 import sys
+import time
+from collections import namedtuple
 
-from neo4j import GraphDatabase
+import numpy as np
 
-class App:
+from sdm.app import BaseApp
+from sdm.dataset import BATCH_SIZE, batched
+from sdm.hindex import CHUNK_SIZE, h_indexes, stream_h_indexes
+from sdm.snapshot import export_database, relationship_key
 
-    def __init__(self, uri, user, password):
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
+# a.h_index is stored by the loader (PartA.2 load_citation_stats)
+H_INDEX_QUERY = (
+    "MATCH (author:Author) "
+    "WHERE author.h_index > 0 "
+    "RETURN author.name AS author, author.h_index AS h_index "
+    "ORDER BY h_index DESC"
+)
 
-    def close(self):
-        # Don't forget to close the driver connection when you are finished with it
-        self.driver.close()
+# Computes every h-index on the server from the Cites relationships
+SERVER_H_INDEX_QUERY = (
+    "MATCH (:Paper)-[c:Cites]->(p:Paper)<-[:Wrote]-(author:Author) "
+    "WITH author, p, COUNT(c) AS citations "
+    "ORDER BY citations DESC "
+    "WITH author, collect(citations) AS paper_citations "
+    "UNWIND range(1, size(paper_citations)) AS i "
+    "WITH author, paper_citations[i - 1] AS citations, i "
+    "WHERE citations >= i "
+    "RETURN author.id AS author, max(i) AS h_index"
+)
 
-    @staticmethod
-    def enable_log(level, output_stream):
-        handler = logging.StreamHandler(output_stream)
-        handler.setLevel(level)
-        logging.getLogger("neo4j").addHandler(handler)
-        logging.getLogger("neo4j").setLevel(level)
-
-    
-    def find_top3_papers_of_conference(self):
+# (author, paper, citations) of one page of authors, by author id; authors without papers
+# come with a null paper
+AUTHOR_PAPERS_QUERY = (
+    "MATCH (a:Author) WHERE a.id > $after "
+    "WITH a ORDER BY a.id LIMIT $limit "
+    "OPTIONAL MATCH (a)-[:Wrote]->(p:Paper) "
+    "WITH DISTINCT a, p "
+    "RETURN a.id AS author, p.id AS paper, "
+    "coalesce(p.citations, 0) AS citations "
+    "ORDER BY author"
+)
+
+AuthorHIndex = namedtuple("AuthorHIndex", ["author", "h_index"])
+
+
+class App(BaseApp):
+
+    def find_h_indexes(self, limit=10):
+        self.show(self.h_indexes(limit), limit)
+
+    def h_indexes(self, limit=None, skip=0):
+        return self.stream(H_INDEX_QUERY, AuthorHIndex, skip, limit)
+
+    def server_h_indexes(self):
+        return self.stream(SERVER_H_INDEX_QUERY, AuthorHIndex)
+
+    def client_h_indexes(self, batch_size=BATCH_SIZE, chunk_size=CHUNK_SIZE):
+        # Streams every (author, paper, citations) row once, a page of authors at a time, and
+        # computes the h-indexes in vectorized chunks (sdm.hindex) instead of on the server
+        rows = self._author_paper_rows(batch_size)
+        return (AuthorHIndex(author, h_index) for author, h_index in stream_h_indexes(rows, chunk_size))
+
+    def snapshot_h_indexes(self, snapshot):
+        # The h-index of every author from a snapshot (sdm.snapshot) instead of the database
+        wrote = snapshot.matrix(relationship_key("Wrote", "Author", "Paper")).tocsr(copy=True)
+        wrote.sum_duplicates()
+        references = snapshot.adjacency(relationship_key("Cites", "Paper", "Paper"))[1]
+        citations = np.bincount(references, minlength=snapshot.count("Paper"))
+        authors, found = h_indexes(np.repeat(np.arange(wrote.shape[0]), np.diff(wrote.indptr)),
+                                   citations[wrote.indices])
+        result = np.zeros(wrote.shape[0], dtype=np.int64)
+        result[authors] = found
+        return (AuthorHIndex(author.decode("utf-8"), h_index)
+                for author, h_index in zip(snapshot.ids("Author").tolist(), result.tolist()))
+
+    def write_h_indexes(self, batch_size=BATCH_SIZE, chunk_size=CHUNK_SIZE, snapshot=None):
+        # A snapshot must be of the current graph epoch, or stale h-indexes would be written
+        # under a new epoch
+        epoch = self.graph_epoch() or "none"
+        if snapshot is not None and snapshot.epoch != epoch:
+            raise ValueError("Snapshot %s is of epoch %s, the graph is at epoch %s"
+                             % (snapshot.path, snapshot.epoch, epoch))
+        query = "UNWIND $rows AS row MATCH (a:Author {id: row[0]}) SET a.h_index = row[1];"
+        rows = self.snapshot_h_indexes(snapshot) if snapshot else self.client_h_indexes(batch_size, chunk_size)
         with self.driver.session() as session:
-            result = session.write_transaction(self._find_conference_communities)
-            print("\n Showing first 10 rows of the result \n")
-            for row in result[:10]:
-                print(row)
+            for rows in batched(rows, batch_size):
+                session.write_transaction(self._write_rows, query, [list(row) for row in rows])
+        self.bump_epoch()
+
+    def benchmark(self, batch_size=BATCH_SIZE, chunk_size=CHUNK_SIZE):
+        # Times the server-side query against the client-side computation on the loaded graph.
+        # Authors without cited papers are left out of the comparison, as the query skips them.
+        start = time.time()
+        server = {row.author: row.h_index for row in self.server_h_indexes()}
+        server_seconds = time.time() - start
+        start = time.time()
+        client = {row.author: row.h_index for row in self.client_h_indexes(batch_size, chunk_size) if row.h_index}
+        client_seconds = time.time() - start
+        print("server: %d authors in %.1fs" % (len(server), server_seconds))
+        print("client: %d authors in %.1fs" % (len(client), client_seconds))
+        print("results %s" % ("match" if client == server else "differ"))
+
+    def _author_paper_rows(self, batch_size):
+        for rows in self.pages(AUTHOR_PAPERS_QUERY, batch_size):
+            yield from rows
 
     @staticmethod
-    def _find_top3_papers_of_conference(tx):
-        query = (
-            "MATCH (:Paper)-[c:Cites]->(p:Paper)<-[:Wrote]-(author:Author)"
-            "WITH author, p, COUNT(c) AS citations"
-            "ORDER BY citations DESC"
-            "WITH author, collect({paper:p, citations:citations}) AS paper_citations"
-            "UNWIND range(1,size(paper_citations)) AS i"
-            "WITH author, paper_citations[i-1].citations AS citations, i"
-            "WHERE citations > i"
-            "RETURN author, max(i) AS h_index"
-        )
-        result = tx.run(query)
-        return [{'author': row['author']['name'], 'h_index': row['h_index']} for row in result]
+    def _write_rows(tx, query, rows):
+        return tx.run(query, rows=rows).consume()
 
 if __name__ == "__main__":
-    bolt_url = "bolt://localhost:7687"
-    user = "neo4j"
-    password = "sdm123"
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--write", action="store_true",
+                        help="compute every h-index client-side and store it on the authors")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="compare the server-side query with the client-side computation")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--snapshot", help="with --write, read the graph from the snapshot of the current epoch in "
+                                           "this directory, exporting it when there is none")
+    args = parser.parse_args()
+
     App.enable_log(logging.INFO, sys.stdout)
-    app = App(bolt_url, user, password)
-    app.find_conference_communities()
+    app = App()
+    if args.benchmark:
+        app.benchmark(args.batch_size)
+    elif args.write:
+        app.write_h_indexes(args.batch_size, snapshot=export_database(app, args.snapshot) if args.snapshot else None)
+    app.find_h_indexes()
     app.close()
@@ -1,54 +1,189 @@
+import argparse
 import logging
 import sys
+from collections import namedtuple
 
-from neo4j import GraphDatabase
+from neo4j import WRITE_ACCESS
 
-class App:
+from sdm.app import BaseApp
+from sdm.dataset import BATCH_SIZE
+from sdm.gds import ProjectionManager, native
+from sdm.similarity import SIMILARITY_CUTOFF, TOP_K, exact, keyword_matrix, minhash, similar_pairs
+from sdm.snapshot import export_database, relationship_key
 
-    def __init__(self, uri, user, password):
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
+PAPER_KEYWORDS = native(["Paper", "Keyword"], {"Has": {"type": "Has"}})
+ENGINES = {"exact": exact, "minhash": minhash}
 
-    def close(self):
-        # Don't forget to close the driver connection when you are finished with it
-        self.driver.close()
+SIMILARITY_QUERY = (
+    "CALL gds.nodeSimilarity.stream($graph, {topK: $top_k, similarityCutoff: $cutoff}) "
+    "YIELD node1, node2, similarity "
+    "RETURN gds.util.asNode(node1).title AS Paper1, gds.util.asNode(node2).title AS Paper2, similarity "
+    "ORDER BY similarity DESCENDING, Paper1, Paper2 "
+)
 
-    @staticmethod
-    def enable_log(level, output_stream):
-        handler = logging.StreamHandler(output_stream)
-        handler.setLevel(level)
-        logging.getLogger("neo4j").addHandler(handler)
-        logging.getLogger("neo4j").setLevel(level)
-
-    
-    def paper_similarity(self):
+# Top pairs and neighbours from the SIMILAR relationships written by write_similarity
+TOP_SIMILAR_QUERY = (
+    "MATCH (p1:Paper)-[s:SIMILAR]->(p2:Paper) "
+    "RETURN p1.title AS Paper1, p2.title AS Paper2, s.score AS similarity "
+    "ORDER BY similarity DESC, Paper1, Paper2"
+)
+
+# Whether nodeSimilarity.mutate already added SIMILAR to a projection, which it can only do once
+MUTATED_QUERY = (
+    "CALL gds.graph.list($graph) YIELD schema "
+    "RETURN 'SIMILAR' IN keys(schema.relationships) AS mutated"
+)
+
+SIMILAR_TO_QUERY = (
+    "MATCH (:Paper {id: $paper})-[s:SIMILAR]->(other:Paper) "
+    "RETURN other.id AS id, other.title AS title, s.score AS similarity "
+    "ORDER BY similarity DESC"
+)
+
+# A page of papers with their keywords, for the embedded engines of sdm.similarity
+PAPER_KEYWORDS_QUERY = (
+    "MATCH (p:Paper) WHERE p.id > $after "
+    "WITH p ORDER BY p.id LIMIT $limit "
+    "OPTIONAL MATCH (p)-[:Has]->(k:Keyword) "
+    "RETURN p.id AS id, p.title AS title, collect(k.id) AS keywords "
+    "ORDER BY id"
+)
+
+PaperSimilarity = namedtuple("PaperSimilarity", ["Paper1", "Paper2", "similarity"])
+SimilarPaper = namedtuple("SimilarPaper", ["id", "title", "similarity"])
+
+
+class App(BaseApp):
+
+    def paper_similarity(self, limit=10, top_k=TOP_K, cutoff=SIMILARITY_CUTOFF):
+        if not self.similarity_is_current(top_k, cutoff):
+            self.write_similarity(top_k, cutoff)
+        self.show(self.stream(TOP_SIMILAR_QUERY, PaperSimilarity, 0, limit), limit)
+
+    def similar_to(self, paper_id, limit=10):
+        # The papers most similar to paper_id, read from its SIMILAR relationships
+        return self.stream(SIMILAR_TO_QUERY, SimilarPaper, 0, limit, paper=paper_id)
+
+    def similar_papers(self, limit=None, skip=0, top_k=TOP_K, cutoff=SIMILARITY_CUTOFF):
+        # Streams the pairs from the projection without writing them, on the leader that holds
+        # it (see sdm.gds.ProjectionManager)
+        projections = ProjectionManager(self.driver, self.config["gds_heap_budget"])
+        graph = projections.ensure("paper_similarity", PAPER_KEYWORDS)
+        return self.stream(SIMILARITY_QUERY, PaperSimilarity, skip, limit, WRITE_ACCESS,
+                           graph=graph, top_k=top_k, cutoff=cutoff)
+
+    def embedded_similarity(self, engine="exact", top_k=TOP_K, cutoff=SIMILARITY_CUTOFF, workers=1,
+                            batch_size=BATCH_SIZE, snapshot=None):
+        # The pairs of similar_papers computed here rather than by GDS: engine "exact" or the
+        # approximate "minhash" of sdm.similarity, on workers processes. The keywords are read
+        # from the database, or from a snapshot (sdm.snapshot).
+        if snapshot is not None:
+            titles = snapshot.property("Paper", "title")
+            papers = range(len(titles))
+            matrix = snapshot.matrix(relationship_key("Has", "Paper", "Keyword"))
+        else:
+            titles = {}
+            papers, matrix = keyword_matrix(self._paper_keywords(titles, batch_size))
+        result = ENGINES[engine](matrix, top_k, cutoff, workers)
+        return [PaperSimilarity(titles[paper], titles[other], similarity)
+                for paper, other, similarity in similar_pairs(papers, result)]
+
+    def write_similarity(self, top_k=TOP_K, cutoff=SIMILARITY_CUTOFF, mode="write", batch_size=BATCH_SIZE):
+        # Keeps the top_k most similar papers (at least cutoff) of every paper on the server:
+        # as (:Paper)-[:SIMILAR {score}]->(:Paper) relationships with mode "write", or only in
+        # a projection of its own with mode "mutate", for the GDS algorithms that run on it
+        # next. Returns the name of the projection.
+        configuration = {"topK": top_k, "similarityCutoff": cutoff}
+        spec = self._similarity_spec(top_k, cutoff)
+        if mode == "mutate":
+            return self._mutate_similarity(configuration, spec)
+        projections = ProjectionManager(self.driver, self.config["gds_heap_budget"])
+        graph = projections.ensure("paper_similarity", PAPER_KEYWORDS)
         with self.driver.session() as session:
-            session.write_transaction(self._create_bipartite_graph)
-            result = session.write_transaction(self._compute_similarity)
-            print("\n Showing first 10 rows of the result \n")
-            for row in result[:10]:
-                print(row)
+            self._delete_similar(session, batch_size)
+            configuration.update(writeRelationshipType="SIMILAR", writeProperty="score")
+            summary = session.run(
+                "CALL gds.nodeSimilarity.write($graph, $configuration) "
+                "YIELD nodesCompared, relationshipsWritten, computeMillis",
+                graph=graph, configuration=configuration).single()
+            # Stamps the written relationships with the epoch they were computed for. This
+            # is derived data, so the epoch itself is not bumped and cached reports stay valid.
+            session.run("MATCH (e:GraphEpoch) SET e.similarity = e.value + $spec", spec=spec).consume()
+            # Later reads of this App wait for the relationships on the server they are routed to
+            self.bookmarks[:] = [session.last_bookmark()]
+        print("Similarity of %d papers: %d SIMILAR relationships in %dms"
+              % (summary["nodesCompared"], summary["relationshipsWritten"], summary["computeMillis"]))
+        return graph
+
+    def similarity_is_current(self, top_k=TOP_K, cutoff=SIMILARITY_CUTOFF):
+        # True when the SIMILAR relationships were written with these settings since the last load
+        with self.driver.session() as session:
+            record = session.run("MATCH (e:GraphEpoch) RETURN e.similarity = e.value + $spec AS current",
+                                 spec=self._similarity_spec(top_k, cutoff)).single()
+        return record is not None and bool(record["current"])
+
+    def _mutate_similarity(self, configuration, spec):
+        # SIMILAR can only be added to a projection once: the projection is kept while it holds
+        # the relationships of these settings, which the GraphEpoch node records along with the
+        # name of the projection (named after the epoch), and rebuilt for other settings
+        projections = ProjectionManager(self.driver, self.config["gds_heap_budget"])
+        graph = projections.ensure("mutated_similarity", PAPER_KEYWORDS)
+        with self.driver.session() as session:
+            mutated = session.run(MUTATED_QUERY, graph=graph).single()["mutated"]
+            record = session.run("MATCH (e:GraphEpoch) RETURN e.mutated_similarity = $graph + $spec AS current",
+                                 graph=graph, spec=spec).single()
+        if mutated and record is not None and record["current"]:
+            return graph
+        if mutated:
+            projections.drop("mutated_similarity")
+            graph = projections.ensure("mutated_similarity", PAPER_KEYWORDS)
+        configuration.update(mutateRelationshipType="SIMILAR", mutateProperty="score")
+        with self.driver.session() as session:
+            summary = session.run(
+                "CALL gds.nodeSimilarity.mutate($graph, $configuration) "
+                "YIELD nodesCompared, relationshipsWritten, computeMillis",
+                graph=graph, configuration=configuration).single()
+            session.run("MATCH (e:GraphEpoch) SET e.mutated_similarity = $graph + $spec",
+                        graph=graph, spec=spec).consume()
+        print("Similarity of %d papers: %d SIMILAR relationships added to %s in %dms"
+              % (summary["nodesCompared"], summary["relationshipsWritten"], graph, summary["computeMillis"]))
+        return graph
+
+    def _paper_keywords(self, titles, batch_size):
+        # (paper id, keyword ids) of every paper, a page at a time; fills titles by paper id
+        for rows in self.pages(PAPER_KEYWORDS_QUERY, batch_size):
+            for paper, title, keywords in rows:
+                titles[paper] = title
+                yield paper, keywords
 
     @staticmethod
-    def _create_bipartite_graph(tx):
-        query = ("CALL gds.graph.create('paper-similarity',['Paper', 'Keyword'],{Has: {type: 'Has'}})")
-        tx.run(query)
+    def _similarity_spec(top_k, cutoff):
+        return " topK=%d cutoff=%s" % (top_k, cutoff)
 
     @staticmethod
-    def _compute_similarity(tx):
-        query = (
-            "CALL gds.nodeSimilarity.stream('paper-similarity') "
-            "YIELD node1, node2, similarity "
-            "RETURN gds.util.asNode(node1).title AS Paper1, gds.util.asNode(node2).title AS Paper2, similarity "
-            "ORDER BY similarity DESCENDING, Paper1, Paper2 ")
-        result = tx.run(query)
-        return [{'Paper1': row['Paper1'], 'Paper2': row['Paper2'], 'similarity': row['similarity']} for row in result]
+    def _delete_similar(session, batch_size):
+        query = "MATCH ()-[r:SIMILAR]->() WITH r LIMIT $limit DELETE r RETURN count(*) AS deleted"
+        while session.run(query, limit=batch_size).single()["deleted"] == batch_size:
+            pass
 
 
 if __name__ == "__main__":
-    bolt_url = "bolt://localhost:7687"
-    user = "neo4j"
-    password = "sdm123"
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--engine", choices=["gds"] + sorted(ENGINES), default="gds",
+                        help="gds writes SIMILAR relationships; exact and minhash compute the pairs here")
+    parser.add_argument("--top-k", type=int, default=TOP_K)
+    parser.add_argument("--cutoff", type=float, default=SIMILARITY_CUTOFF)
+    parser.add_argument("--workers", type=int, default=1, help="processes of the exact and minhash engines")
+    parser.add_argument("--snapshot", help="with exact or minhash, read the snapshot of the current epoch in this "
+                                           "directory, exporting it when there is none")
+    args = parser.parse_args()
+
     App.enable_log(logging.INFO, sys.stdout)
-    app = App(bolt_url, user, password)
-    app.paper_similarity()
+    app = App()
+    if args.engine == "gds":
+        app.paper_similarity(top_k=args.top_k, cutoff=args.cutoff)
+    else:
+        snapshot = export_database(app, args.snapshot) if args.snapshot else None
+        pairs = app.embedded_similarity(args.engine, args.top_k, args.cutoff, args.workers, snapshot=snapshot)
+        app.show(pairs[:10], 10)
     app.close()
@@ -1,55 +1,89 @@
+import argparse
 import logging
 import sys
+from collections import namedtuple
 
-from neo4j import GraphDatabase
-
-class App:
-
-    def __init__(self, uri, user, password):
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
-
-    def close(self):
-        # Don't forget to close the driver connection when you are finished with it
-        self.driver.close()
-
-    @staticmethod
-    def enable_log(level, output_stream):
-        handler = logging.StreamHandler(output_stream)
-        handler.setLevel(level)
-        logging.getLogger("neo4j").addHandler(handler)
-        logging.getLogger("neo4j").setLevel(level)
-
-    
-    def paper_similarity(self):
-        with self.driver.session() as session:
-            session.write_transaction(self._create_bipartite_graph)
-            result = session.write_transaction(self._compute_similarity)
-            print("\n Showing first 10 rows of the result \n")
-            for row in result[:10]:
-                print(row)
-
-    @staticmethod
-    def _create_bipartite_graph(tx):
-        query = ("CALL gds.graph.create('citation_network ', 'Paper', 'Cites');")
-        tx.run(query)
-
-    @staticmethod
-    def _compute_similarity(tx):
-        query = (
-            "CALL gds.pageRank.stream('citation_network')"
-            "YIELD nodeId, score"
-            "RETURN gds.util.asNode(nodeId) AS paper, score"
-            "ORDER BY score DESC;"
-        )
-        result = tx.run(query)
-        return [{'paper': row['paper'], 'score': row['score']} for row in result]
+from neo4j import WRITE_ACCESS
+
+from sdm.app import BaseApp
+from sdm.dataset import BATCH_SIZE
+from sdm.gds import ProjectionManager, native
+from sdm.pagerank import adjacency_matrix, citation_matrix, page_rank, read_cites, top
+from sdm.snapshot import export_database, relationship_key
+
+CITATION_NETWORK = native("Paper", "Cites")
+
+PAGE_RANK_QUERY = (
+    "CALL gds.pageRank.stream($graph) "
+    "YIELD nodeId, score "
+    "RETURN gds.util.asNode(nodeId).title AS paper, score "
+    "ORDER BY score DESC;"
+)
+
+# A page of papers with their references, for the embedded PageRank of sdm.pagerank
+PAPER_CITATIONS_QUERY = (
+    "MATCH (p:Paper) WHERE p.id > $after "
+    "WITH p ORDER BY p.id LIMIT $limit "
+    "OPTIONAL MATCH (p)-[:Cites]->(reference:Paper) "
+    "RETURN p.id AS id, p.title AS title, collect(reference.id) AS references "
+    "ORDER BY id"
+)
+
+PaperScore = namedtuple("PaperScore", ["paper", "score"])
+
+
+class App(BaseApp):
+
+    def paper_similarity(self, limit=10):
+        self.show(self.page_rank(limit), limit)
+
+    def page_rank(self, limit=None, skip=0):
+        # WRITE_ACCESS, as the projection is on the leader (see sdm.gds.ProjectionManager)
+        projections = ProjectionManager(self.driver, self.config["gds_heap_budget"])
+        graph = projections.ensure("citation_network", CITATION_NETWORK)
+        return self.stream(PAGE_RANK_QUERY, PaperScore, skip, limit, WRITE_ACCESS, graph=graph)
+
+    def embedded_page_rank(self, limit=10, cites=None, batch_size=BATCH_SIZE, snapshot=None):
+        # The limit best papers by PageRank computed here: from the citations in the database,
+        # a snapshot (sdm.snapshot) or a cites.csv file (then papers are shown by id, as titles
+        # are not in it)
+        titles = {}
+        if snapshot is not None:
+            papers = snapshot.property("Paper", "title")
+            matrix = adjacency_matrix(*snapshot.adjacency(relationship_key("Cites", "Paper", "Paper")))
+        elif cites:
+            papers, matrix = citation_matrix(read_cites(cites))
+        else:
+            # Every paper counts, with or without citations, as in the GDS projection
+            edges = list(self._citations(titles, batch_size))
+            papers, matrix = citation_matrix(edges, list(titles))
+        scores, iterations = page_rank(matrix)
+        print("PageRank of %d papers converged in %d iterations" % (len(papers), iterations))
+        return [PaperScore(titles.get(paper, paper), score) for paper, score in top(papers, scores, limit)]
+
+    def _citations(self, titles, batch_size):
+        # (paper, reference) pairs of every citation, a page of papers at a time; fills titles
+        # with every paper, those without references included
+        for rows in self.pages(PAPER_CITATIONS_QUERY, batch_size):
+            for paper, title, references in rows:
+                titles[paper] = title
+                for reference in references:
+                    yield paper, reference
 
 
 if __name__ == "__main__":
-    bolt_url = "bolt://localhost:7687"
-    user = "neo4j"
-    password = "sdm123"
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--embedded", action="store_true", help="compute PageRank here instead of with GDS")
+    parser.add_argument("--cites", help="with --embedded, read the citations from this CSV file")
+    parser.add_argument("--snapshot", help="with --embedded, read the snapshot of the current epoch in this "
+                                           "directory, exporting it when there is none")
+    args = parser.parse_args()
+
     App.enable_log(logging.INFO, sys.stdout)
-    app = App(bolt_url, user, password)
-    app.paper_similarity()
+    app = App()
+    if args.embedded:
+        snapshot = export_database(app, args.snapshot) if args.snapshot else None
+        app.show(app.embedded_page_rank(10, args.cites, snapshot=snapshot), 10)
+    else:
+        app.paper_similarity()
     app.close()
@@ -1,143 +1,250 @@
+import argparse
+import csv
 import logging
 import sys
-
-from neo4j import GraphDatabase
-
-class App:
-
-    def __init__(self, uri, user, password):
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
-
-    def close(self):
-        # Don't forget to close the driver connection when you are finished with it
-        self.driver.close()
-
-    @staticmethod
-    def enable_log(level, output_stream):
-        handler = logging.StreamHandler(output_stream)
-        handler.setLevel(level)
-        logging.getLogger("neo4j").addHandler(handler)
-        logging.getLogger("neo4j").setLevel(level)
-
-    def setup_recommender(self):
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from sdm.app import BaseApp
+from sdm.dataset import BATCH_SIZE, batched
+from sdm.gds import ProjectionManager, cypher
+from sdm.pagerank import citation_matrix, page_rank, subgraph, top
+
+TOP_PAPERS = 100
+RELATES_THRESHOLD = 0.03
+WORKERS = 4
+# community: keywords, when no mapping file is given
+COMMUNITIES = {
+    "database": ["data management", "database index", "data modeling", "big data", "data processing",
+                 "data store", "database querying"],
+}
+
+COMMUNITY_INDEX_QUERY = "CREATE INDEX community_name_index IF NOT EXISTS FOR (n:Community) ON (n.name)"
+
+# MERGE, and the Contains of keywords no longer in the mapping are removed, so reruns change nothing
+COMMUNITIES_QUERY = (
+    "UNWIND $communities AS row "
+    "MERGE (community:Community {name: row.name}) "
+    "WITH community, row "
+    "OPTIONAL MATCH (community)-[old:Contains]->(keyword:Keyword) "
+    "WHERE NOT toLower(keyword.keyword) IN row.keywords "
+    "DELETE old"
+)
+
+COMMUNITY_KEYWORDS_QUERY = (
+    "UNWIND $communities AS row "
+    "MATCH (community:Community {name: row.name}) "
+    "MATCH (keyword:Keyword) "
+    "WHERE toLower(keyword.keyword) IN row.keywords "
+    "MERGE (community)-[:Contains]->(keyword)"
+)
+
+CLEAR_RELATES_QUERY = (
+    "MATCH (community:Community)<-[relates:Relates]-() "
+    "WHERE community.name IN $names "
+    "DELETE relates"
+)
+
+# The Relates and Top_in edges of the communities no longer in the mapping
+CLEAR_STALE_QUERY = (
+    "MATCH (community:Community) "
+    "WHERE NOT community.name IN $names "
+    "MATCH (community)<-[old:Relates|Top_in]-() "
+    "DELETE old"
+)
+
+# Share of the papers of every conference and journal in every community, in one pass over the
+# papers: a paper counts once per community one of its keywords belongs to. Each branch starts
+# from a labeled venue, so only conference editions and journal volumes are expanded.
+RELATES_QUERY = (
+    "CALL { "
+    "MATCH (venue:Conference)-[:Has]->(:Edition)<-[:Published_in]-(paper:Paper) "
+    "RETURN venue, paper "
+    "UNION ALL "
+    "MATCH (venue:Journal)-[:Has]->(:Volume)-[:Contains]->(paper:Paper) "
+    "RETURN venue, paper "
+    "} "
+    "OPTIONAL MATCH (paper)-[:Has]->(:Keyword)<-[:Contains]-(community:Community) "
+    "WHERE community.name IN $names "
+    "WITH venue, paper, collect(DISTINCT community) AS communities "
+    "WITH venue, count(paper) AS total_papers, collect(communities) AS paper_communities "
+    "UNWIND paper_communities AS communities "
+    "UNWIND communities AS community "
+    "WITH venue, community, count(*) * 1.0 / total_papers AS community_percentual "
+    "WHERE community_percentual >= $threshold "
+    "MERGE (venue)-[relates:Relates]->(community) "
+    "SET relates.percentual = community_percentual"
+)
+
+# Papers published in a conference edition or a journal volume related to the community
+COMMUNITY_PAPER_MATCH = (
+    "MATCH (:Community {name: $community})<-[:Relates]-()-[:Has]->()-[:Published_in|Contains]-(n:Paper) "
+)
+
+COMMUNITY_PAPERS_QUERY = (
+    "UNWIND $names AS name "
+    "MATCH (:Community {name: name})<-[:Relates]-()-[:Has]->()-[:Published_in|Contains]-(n:Paper) "
+    "RETURN name, collect(DISTINCT n.id) AS papers"
+)
+
+COMMUNITY_CITATIONS_QUERY = (
+    "UNWIND $papers AS id "
+    "MATCH (:Paper {id: id})-[:Cites]->(reference:Paper) "
+    "RETURN id, reference.id AS reference"
+)
+
+CLEAR_TOP_PAPERS_QUERY = (
+    "MATCH (:Community {name: $community})<-[top:Top_in]-(:Paper) "
+    "DELETE top"
+)
+
+WRITE_TOP_PAPERS_QUERY = (
+    "MATCH (community:Community {name: $community}) "
+    "UNWIND $rows AS row "
+    "MATCH (paper:Paper {id: row[0]}) "
+    "MERGE (paper)-[top:Top_in]->(community) "
+    "SET top.rank = row[1], top.score = row[2]"
+)
+
+TOP_PAPERS_QUERY = (
+    "CALL gds.pageRank.stream($graph) "
+    "YIELD nodeId, score "
+    "WITH gds.util.asNode(nodeId) AS paper, score "
+    "ORDER BY score DESC "
+    "LIMIT $limit "
+    "RETURN paper.id AS paper, score"
+)
+
+REVIEWERS_QUERY = (
+    "MATCH (potential_reviewer:Author)-[:Wrote]->(:Paper)-[:Top_in]->(:Community {name: $community}) "
+    "RETURN DISTINCT potential_reviewer.name AS reviewer;"
+)
+
+# Authors of at least two top papers, counted in one pass over their papers
+GURUS_QUERY = (
+    "MATCH (guru:Author)-[:Wrote]->(p:Paper)-[:Top_in]->(:Community {name: $community}) "
+    "WITH guru, count(DISTINCT p) AS top_papers "
+    "WHERE top_papers >= 2 "
+    "RETURN guru.name AS guru;"
+)
+
+Reviewer = namedtuple("Reviewer", ["reviewer"])
+Guru = namedtuple("Guru", ["guru"])
+
+
+def community_graph(community):
+    # The GDS projection of the papers of a community and the citations between them
+    return cypher(
+        COMMUNITY_PAPER_MATCH + "RETURN DISTINCT id(n) AS id",
+        "MATCH (n:Paper)-[:Cites]->(p:Paper) RETURN id(n) AS source, id(p) AS target",
+        validateRelationships=False,
+        parameters={"community": community},
+    )
+
+
+def read_communities(path):
+    # community: keywords from a CSV file with community and keyword columns
+    communities = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            communities.setdefault(row["community"].strip(), []).append(row["keyword"].strip())
+    return communities
+
+
+class App(BaseApp):
+
+    def setup_recommender(self, communities=None, embedded=True, workers=WORKERS, top_papers=TOP_PAPERS):
+        # communities: {community: keywords}, COMMUNITIES by default. Every step MERGEs or
+        # replaces what the previous run wrote for these communities, and the communities left
+        # out of the mapping lose their Relates and Top_in edges. embedded: rank the papers
+        # with sdm.pagerank instead of the GDS plugin.
+        communities = communities or COMMUNITIES
+        rows = [{"name": name, "keywords": sorted({keyword.lower() for keyword in keywords})}
+                for name, keywords in sorted(communities.items())]
+        names = [row["name"] for row in rows]
         with self.driver.session() as session:
-            session.write_transaction(self._create_database_community)
-            session.write_transaction(self._connect_community_keywords)
-            session.write_transaction(self._relate_conferences_to_community)
-            session.write_transaction(self._relate_journals_to_community)
-            session.write_transaction(self._highlight_top100)
-
-    def recommend_reviewers(self):
+            session.run(COMMUNITY_INDEX_QUERY).consume()
+            session.write_transaction(self._run, COMMUNITIES_QUERY, communities=rows)
+            session.write_transaction(self._run, COMMUNITY_KEYWORDS_QUERY, communities=rows)
+            session.write_transaction(self._run, CLEAR_STALE_QUERY, names=names)
+            session.write_transaction(self._run, CLEAR_RELATES_QUERY, names=names)
+            session.write_transaction(self._run, RELATES_QUERY, names=names, threshold=RELATES_THRESHOLD)
+        if embedded:
+            self._rank_embedded(names, workers, top_papers)
+        else:
+            with ThreadPoolExecutor(workers) as executor:
+                list(executor.map(lambda name: self._rank_gds(name, top_papers), names))
+        self.bump_epoch()
+
+    def recommend_reviewers(self, limit=10, community="database"):
+        self.show(self.reviewers(limit, community=community), limit)
+
+    def recommend_gurus(self, limit=10, community="database"):
+        self.show(self.gurus(limit, community=community), limit)
+
+    def reviewers(self, limit=None, skip=0, community="database"):
+        return self.cached(REVIEWERS_QUERY, Reviewer, skip, limit, community=community)
+
+    def gurus(self, limit=None, skip=0, community="database"):
+        return self.cached(GURUS_QUERY, Guru, skip, limit, community=community)
+
+    def _rank_embedded(self, names, workers, top_papers, batch_size=BATCH_SIZE):
+        # The citations of all the community papers are read once; every community is then
+        # ranked by PageRank on the citations between its own papers, side by side
         with self.driver.session() as session:
-            result = session.write_transaction(self._get_reviewers)
-            print("\n Showing first 10 rows of the result \n")
-            for row in result[:10]:
-                print(row)
-
-    def recommend_gurus(self):
+            members = dict(session.read_transaction(self._read_rows, COMMUNITY_PAPERS_QUERY, names=names))
+            papers = sorted({paper for ids in members.values() for paper in ids})
+            edges = []
+            for ids in batched(papers, batch_size):
+                edges.extend(session.read_transaction(self._read_rows, COMMUNITY_CITATIONS_QUERY, papers=ids))
+        papers, matrix = citation_matrix(edges, papers)
+        index = {paper: i for i, paper in enumerate(papers)}
+
+        def rank(name):
+            ids = members.get(name, [])
+            scores, _ = page_rank(subgraph(matrix, [index[paper] for paper in ids]))
+            return name, top(ids, scores, top_papers)
+
+        with ThreadPoolExecutor(workers) as executor:
+            ranked = list(executor.map(rank, names))
         with self.driver.session() as session:
-            result = session.write_transaction(self._get_gurus)
-            print("\n Showing first 10 rows of the result \n")
-            for row in result[:10]:
-                print(row)
-            
-    @staticmethod
-    def _create_database_community(tx):
-        query = ("CREATE (:Community {name: 'database'});")
-        tx.run(query)
+            for name, best in ranked:
+                self._write_top_papers(session, name, best)
 
-    @staticmethod
-    def _connect_community_keywords(tx):
-        query = (
-            "MATCH (keyword:Keyword) "
-            "WHERE toLower(keyword.keyword) IN ['data management', 'database index', 'data modeling', 'big data', 'data processing', 'data store', 'database querying'] "
-            "MATCH (community:Community {name: 'database'}) "
-            "CREATE (community)-[:Contains]->(keyword); "
-            )
-        tx.run(query)
-
-    @staticmethod
-    def _relate_conferences_to_community(tx):
-        query = (
-            "MATCH (conference:Conference)-[:Has]->(:Edition)<-[:Published_in]-(paper:Paper) "
-            "WITH conference, COUNT (paper) AS total_papers "
-            "MATCH (conference)-[:Has]->(:Edition)<-[:Published_in]-(community_paper:Paper)-[:Has]->(:Keyword)<-[:Contains]-(:Community {name: 'database'}) "
-            "WITH conference, COUNT(community_paper) AS total_com_papers, total_papers "
-            "WITH conference, total_com_papers * 1.0 / total_papers AS community_percentual"
-            "WHERE community_percentual >= 0.03 "
-            "MATCH (community:Community {name: 'database'}) "
-            "CREATE (conference)-[:Relates]->(community); "
-            )
-        tx.run(query)
-
-    @staticmethod
-    def _relate_journals_to_community(tx):
-        query = (
-            "MATCH (journal:Journal)-[:Has]->(:Volume)-[:Contains]->(paper:Paper) "
-            "WITH journal, COUNT (paper) AS total_papers "
-            "MATCH (journal:Journal)-[:Has]->(:Volume)-[:Contains]->(community_paper:Paper)-[:Has]->(:Keyword)<-[:Contains]-(:Community {name: 'database'}) "
-            "WITH journal, COUNT(community_paper) AS total_com_papers, total_papers "
-            "WITH journal, total_com_papers * 1.0 / total_papers AS community_percentual "
-            "WHERE community_percentual >= 0.03 "
-            "MATCH (community:Community {name: 'database'}) "
-            "CREATE (journal)-[:Relates]->(community); "
-            )
-        tx.run(query)
+    def _rank_gds(self, name, top_papers):
+        # In a write transaction, so that it runs on the leader, which holds the projection
+        projections = ProjectionManager(self.driver, self.config["gds_heap_budget"])
+        graph = projections.ensure("community_%s" % name, community_graph(name))
+        with self.driver.session() as session:
+            best = session.write_transaction(self._read_rows, TOP_PAPERS_QUERY, graph=graph, limit=top_papers)
+            self._write_top_papers(session, name, best)
 
-    @staticmethod
-    def _create_database_community_graph(tx):
-        query = (
-            "CALL gds.graph.create.cypher("
-                "\"database_community\", "
-                "\"MATCH (n:Paper)-[r]-()<--()-[:Relates]->(:Community { name: \\\"database\\\"}) WHERE r:Contains OR r:Published_in RETURN DISTINCT id(n) AS id\", "
-                "\"MATCH (n)-[r:Cites]->(p) RETURN id(n) AS source, id(p) AS target\", "
-                "{ validateRelationships: false }"
-            ");"
-            )
-        tx.run(query)
+    def _write_top_papers(self, session, name, best):
+        rows = [[paper, rank, score] for rank, (paper, score) in enumerate(best, 1)]
+        session.write_transaction(self._run, CLEAR_TOP_PAPERS_QUERY, community=name)
+        session.write_transaction(self._run, WRITE_TOP_PAPERS_QUERY, community=name, rows=rows)
 
     @staticmethod
-    def _highlight_top100(tx):
-        query = (
-            "CALL gds.pageRank.stream(\"database_community\")"
-            "YIELD nodeId, score"
-            "WITH gds.util.asNode(nodeId) AS paper"
-            "ORDER BY score DESC"
-            "LIMIT 100"
-            "SET paper :Top100DatabaseCommunity"
-            "RETURN paper;"
-            )
-        tx.run(query)
+    def _read_rows(tx, query, **parameters):
+        return [tuple(row.values()) for row in tx.run(query, **parameters)]
 
     @staticmethod
-    def _get_reviewers(tx):
-        query = (
-            "MATCH (potential_reviewer:Author)-[:Wrote]->(n:Top100DatabaseCommunity)"
-            "RETURN DISTINCT potential_reviewer;"
-            )
-        result = tx.run(query)
-        return result
+    def _run(tx, query, **parameters):
+        return tx.run(query, **parameters).consume()
 
-    @staticmethod
-    def _get_gurus(tx):
-        query = (
-            "MATCH (guru:Author)-[:Wrote]->(p1:Top100DatabaseCommunity)"
-            "MATCH (guru:Author)-[:Wrote]->(p2:Top100DatabaseCommunity)"
-            "WHERE p1 <> p2"
-            "RETURN DISTINCT guru;"
-            )
-        result = tx.run(query)
-        return result
-        
-        
 
 if __name__ == "__main__":
-    bolt_url = "bolt://localhost:7687"
-    user = "neo4j"
-    password = "sdm123"
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--communities", help="CSV file of community,keyword rows (default: the database community)")
+    parser.add_argument("--community", default="database", help="community to recommend reviewers and gurus for")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="communities ranked at the same time")
+    parser.add_argument("--gds", action="store_true", help="rank the community papers with the GDS plugin")
+    args = parser.parse_args()
+
     App.enable_log(logging.INFO, sys.stdout)
-    app = App(bolt_url, user, password)
-    app.setup_recommender()
-    app.recommend_reviewers()
-    app.recommend_gurus()
-    app.close()
\ No newline at end of file
+    app = App()
+    app.setup_recommender(read_communities(args.communities) if args.communities else None, not args.gds,
+                          args.workers)
+    app.recommend_reviewers(community=args.community)
+    app.recommend_gurus(community=args.community)
+    app.close()
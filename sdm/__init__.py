@@ -0,0 +1 @@
+"""Shared helpers for the SDM property graph scripts."""
@@ -0,0 +1,131 @@
+"""Asyncio counterpart of the App classes, on the async API of the neo4j driver (5.x).
+
+AsyncApp runs the LOAD CSV steps of PartA.2, the enrichments of PartA.3 and
+the analytics queries (see sdm.bench.QUERIES) as coroutines. At most
+`concurrency` transactions are in flight at a time. A caller that reads a
+stream slowly keeps its slot, so the producers wait for it rather than
+buffering results. The derived data (Author-Published_in->Edition edges,
+citation statistics) is computed by PartA.2 afterwards.
+
+    async with AsyncApp(concurrency=8) as app:
+        await app.load()
+        results = await app.analytics()
+"""
+import asyncio
+import time
+from contextlib import AsyncExitStack
+
+from neo4j import READ_ACCESS, AsyncGraphDatabase
+
+from sdm.bench import registered_queries
+from sdm.cache import BUMP_EPOCH_QUERY
+from sdm.config import load_config
+from sdm.dataset import EDGES, INDEXES, NODES
+from sdm.parts import load_part
+
+CONCURRENCY = 4
+
+
+def create_async_driver(config):
+    return AsyncGraphDatabase.driver(
+        config["uri"],
+        auth=(config["user"], config["password"]),
+        max_connection_pool_size=int(config["max_connection_pool_size"]),
+        connection_acquisition_timeout=float(config["connection_acquisition_timeout"]),
+        max_transaction_retry_time=float(config["max_transaction_retry_time"]),
+        fetch_size=int(config["fetch_size"]),
+    )
+
+
+class AsyncApp:
+    # Pass driver to share the AsyncDriver of the embedding service; it is then not closed here.
+
+    def __init__(self, config=None, concurrency=CONCURRENCY, driver=None):
+        self.owns_driver = driver is None
+        self.driver = driver or create_async_driver(config or load_config())
+        self.slots = asyncio.Semaphore(concurrency)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        if self.owns_driver:
+            await self.driver.close()
+
+    async def write(self, name, query, **parameters):
+        async with self.slots:
+            start = time.time()
+            async with self.driver.session() as session:
+                summary = await session.execute_write(self._consume, query, parameters)
+            print("Step '%s' finished in %.1fs" % (name, time.time() - start))
+            return summary
+
+    async def stream(self, query, record_type=None, **parameters):
+        # Async generator of the rows of a read query, as record_type (a namedtuple) or plain
+        # tuples; the slot is held until the rows are read
+        async with self.slots:
+            async with self.driver.session(default_access_mode=READ_ACCESS) as session:
+                async with await session.begin_transaction() as tx:
+                    result = await tx.run(query, parameters)
+                    async for record in result:
+                        yield tuple(record.values()) if record_type is None else record_type._make(record.values())
+
+    async def fetch(self, query, record_type=None, **parameters):
+        return [row async for row in self.stream(query, record_type, **parameters)]
+
+    async def load(self):
+        # Nodes, then an index per label, then the edges, each as soon as what it needs is done.
+        # Edges sharing an endpoint label don't run at the same time, as they would lock the
+        # same nodes.
+        part = load_part("A.2")
+        labels = {label: asyncio.Lock() for label in INDEXES}
+        loaded = {}
+
+        async def node(filename, label, properties):
+            await self.write(label + " nodes", part.node_load_csv_query(filename, label, properties))
+            await self.write(label + " index", part.index_query(label))
+
+        for filename, label, properties in NODES:
+            loaded[label] = asyncio.ensure_future(node(filename, label, properties))
+
+        async def edge(filename, rel_type, start, end):
+            await asyncio.gather(loaded[start[0]], loaded[end[0]])
+            async with AsyncExitStack() as stack:
+                for label in sorted({start[0], end[0]}):
+                    await stack.enter_async_context(labels[label])
+                await self.write("%s (%s)" % (rel_type, filename),
+                                 part.edge_load_csv_query(filename, rel_type, start, end))
+
+        await asyncio.gather(*(edge(*spec) for spec in EDGES))
+        await self.bump_epoch()
+
+    async def enrich(self):
+        # The reviews and the affiliations of PartA.3, side by side
+        part = load_part("A.3")
+
+        async def affiliations():
+            await self.write("Affiliation nodes", part.AFFILIATIONS_QUERY)
+            await self.write("Affiliation index", part.AFFILIATION_INDEX_QUERY)
+            await self.write("Affiliated (affiliated.csv)", part.AFFILIATED_QUERY)
+
+        await asyncio.gather(self.write("Reviewed (reviewed_v2.csv)", part.REVIEWS_QUERY), affiliations())
+        await self.bump_epoch()
+
+    async def analytics(self, names=None):
+        # name -> list of row tuples, for the registered analytics queries
+        queries = registered_queries(names)
+        results = await asyncio.gather(*(self.fetch(query, **parameters) for query, parameters in queries.values()))
+        return dict(zip(queries, results))
+
+    async def bump_epoch(self):
+        async with self.driver.session() as session:
+            await session.execute_write(self._consume, BUMP_EPOCH_QUERY, {})
+
+    @staticmethod
+    async def _consume(tx, query, parameters):
+        result = await tx.run(query, parameters)
+        return await result.consume()
+
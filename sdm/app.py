@@ -0,0 +1,131 @@
+"""Base class of the App classes of the Part scripts."""
+import logging
+import time
+
+from neo4j import READ_ACCESS
+
+from sdm.cache import BUMP_EPOCH_QUERY, READ_EPOCH_QUERY, cache_key
+from sdm.config import load_config
+from sdm.driver import create_driver
+
+
+class BaseApp:
+    # Pass driver to share an existing pool (see sdm.driver.get_driver); otherwise the App
+    # builds its own driver from the configuration, with uri/user/password taking precedence.
+    # self.config holds the settings (sdm.config) of the App, config if given.
+    # Reads started after a write of this App wait for it on the server they are routed to
+    # through self.bookmarks; pass the same bookmarks list to Apps on other drivers (a loader
+    # and the analytics after it) to make their reads wait for each other's writes as well.
+    # read_stats (sdm.metrics.ReadStats) collects per-server latencies. With cache
+    # (sdm.cache.QueryCache), cached() answers repeated reports until the next load.
+
+    def __init__(self, uri=None, user=None, password=None, driver=None, read_stats=None, cache=None,
+                 bookmarks=None, config=None):
+        self.config = config or load_config(uri=uri, user=user, password=password)
+        self.owns_driver = driver is None
+        self.driver = driver or create_driver(self.config)
+        self.read_stats = read_stats
+        self.cache = cache
+        self.bookmarks = bookmarks if bookmarks is not None else []
+
+    def close(self):
+        # Don't forget to close the driver connection when you are finished with it
+        if self.owns_driver:
+            self.driver.close()
+
+    def stream(self, query, record_type, skip=0, limit=None, access_mode=READ_ACCESS, **parameters):
+        # Yields the rows of a read query lazily as record_type tuples (fields in RETURN order).
+        # skip and limit are added to the query itself, so the server only produces what is asked
+        # for, and rows are pulled from the server in fetch_size chunks as the caller iterates.
+        # With a neo4j:// uri the query is routed to a follower or read replica.
+        start = time.perf_counter()
+        rows = 0
+        with self.driver.session(default_access_mode=access_mode, bookmarks=self.bookmarks) as session:
+            with session.begin_transaction() as tx:
+                result = tx.run(self._page(query, skip, limit), skip=skip, limit=limit, **parameters)
+                for record in result:
+                    rows += 1
+                    yield record_type._make(record.values())
+                summary = result.consume()
+        if self.read_stats is not None:
+            self.read_stats.record(summary.server.address, time.perf_counter() - start, rows)
+
+    def cached(self, query, record_type, skip=0, limit=None, **parameters):
+        # Like stream, but the rows are kept in self.cache under the current graph epoch. The
+        # epoch is read in the transaction of the query, so rows are never cached under an epoch
+        # they were not read at. Without a cache, or before any loader has set an epoch, the
+        # query simply runs.
+        if self.cache is None:
+            return self.stream(query, record_type, skip, limit, **parameters)
+        start = time.perf_counter()
+        with self.driver.session(default_access_mode=READ_ACCESS, bookmarks=self.bookmarks) as session:
+            with session.begin_transaction() as tx:
+                record = tx.run(READ_EPOCH_QUERY).single()
+                key = None if record is None else cache_key(query, dict(parameters, skip=skip, limit=limit),
+                                                            record["epoch"])
+                rows = None if key is None else self.cache.get(key)
+                if rows is not None:
+                    return iter([record_type._make(row) for row in rows])
+                result = tx.run(self._page(query, skip, limit), skip=skip, limit=limit, **parameters)
+                rows = [tuple(row.values()) for row in result]
+                summary = result.consume()
+        if key is not None:
+            self.cache.put(key, rows)
+        if self.read_stats is not None:
+            self.read_stats.record(summary.server.address, time.perf_counter() - start, len(rows))
+        return iter([record_type._make(row) for row in rows])
+
+    def pages(self, query, batch_size, after="", session=None):
+        # Pages of rows of a keyset-paged read query, which returns the key it pages on first,
+        # keeps the keys greater than $after, orders by them and ends with LIMIT $limit. after
+        # is below every key: "" for ids, -1 for internal node ids. Pass session to read in an
+        # open session, after the writes made in it.
+        if session is None:
+            with self.driver.session(bookmarks=self.bookmarks) as session:
+                yield from self.pages(query, batch_size, after, session)
+            return
+        while True:
+            rows = session.read_transaction(self._read_page, query, after, batch_size)
+            if not rows:
+                return
+            yield rows
+            after = rows[-1][0]
+
+    def graph_epoch(self):
+        with self.driver.session(default_access_mode=READ_ACCESS, bookmarks=self.bookmarks) as session:
+            record = session.run(READ_EPOCH_QUERY).single()
+        return None if record is None else record["epoch"]
+
+    def bump_epoch(self):
+        # Called by every loader once it has changed the graph, to invalidate cached results
+        with self.driver.session() as session:
+            session.run(BUMP_EPOCH_QUERY).consume()
+            self.bookmarks[:] = [session.last_bookmark()]
+
+    @staticmethod
+    def _read_page(tx, query, after, limit):
+        return [tuple(row.values()) for row in tx.run(query, after=after, limit=limit)]
+
+    @staticmethod
+    def _page(query, skip, limit):
+        query = query.rstrip().rstrip(";")
+        if skip:
+            query += " SKIP $skip"
+        if limit is not None:
+            query += " LIMIT $limit"
+        return query
+
+    @staticmethod
+    def show(rows, limit):
+        # One print per result, so results of analytics running side by side don't interleave
+        lines = ["\n Showing first %d rows of the result \n" % limit]
+        lines.extend(str(row) for row in rows)
+        print("\n".join(lines))
+
+    @staticmethod
+    def enable_log(level, output_stream):
+        handler = logging.StreamHandler(output_stream)
+        handler.setLevel(level)
+        for name in ("neo4j", "sdm"):
+            logging.getLogger(name).addHandler(handler)
+            logging.getLogger(name).setLevel(level)
@@ -0,0 +1,174 @@
+"""PROFILE every analytics query and compare db hits and latency with a stored baseline.
+
+    python -m sdm.bench --baseline bench.json --update-baseline    # record the baseline
+    python -m sdm.bench --baseline bench.json                      # exits 1 on a regression
+
+--record FILE keeps the raw plans of a live run and --replay FILE uses them
+instead of a server, so the comparison can run offline.
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+
+from sdm.config import load_config
+from sdm.driver import create_driver
+from sdm.parts import load_part
+
+# name: (part, query constant, parameters). The C queries stream from GDS graphs projected
+# by their scripts and are not standalone, so they are left out.
+QUERIES = {
+    "top3_papers_of_conference": ("B.1", "TOP3_PAPERS_QUERY", {}),
+    "conference_communities": ("B.2", "CONFERENCE_COMMUNITIES_QUERY", {}),
+    "journals_impact_factor": ("B.3", "JOURNALS_IMPACT_FACTOR_QUERY", {"year": 2019}),
+    "h_indexes": ("B.4", "H_INDEX_QUERY", {}),
+    "server_h_indexes": ("B.4", "SERVER_H_INDEX_QUERY", {}),
+    "reviewers": ("D", "REVIEWERS_QUERY", {"community": "database"}),
+    "gurus": ("D", "GURUS_QUERY", {"community": "database"}),
+}
+DB_HITS_THRESHOLD = 0.1
+TIME_THRESHOLD = 0.5
+
+
+def registered_queries(names=None):
+    # name -> (query text, parameters)
+    return {name: (getattr(load_part(part), constant), parameters)
+            for name, (part, constant, parameters) in QUERIES.items() if not names or name in names}
+
+
+def operator_tree(plan):
+    # Keeps what is compared and read by a person: operator, identifiers, rows, db hits
+    return {
+        "operator": plan.get("operatorType"),
+        "details": (plan.get("args") or plan.get("arguments") or {}).get("Details"),
+        "rows": plan.get("rows"),
+        "db_hits": plan.get("dbHits"),
+        "children": [operator_tree(child) for child in plan.get("children", [])],
+    }
+
+
+def total_db_hits(tree):
+    return (tree["db_hits"] or 0) + sum(total_db_hits(child) for child in tree["children"])
+
+
+class DriverBackend:
+    # Runs the queries on a server under PROFILE (or EXPLAIN, which has no db hits or rows)
+
+    def __init__(self, driver, explain=False):
+        self.driver = driver
+        self.prefix = "EXPLAIN " if explain else "PROFILE "
+        self.recorded = {}
+
+    def run(self, name, query, parameters):
+        with self.driver.session() as session:
+            start = time.perf_counter()
+            result = session.run(self.prefix + query, parameters)
+            rows = len(list(result))
+            summary = result.consume()
+            seconds = time.perf_counter() - start
+        plan = summary.profile if self.prefix == "PROFILE " else summary.plan
+        self.recorded.setdefault(name, []).append({"plan": plan, "rows": rows, "seconds": seconds})
+        return plan, rows, seconds
+
+
+class RecordedBackend:
+    # Replays the plans of a run saved with --record, in the order they were recorded
+
+    def __init__(self, path):
+        with open(path) as f:
+            self.recorded = json.load(f)
+        self.position = {}
+
+    def run(self, name, query, parameters):
+        runs = self.recorded[name]
+        position = self.position.get(name, 0)
+        self.position[name] = position + 1
+        entry = runs[position % len(runs)]
+        return entry["plan"], entry["rows"], entry["seconds"]
+
+
+def measure(backend, queries, repeat=3):
+    # The plan of the last run, and the median wall time over repeat runs
+    results = {}
+    for name, (query, parameters) in queries.items():
+        timings = []
+        for _ in range(repeat):
+            plan, rows, seconds = backend.run(name, query, parameters)
+            timings.append(seconds)
+        tree = operator_tree(plan or {})
+        results[name] = {
+            "db_hits": total_db_hits(tree),
+            "rows": rows,
+            "seconds": round(statistics.median(timings), 4),
+            "plan": tree,
+        }
+    return results
+
+
+def regressions(results, baseline, db_hits_threshold=DB_HITS_THRESHOLD, time_threshold=TIME_THRESHOLD):
+    # (name, metric, baseline value, current value) for every metric that grew past its threshold
+    found = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for metric, threshold in [("db_hits", db_hits_threshold), ("seconds", time_threshold)]:
+            before, after = baseline[name][metric], result[metric]
+            if after > before * (1 + threshold):
+                found.append((name, metric, before, after))
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m sdm.bench")
+    parser.add_argument("queries", nargs="*", metavar="query", help="any of %s (default: all)" % ", ".join(QUERIES))
+    parser.add_argument("--config", help="settings file (default: sdm.ini or $SDM_CONFIG)")
+    parser.add_argument("--baseline", help="JSON file with the baseline to compare against")
+    parser.add_argument("--update-baseline", action="store_true", help="write this run as the new baseline")
+    parser.add_argument("--explain", action="store_true", help="only plan the queries (no db hits, rows or latency)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per query; the median time is kept")
+    parser.add_argument("--record", help="save the raw plans of this run to this file")
+    parser.add_argument("--replay", help="read the plans from a file saved with --record instead of a server")
+    parser.add_argument("--db-hits-threshold", type=float, default=DB_HITS_THRESHOLD,
+                        help="allowed relative growth of the db hits (default: %s)" % DB_HITS_THRESHOLD)
+    parser.add_argument("--time-threshold", type=float, default=TIME_THRESHOLD,
+                        help="allowed relative growth of the wall time (default: %s)" % TIME_THRESHOLD)
+    args = parser.parse_args(argv)
+    unknown = set(args.queries) - set(QUERIES)
+    if unknown:
+        parser.error("unknown query(s): %s" % ", ".join(sorted(unknown)))
+
+    driver = None
+    if args.replay:
+        backend = RecordedBackend(args.replay)
+    else:
+        driver = create_driver(load_config(args.config))
+        backend = DriverBackend(driver, args.explain)
+    try:
+        results = measure(backend, registered_queries(args.queries), args.repeat)
+    finally:
+        if driver is not None:
+            driver.close()
+    if args.record:
+        with open(args.record, "w") as f:
+            json.dump(backend.recorded, f, indent=1, default=str)
+
+    for name, result in results.items():
+        print("%-28s %12d db hits %10d rows %9.4fs" % (name, result["db_hits"], result["rows"], result["seconds"]))
+    if not args.baseline:
+        return 0
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+        print("Baseline written to %s" % args.baseline)
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    found = regressions(results, baseline, args.db_hits_threshold, args.time_threshold)
+    for name, metric, before, after in found:
+        print("REGRESSION %s: %s %s -> %s" % (name, metric, before, after))
+    return 1 if found else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
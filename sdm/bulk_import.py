@@ -0,0 +1,206 @@
+"""Writes the import CSVs as neo4j-admin database import files, without a running server."""
+import argparse
+import csv
+import os
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from sdm.dataset import (CONVERSIONS, EDGES, INDEXES, LIST_SEPARATOR, NODES, TYPES, edge_columns, edge_rows,
+                         iter_rows, key_types, property_types)
+from sdm.validate import CHUNK_SIZE, read_chunks
+
+DERIVED_FILE = "author_published_in_edition.csv"
+# 16 characters, as pandas expects; any key other than its default gives independent hashes
+SECOND_HASH_KEY = "sdm-bulk-import2"
+IMPORT_COMMAND = [
+    "neo4j-admin", "database", "import", "full", "neo4j",
+    "--multiline-fields=true", "--skip-bad-relationships=true", "--skip-duplicate-nodes=true",
+    "--array-delimiter=" + LIST_SEPARATOR,
+]
+
+
+def node_header(label, properties):
+    # A typed key gets an untyped :ID column for the ID space and a typed copy as the property
+    key = INDEXES[label][0]
+    header = []
+    for prop, value_type in zip(properties, property_types(label, properties)):
+        typed = "%s:%s" % (prop, CONVERSIONS[value_type][2]) if value_type else prop
+        if prop == key:
+            header.extend([":ID(%s)" % label, typed] if value_type else ["%s:ID(%s)" % (prop, label)])
+        else:
+            header.append(typed)
+    return header
+
+
+def node_rows(label, properties, rows):
+    key_index = list(properties).index(INDEXES[label][0])
+    key_typed = property_types(label, properties)[key_index] is not None
+    for row in rows:
+        row = [as_text(value) for value in row]
+        yield row[:key_index] + [row[key_index]] + row[key_index:] if key_typed else row
+
+
+def as_text(value):
+    # Typed values written back in the form neo4j-admin parses
+    if isinstance(value, list):
+        return LIST_SEPARATOR.join(value)
+    return None if value is None else str(value)
+
+
+def author_published_in_edition(import_dir):
+    # One edge per (author, edition) with the number of papers behind it, as built by
+    # App.load_author_published_in_edition; holds the paper->edition map and the pair counts.
+    # wrote.csv rows are expected to be unique, a repeated row would count its paper twice.
+    editions = {}
+    for paper, edition in edge_rows(os.path.join(import_dir, "published_in_edition.csv"),
+                                    edge_columns("published_in_edition.csv")):
+        editions.setdefault(paper, set()).add(edition)
+    papers = Counter()
+    for author, paper in edge_rows(os.path.join(import_dir, "wrote.csv"), edge_columns("wrote.csv")):
+        for edition in sorted(editions.get(paper, ())):
+            papers[author, edition] += 1
+    for (author, edition), count in papers.items():
+        yield [author, edition, str(count)]
+
+
+def import_plan(import_dir):
+    # (option, label or type, output file, header, rows) for every file neo4j-admin has to read
+    for filename, label, properties in NODES:
+        rows = iter_rows(os.path.join(import_dir, filename), list(properties.values()), property_types(label, properties))
+        yield "--nodes", label, filename, node_header(label, properties), node_rows(label, properties, rows)
+    for filename, rel_type, start, end in EDGES:
+        rows = edge_rows(os.path.join(import_dir, filename), [start[2], end[2]], key_types(start, end))
+        yield ("--relationships", rel_type, filename, [":START_ID(%s)" % start[0], ":END_ID(%s)" % end[0]],
+               ([as_text(value) for value in row] for row in rows))
+    yield ("--relationships", "Published_in", DERIVED_FILE, [":START_ID(Author)", ":END_ID(Edition)", "papers:int"],
+           author_published_in_edition(import_dir))
+
+
+def header_file(out_dir, filename):
+    return os.path.join(out_dir, filename[:-len(".csv")] + "_header.csv")
+
+
+def write_csv(path, rows):
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def write_import_files(import_dir, out_dir):
+    os.makedirs(out_dir, exist_ok=True)
+    command = list(IMPORT_COMMAND)
+    for option, name, filename, header, rows in import_plan(import_dir):
+        write_csv(header_file(out_dir, filename), [header])
+        count = write_csv(os.path.join(out_dir, filename), rows)
+        command.append("%s=%s=%s,%s" % (option, name, header_file(out_dir, filename), os.path.join(out_dir, filename)))
+        print("%s: %d rows written" % (filename, count))
+    return command
+
+
+def verify_import_files(import_dir, out_dir, chunk_size=CHUNK_SIZE):
+    # Checks the generated files against the source CSVs read on their own with pandas, as
+    # sdm.validate does: every file has the rows it should, and the same node IDs or
+    # (start, end) pairs. Both sides are read chunk_size rows at a time and compared by row
+    # count and two order-independent sums of 64-bit row hashes, so memory stays bounded by
+    # the chunk size, except for the (author, edition) pair counts of DERIVED_FILE.
+    mismatches = []
+    for filename, label, properties in NODES:
+        key = INDEXES[label][0]
+        header = node_header(label, properties)
+        expected = _key_values(read_chunks(os.path.join(import_dir, filename), [properties[key]], chunk_size),
+                               [properties[key]], TYPES.get(label, {}).get(key))
+        id_column = next(i for i, column in enumerate(header) if ":ID(" in column)
+        mismatches.extend(_compare(out_dir, filename, expected, header, [id_column], chunk_size))
+    for filename, rel_type, start, end in EDGES:
+        columns = [start[2], end[2]]
+        expected = _key_values(read_chunks(os.path.join(import_dir, filename), columns, chunk_size), columns,
+                               *key_types(start, end))
+        header = [":START_ID(%s)" % start[0], ":END_ID(%s)" % end[0]]
+        mismatches.extend(_compare(out_dir, filename, expected, header, [0, 1], chunk_size))
+    mismatches.extend(_compare(out_dir, DERIVED_FILE, [_published_in_counts(import_dir, chunk_size)],
+                               [":START_ID(Author)", ":END_ID(Edition)", "papers:int"], [0, 1, 2], chunk_size))
+    return mismatches
+
+
+def _key_values(chunks, columns, *types):
+    # The rows that must come out of the source columns, a chunk at a time: typed keys as
+    # neo4j-admin reads them, and edges without both endpoints left out
+    for frame in chunks:
+        frame = frame[columns].copy()
+        for column, value_type in zip(columns, types):
+            if value_type == "int":
+                frame[column] = pd.to_numeric(frame[column], errors="coerce").astype("Int64").astype(str)
+                frame.loc[frame[column] == "<NA>", column] = ""
+        if len(columns) > 1:
+            frame = frame[(frame[columns] != "").all(axis=1)]
+        yield frame
+
+
+def _published_in_counts(import_dir, chunk_size):
+    # (author, edition, papers) from a join of wrote.csv with published_in_edition.csv. Like
+    # author_published_in_edition, this holds the paper->edition map and the pair counts.
+    columns = edge_columns("published_in_edition.csv")
+    editions = pd.concat(list(_key_values(read_chunks(os.path.join(import_dir, "published_in_edition.csv"), columns,
+                                                      chunk_size), columns)) + [pd.DataFrame(columns=columns)],
+                         ignore_index=True).drop_duplicates()
+    counts = []
+    columns = edge_columns("wrote.csv")
+    for wrote in _key_values(read_chunks(os.path.join(import_dir, "wrote.csv"), columns, chunk_size), columns):
+        counts.append(wrote.merge(editions, on="paperid").groupby(["authorid", "editionid"]).size())
+    if not counts:
+        return pd.DataFrame(columns=["authorid", "editionid", "papers"])
+    return pd.concat(counts).groupby(level=[0, 1]).sum().astype(str).reset_index()
+
+
+def _compare(out_dir, filename, expected, header, columns, chunk_size):
+    # expected: frames of the source values of the given columns of the generated file
+    with open(header_file(out_dir, filename), newline="", encoding="utf-8") as f:
+        if next(csv.reader(f), None) != header:
+            return ["%s: unexpected header" % filename]
+    path = os.path.join(out_dir, filename)
+    chunks = pd.read_csv(path, header=None, dtype=str, keep_default_na=False,
+                         chunksize=chunk_size) if os.path.getsize(path) else []
+    actual = _digest(chunk[columns] for chunk in chunks)
+    wanted = _digest(expected)
+    if actual[0] != wanted[0]:
+        return ["%s: %d rows, expected %d" % (filename, actual[0], wanted[0])]
+    if actual != wanted:
+        return ["%s: IDs differ from the source CSVs" % filename]
+    return []
+
+
+def _digest(frames):
+    # (rows, sum of row hashes, sum of row hashes under a second key), the sums modulo 2**64
+    rows, first, second = 0, 0, 0
+    for frame in frames:
+        frame = frame.astype(str)
+        frame.columns = range(frame.shape[1])
+        rows += len(frame)
+        first += int(pd.util.hash_pandas_object(frame, index=False).to_numpy().sum(dtype=np.uint64))
+        second += int(pd.util.hash_pandas_object(frame, index=False, hash_key=SECOND_HASH_KEY).to_numpy().sum(
+            dtype=np.uint64))
+    return rows, first % 2 ** 64, second % 2 ** 64
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("import_dir", help="directory holding the CSV files read by PartA.2")
+    parser.add_argument("out_dir", help="directory to write the neo4j-admin import files to")
+    parser.add_argument("--verify", action="store_true", help="check existing files instead of writing them")
+    args = parser.parse_args()
+
+    if args.verify:
+        mismatches = verify_import_files(args.import_dir, args.out_dir)
+        for mismatch in mismatches:
+            print(mismatch)
+        print("%d file(s) differ from the source CSVs" % len(mismatches))
+        raise SystemExit(1 if mismatches else 0)
+    command = write_import_files(args.import_dir, args.out_dir)
+    print("\nStop the database and run:\n")
+    print(" \\\n    ".join(command))
@@ -0,0 +1,93 @@
+"""Results of the report queries, cached until the graph changes.
+
+Loaders set a new random epoch on the single GraphEpoch node whenever they
+change the graph, and cached results are keyed by (query, parameters, epoch),
+so a load invalidates every result computed before it and nothing else.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+MAX_ENTRIES = 256
+BUMP_EPOCH_QUERY = "MERGE (e:GraphEpoch) SET e.value = randomUUID();"
+READ_EPOCH_QUERY = "MATCH (e:GraphEpoch) RETURN e.value AS epoch"
+
+
+def cache_key(query, parameters, epoch):
+    text = repr((query, sorted(parameters.items()), epoch))
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class QueryCache:
+    # At most max_entries results (and max_bytes of JSON encoded rows, if given) are kept in
+    # memory, least recently used first out. With path, results are also written to a SQLite
+    # file bounded the same way and only readable by its owner, so other processes and later
+    # runs reuse them.
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=None, path=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = None
+        if path:
+            if not os.path.exists(path):
+                os.close(os.open(path, os.O_CREAT | os.O_WRONLY, 0o600))
+            self.connection = sqlite3.connect(path, check_same_thread=False)
+            with self.connection:
+                self.connection.execute(
+                    "CREATE TABLE IF NOT EXISTS reports (key TEXT PRIMARY KEY, rows BLOB, used REAL)")
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return json.loads(self.entries[key])
+            if self.connection is not None:
+                found = self.connection.execute("SELECT rows FROM reports WHERE key = ?", (key,)).fetchone()
+                if found is not None:
+                    with self.connection:
+                        self.connection.execute("UPDATE reports SET used = ? WHERE key = ?", (time.time(), key))
+                    self._remember(key, found[0])
+                    self.hits += 1
+                    return json.loads(found[0])
+            self.misses += 1
+            return None
+
+    def put(self, key, rows):
+        # rows: list of tuples of JSON values; they come back from get() as lists
+        data = json.dumps(rows, separators=(",", ":")).encode("utf-8")
+        with self.lock:
+            self._remember(key, data)
+            if self.connection is not None:
+                with self.connection:
+                    self.connection.execute("INSERT OR REPLACE INTO reports VALUES (?, ?, ?)", (key, data, time.time()))
+                    self.connection.execute(
+                        "DELETE FROM reports WHERE key NOT IN "
+                        "(SELECT key FROM reports ORDER BY used DESC LIMIT ?)", (self.max_entries,))
+                    if self.max_bytes is not None:
+                        # The most recently used results that fit in max_bytes together
+                        self.connection.execute(
+                            "DELETE FROM reports WHERE key IN (SELECT key FROM (SELECT key, "
+                            "sum(length(rows)) OVER (ORDER BY used DESC, rowid DESC) AS total FROM reports) "
+                            "WHERE total > ?)", (self.max_bytes,))
+
+    def _remember(self, key, data):
+        if key in self.entries:
+            self.size -= len(self.entries.pop(key))
+        self.entries[key] = data
+        self.size += len(data)
+        while self.entries and (len(self.entries) > self.max_entries
+                                or (self.max_bytes is not None and self.size > self.max_bytes)):
+            self.size -= len(self.entries.popitem(last=False)[1])
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
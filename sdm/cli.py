@@ -0,0 +1,119 @@
+"""Single entry point running any subset of the pipeline stages on one shared driver.
+
+    python -m sdm load enrich analytics recommender --batched --import-dir import/
+"""
+import argparse
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from sdm.app import BaseApp
+from sdm.cache import MAX_ENTRIES, QueryCache
+from sdm.config import load_config
+from sdm.driver import close_drivers, get_driver
+from sdm.metrics import LoadMetrics, ReadStats
+from sdm.parts import load_part
+
+# stage: [(part, App method)], run in this order
+STAGES = {
+    "load": [("A.2", None)],
+    "enrich": [("A.3", "add_reviews"), ("A.3", "add_affiliations")],
+    "analytics": [
+        ("B.1", "find_top3_papers_of_conference"),
+        ("B.2", "find_conference_communities"),
+        ("B.3", "find_journals_impact_factor"),
+        ("B.4", "find_h_indexes"),
+        ("C.1", "paper_similarity"),
+        ("C.2", "paper_similarity"),
+    ],
+    "recommender": [("D", "setup_recommender"), ("D", "recommend_reviewers"), ("D", "recommend_gurus")],
+}
+LOADERS = ["A.2", "A.3"]
+# Steps that don't depend on each other; with --fanout, consecutive ones run side by side
+INDEPENDENT = set(STAGES["analytics"]) | {("D", "recommend_reviewers"), ("D", "recommend_gurus")}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="sdm")
+    parser.add_argument("stages", nargs="*", metavar="stage",
+                        help="any of %s (default: all of them)" % ", ".join(STAGES))
+    parser.add_argument("--config", help="settings file (default: sdm.ini or $SDM_CONFIG)")
+    parser.add_argument("--log-level", default="INFO", help="level of the neo4j driver log")
+    parser.add_argument("--metrics-jsonl", help="append one JSON line per finished load step to this file")
+    parser.add_argument("--metrics-prom", help="write the load step metrics in Prometheus text format to this file")
+    parser.add_argument("--fanout", type=int, default=1,
+                        help="number of independent analytics queries run at the same time (default: 1)")
+    parser.add_argument("--cache-size", type=int, default=MAX_ENTRIES,
+                        help="report results kept in memory until the graph changes (default: %d)" % MAX_ENTRIES)
+    parser.add_argument("--cache-file", help="also keep report results in this SQLite file, across runs")
+    load_part("A.2").add_load_arguments(parser)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    unknown = set(args.stages) - set(STAGES)
+    if unknown:
+        parser.error("unknown stage(s): %s" % ", ".join(sorted(unknown)))
+    stages = [stage for stage in STAGES if stage in args.stages or not args.stages]
+    BaseApp.enable_log(getattr(logging, args.log_level.upper()), sys.stdout)
+    config = load_config(args.config)
+    metrics = LoadMetrics(args.metrics_jsonl, args.metrics_prom, args.import_dir)
+    read_stats = ReadStats()
+    cache = QueryCache(args.cache_size, path=args.cache_file)
+    # The loaders and the analytics use drivers of their own; the reads wait for the last load
+    # through the bookmarks they share
+    bookmarks = []
+    apps = {}
+    try:
+        for stage in stages:
+            for group in step_groups(STAGES[stage]):
+                for part, _ in group:
+                    if part not in apps:
+                        if part in LOADERS:
+                            apps[part] = load_part(part).App(driver=get_driver(config, "load"), metrics=metrics,
+                                                             bookmarks=bookmarks, config=config)
+                        else:
+                            apps[part] = load_part(part).App(driver=get_driver(config, "read"), read_stats=read_stats,
+                                                             cache=cache, bookmarks=bookmarks, config=config)
+                run_group(apps, group, args)
+    finally:
+        close_drivers()
+        cache.close()
+        metrics.close()
+    if metrics.steps:
+        metrics.report()
+    if read_stats.seconds:
+        read_stats.report()
+
+
+def step_groups(steps):
+    # Splits the steps of a stage into runs of consecutive independent steps and single other steps
+    groups = []
+    for step in steps:
+        if groups and step in INDEPENDENT and groups[-1][-1] in INDEPENDENT:
+            groups[-1].append(step)
+        else:
+            groups.append([step])
+    return groups
+
+
+def run_group(apps, group, args):
+    def run(step):
+        part, method = step
+        if method is None:
+            load_part(part).run_load(apps[part], args)
+        else:
+            getattr(apps[part], method)()
+
+    if args.fanout > 1 and len(group) > 1:
+        with ThreadPoolExecutor(max_workers=args.fanout) as executor:
+            list(executor.map(run, group))
+    else:
+        for step in group:
+            run(step)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""Connection settings shared by every script.
+
+Settings come from the defaults below, then the [neo4j] section of sdm.ini
+(or the file named by SDM_CONFIG), then SDM_<SETTING> environment variables.
+A missing sdm.ini is skipped; a missing file named by path or SDM_CONFIG is an error.
+"""
+import configparser
+import os
+
+CONFIG_FILE = "sdm.ini"
+
+DEFAULTS = {
+    "uri": "neo4j://localhost:7687",
+    "user": "neo4j",
+    "password": "sdm123",
+    "max_connection_pool_size": "50",
+    "connection_acquisition_timeout": "60",
+    "max_transaction_retry_time": "30",
+    "fetch_size": "1000",
+    "gds_heap_budget": "",
+}
+
+
+def load_config(path=None, **overrides):
+    config = dict(DEFAULTS)
+    parser = configparser.ConfigParser()
+    named = path or os.environ.get("SDM_CONFIG")
+    if named and not os.path.isfile(named):
+        raise FileNotFoundError("No config file %s" % named)
+    parser.read(named or CONFIG_FILE)
+    if parser.has_section("neo4j"):
+        config.update(parser["neo4j"])
+    for key in DEFAULTS:
+        value = os.environ.get("SDM_" + key.upper())
+        if value is not None:
+            config[key] = value
+    config.update((key, value) for key, value in overrides.items() if value is not None)
+    return config
@@ -0,0 +1,150 @@
+"""The CSV files of the Neo4j import directory and how they map onto the graph."""
+import csv
+import datetime
+
+BATCH_SIZE = 10000
+LIST_SEPARATOR = ";"
+
+# (csv file, label, {property: csv column})
+NODES = [
+    ("authors.csv", "Author", {"id": "_id", "name": "name"}),
+    ("editions.csv", "Edition", {"id": "_id", "name": "name", "number": "number", "city": "city"}),
+    ("journals.csv", "Journal", {"id": "_id", "name": "name"}),
+    ("keywords.csv", "Keyword", {"id": "_id", "keyword": "keyword"}),
+    ("papers.csv", "Paper", {"id": "_id", "title": "title", "language": "lang", "isbn": "isbn", "abstract": "abstract"}),
+    ("conferences.csv", "Conference", {"id": "_id", "name": "name"}),
+    ("volumes.csv", "Volume", {"id": "_id", "title": "title"}),
+    ("years.csv", "Year", {"year": "year"}),
+]
+
+# (csv file, relationship type, (start label, key, csv column), (end label, key, csv column))
+EDGES = [
+    ("wrote.csv", "Wrote", ("Author", "id", "authorid"), ("Paper", "id", "paperid")),
+    ("reviewed.csv", "Reviewed", ("Author", "id", "authorid"), ("Paper", "id", "paperid")),
+    ("corresponding.csv", "Corresponding", ("Author", "id", "authorid"), ("Paper", "id", "paperid")),
+    ("has_keyword.csv", "Has", ("Paper", "id", "paperid"), ("Keyword", "id", "keywordid")),
+    ("cites.csv", "Cites", ("Paper", "id", "paperid"), ("Paper", "id", "referenceid")),
+    ("has_edition.csv", "Has", ("Conference", "id", "conferenceid"), ("Edition", "id", "editionid")),
+    ("happened_in.csv", "Happened_in", ("Edition", "id", "editionid"), ("Year", "year", "year")),
+    ("volume_published_in_year.csv", "Published_in", ("Volume", "id", "volumeid"), ("Year", "year", "year")),
+    ("contains.csv", "Contains", ("Volume", "id", "volumeid"), ("Paper", "id", "paperid")),
+    ("has_volume.csv", "Has", ("Journal", "id", "journalid"), ("Volume", "id", "volumeid")),
+    ("published_in_edition.csv", "Published_in", ("Paper", "id", "paperid"), ("Edition", "id", "editionid")),
+]
+
+# label: (key property, index name)
+INDEXES = {
+    "Author": ("id", "authorid_index"),
+    "Edition": ("id", "editionid_index"),
+    "Journal": ("id", "journalid_index"),
+    "Keyword": ("id", "keywordid_index"),
+    "Paper": ("id", "paperid_index"),
+    "Conference": ("id", "conferenceid_index"),
+    "Volume": ("id", "volumeid_index"),
+    "Year": ("year", "year_index"),
+}
+
+
+# label: {property: type}; properties not listed are stored as strings
+TYPES = {
+    "Edition": {"number": "int"},
+    "Paper": {"isbn": "isbn"},
+    "Year": {"year": "int"},
+}
+
+
+def split_list(value):
+    return [item.strip() for item in value.split(LIST_SEPARATOR) if item.strip()]
+
+
+def normalize_isbn(value):
+    # ISBNs stay strings (leading zeros, check digit X) without separators
+    return value.replace("-", "").replace(" ", "").upper()
+
+
+# type: (conversion of a CSV field, the same conversion in Cypher, neo4j-admin import header type)
+CONVERSIONS = {
+    "int": (int, "toInteger(%s)", "int"),
+    "float": (float, "toFloat(%s)", "float"),
+    "date": (datetime.date.fromisoformat, "date(%s)", "date"),
+    "list": (split_list, "[item IN split(%s, ';') | trim(item)]", "string[]"),
+    "isbn": (normalize_isbn, "replace(replace(toUpper(%s), '-', ''), ' ', '')", "string"),
+}
+
+
+def property_types(label, properties):
+    return [TYPES.get(label, {}).get(prop) for prop in properties]
+
+
+def key_types(*endpoints):
+    # Types of the key properties edge rows are matched on, for (label, key, column) endpoints
+    return [TYPES.get(label, {}).get(key) for label, key, column in endpoints]
+
+
+def convert(value, value_type):
+    # Like toInteger() and friends, a field that does not parse becomes null
+    if value is None or value_type is None:
+        return value
+    try:
+        return CONVERSIONS[value_type][0](value)
+    except ValueError:
+        return None
+
+
+def cypher_value(expression, value_type):
+    return CONVERSIONS[value_type][1] % expression if value_type else expression
+
+
+def convert_rows(rows, types):
+    for row in rows:
+        yield [convert(value, value_type) for value, value_type in zip(row, types)]
+
+
+def convert_batches(batches, types):
+    for batch in batches:
+        yield list(convert_rows(batch, types))
+
+
+def iter_rows(path, columns, types=None):
+    # Streams the given columns of a CSV file; empty fields become None as with LOAD CSV
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            values = [row[column] or None for column in columns]
+            yield [convert(value, value_type) for value, value_type in zip(values, types)] if types else values
+
+
+def keyed_rows(rows, key_index, key_type=None):
+    # MERGE cannot take a null key, so rows whose key is empty or does not convert are left out
+    for row in rows:
+        if row[key_index] is not None and convert(row[key_index], key_type) is not None:
+            yield row
+
+
+def edge_rows(path, columns, types=None):
+    # LOAD CSV would not MATCH a missing endpoint, so such rows are left out
+    for row in iter_rows(path, columns, types):
+        if row[0] is not None and row[1] is not None:
+            yield row
+
+
+def read_batches(path, columns, batch_size=BATCH_SIZE, types=None):
+    # Keeps at most one batch of projected rows in memory
+    return batched(iter_rows(path, columns, types), batch_size)
+
+
+def batched(rows, batch_size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def edge_columns(filename):
+    for name, rel_type, start, end in EDGES:
+        if name == filename:
+            return [start[2], end[2]]
+    raise KeyError(filename)
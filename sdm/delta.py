@@ -0,0 +1,96 @@
+"""Per-row fingerprints of the import CSVs, used to load only what changed since the last load."""
+import hashlib
+import json
+import sqlite3
+
+from sdm.dataset import BATCH_SIZE, batched
+
+MANIFEST = "load_manifest.sqlite"
+KEY_SEPARATOR = "\x1f"
+
+
+class Manifest:
+    # The applied table holds the (key, hash) of every row of the last successful load of each
+    # file, and the files table the files committed so far, empty ones included. A new version
+    # of a file is staged next to it and diffed in SQL, so memory stays bounded by the batch
+    # size whatever the size of the files.
+
+    def __init__(self, path=MANIFEST):
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(
+            "CREATE TABLE IF NOT EXISTS applied ("
+            "file TEXT, key TEXT, hash TEXT, PRIMARY KEY (file, key)) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS files (file TEXT PRIMARY KEY, fingerprint TEXT);"
+            "CREATE TEMP TABLE staged ("
+            "file TEXT, key TEXT, hash TEXT, row TEXT, PRIMARY KEY (file, key)) WITHOUT ROWID;"
+        )
+
+    def close(self):
+        self.connection.close()
+
+    def stage(self, filename, rows, key_indexes):
+        # Nodes are keyed by their id column, edges by their endpoint pair
+        self.connection.execute("DELETE FROM staged WHERE file = ?", (filename,))
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO staged VALUES (?, ?, ?, ?)",
+            (self._fingerprint(filename, row, key_indexes) for row in rows))
+
+    @staticmethod
+    def _fingerprint(filename, row, key_indexes):
+        key = KEY_SEPARATOR.join(row[i] or "" for i in key_indexes)
+        encoded = json.dumps(row)
+        return filename, key, hashlib.blake2b(encoded.encode("utf-8"), digest_size=8).hexdigest(), encoded
+
+    def upserts(self, filename, batch_size=BATCH_SIZE, with_key=False):
+        # Rows that are new or whose content changed since the last load; with_key, each row
+        # ends with its key, to pass back to unstage()
+        cursor = self.connection.execute(
+            "SELECT s.row, s.key FROM staged s LEFT JOIN applied a ON a.file = s.file AND a.key = s.key "
+            "WHERE s.file = ? AND a.hash IS NOT s.hash", (filename,))
+        return batched((json.loads(row) + [key] if with_key else json.loads(row) for row, key in cursor), batch_size)
+
+    def unstage(self, filename, keys):
+        # Leaves staged rows out of the next commit, e.g. edges whose endpoints are not loaded
+        # yet, so that the next load tries them again
+        self.connection.executemany("DELETE FROM staged WHERE file = ? AND key = ?",
+                                    ((filename, key) for key in keys))
+
+    def deletes(self, filename, batch_size=BATCH_SIZE):
+        # Keys of rows that were loaded last time but are gone now
+        cursor = self.connection.execute(
+            "SELECT a.key FROM applied a LEFT JOIN staged s ON s.file = a.file AND s.key = a.key "
+            "WHERE a.file = ? AND s.key IS NULL", (filename,))
+        return batched((key.split(KEY_SEPARATOR) for key, in cursor), batch_size)
+
+    def has_applied(self, filename):
+        # Manifests written before the files table only know the files with applied rows
+        return (self.connection.execute("SELECT 1 FROM files WHERE file = ?", (filename,)).fetchone() is not None
+                or self.connection.execute("SELECT 1 FROM applied WHERE file = ? LIMIT 1", (filename,)).fetchone()
+                is not None)
+
+    def changed_keys(self, filename):
+        # Keys of the upserts and deletes of a staged file, as tuples
+        cursor = self.connection.execute(
+            "SELECT s.key FROM staged s LEFT JOIN applied a ON a.file = s.file AND a.key = s.key "
+            "WHERE s.file = ? AND a.hash IS NOT s.hash "
+            "UNION ALL "
+            "SELECT a.key FROM applied a LEFT JOIN staged s ON s.file = a.file AND s.key = a.key "
+            "WHERE a.file = ? AND s.key IS NULL", (filename, filename))
+        return (tuple(key.split(KEY_SEPARATOR)) for key, in cursor)
+
+    def commit(self, filename):
+        with self.connection:
+            self.connection.execute("DELETE FROM applied WHERE file = ?", (filename,))
+            self.connection.execute(
+                "INSERT INTO applied SELECT file, key, hash FROM staged WHERE file = ?", (filename,))
+            self.connection.execute("DELETE FROM staged WHERE file = ?", (filename,))
+            self.connection.execute("INSERT OR REPLACE INTO files VALUES (?, ?)",
+                                    (filename, self._file_fingerprint(filename)))
+
+    def _file_fingerprint(self, filename):
+        # Digest of the applied (key, hash) pairs of a file, in key order
+        digest = hashlib.blake2b(digest_size=8)
+        for key, row_hash in self.connection.execute(
+                "SELECT key, hash FROM applied WHERE file = ? ORDER BY key", (filename,)):
+            digest.update(("%s\x1e%s\x1f" % (key, row_hash)).encode("utf-8"))
+        return digest.hexdigest()
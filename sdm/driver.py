@@ -0,0 +1,38 @@
+"""One pooled driver per configured server, shared by all scripts of a process."""
+import threading
+
+from neo4j import GraphDatabase
+
+from sdm.config import load_config
+
+_drivers = {}
+_lock = threading.Lock()
+
+
+def create_driver(config):
+    return GraphDatabase.driver(
+        config["uri"],
+        auth=(config["user"], config["password"]),
+        max_connection_pool_size=int(config["max_connection_pool_size"]),
+        connection_acquisition_timeout=float(config["connection_acquisition_timeout"]),
+        max_transaction_retry_time=float(config["max_transaction_retry_time"]),
+        fetch_size=int(config["fetch_size"]),
+    )
+
+
+def get_driver(config=None, pool="default"):
+    # Reuses the warm connection pool of an earlier call with the same server, user and pool
+    # name; loads and analytics ask for different pools so neither can starve the other.
+    config = config or load_config()
+    key = (config["uri"], config["user"], pool)
+    with _lock:
+        if key not in _drivers:
+            _drivers[key] = create_driver(config)
+        return _drivers[key]
+
+
+def close_drivers():
+    with _lock:
+        for driver in _drivers.values():
+            driver.close()
+        _drivers.clear()
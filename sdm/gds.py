@@ -0,0 +1,102 @@
+"""In-memory GDS projections named after their spec and the graph epoch.
+
+A projection is reused for as long as its spec and the graph epoch (see
+sdm.cache) are unchanged. After a load, the next ensure() drops the stale
+projections of the same spec and builds a new one. Before building, the
+.estimate procedure is called and the projection is refused if its upper
+estimate exceeds the heap budget (setting gds_heap_budget, e.g. 8g), which the
+Apps pass from their configuration. Builds and drops are logged to sdm.gds.
+"""
+import hashlib
+import json
+import logging
+import time
+from collections import namedtuple
+
+from sdm.cache import READ_EPOCH_QUERY
+
+# procedure: gds.graph.create (label and type projections) or gds.graph.create.cypher (queries)
+Projection = namedtuple("Projection", ["procedure", "nodes", "relationships", "configuration"])
+UNITS = {"k": 2 ** 10, "m": 2 ** 20, "g": 2 ** 30, "t": 2 ** 40}
+
+logger = logging.getLogger(__name__)
+
+
+def native(nodes, relationships, **configuration):
+    return Projection("gds.graph.create", nodes, relationships, configuration)
+
+
+def cypher(node_query, relationship_query, **configuration):
+    return Projection("gds.graph.create.cypher", node_query, relationship_query, configuration)
+
+
+def parse_bytes(value):
+    # "8g" -> 8589934592; empty means no budget
+    value = str(value or "").strip().lower()
+    if not value:
+        return None
+    if value[-1] in UNITS:
+        return int(float(value[:-1]) * UNITS[value[-1]])
+    return int(value)
+
+
+def spec_key(spec):
+    text = json.dumps(list(spec), sort_keys=True)
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=4).hexdigest()
+
+
+class ProjectionManager:
+    # Projections live in the memory of one server, so everything here runs on the leader,
+    # and the App's queries on a projection must be sent there too (WRITE_ACCESS).
+    # heap_budget: "8g", a number of bytes, or None or "" for no budget.
+
+    def __init__(self, driver, heap_budget=None):
+        self.driver = driver
+        self.heap_budget = parse_bytes(heap_budget)
+
+    def ensure(self, prefix, spec):
+        # Returns the name of an up to date projection of spec, building it if needed
+        with self.driver.session() as session:
+            record = session.run(READ_EPOCH_QUERY).single()
+            epoch = record["epoch"] if record is not None else None
+            base = "%s_%s" % (prefix, spec_key(spec))
+            name = "%s_%s" % (base, spec_key([epoch]))
+            existing = [row["graphName"] for row in session.run("CALL gds.graph.list() YIELD graphName")]
+            if name in existing:
+                return name
+            for stale in existing:
+                if stale.startswith(base + "_"):
+                    session.run("CALL gds.graph.drop($name) YIELD graphName", name=stale).consume()
+                    logger.info("Dropped stale projection %s", stale)
+            self._check_estimate(session, name, spec)
+            self._build(session, name, spec)
+        return name
+
+    def drop(self, prefix):
+        # Drops every projection made for prefix, whatever its spec or epoch
+        with self.driver.session() as session:
+            for row in list(session.run("CALL gds.graph.list() YIELD graphName")):
+                if row["graphName"].startswith(prefix + "_"):
+                    session.run("CALL gds.graph.drop($name) YIELD graphName", name=row["graphName"]).consume()
+
+    def _check_estimate(self, session, name, spec):
+        if self.heap_budget is None:
+            return
+        estimate = session.run(
+            "CALL %s.estimate($nodes, $relationships, $configuration) "
+            "YIELD requiredMemory, bytesMax" % spec.procedure,
+            nodes=spec.nodes, relationships=spec.relationships, configuration=spec.configuration).single()
+        if estimate["bytesMax"] > self.heap_budget:
+            raise ValueError("Projection %s needs up to %s (%d bytes), over the heap budget of %d bytes"
+                             % (name, estimate["requiredMemory"], estimate["bytesMax"], self.heap_budget))
+
+    def _build(self, session, name, spec):
+        start = time.time()
+        created = session.run(
+            "CALL %s($name, $nodes, $relationships, $configuration) "
+            "YIELD nodeCount, relationshipCount" % spec.procedure,
+            name=name, nodes=spec.nodes, relationships=spec.relationships, configuration=spec.configuration).single()
+        seconds = time.time() - start
+        memory = session.run("CALL gds.graph.list($name) YIELD memoryUsage", name=name).single()["memoryUsage"]
+        logger.info("Projection %s built in %.1fs: %d nodes, %d relationships, %s",
+                    name, seconds, created["nodeCount"], created["relationshipCount"], memory)
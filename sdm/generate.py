@@ -0,0 +1,279 @@
+"""Synthetic bibliography with the CSV files and columns PartA.2 and PartA.3 read.
+
+Sizes grow linearly with the scale factor. Citations, authorship and keywords
+are Zipf distributed, conferences have several yearly editions and journals
+several yearly volumes. Papers are generated in chunks and every file is
+appended to per chunk, so memory stays flat whatever the scale. Chunks can be
+rendered by several processes; the output only depends on the seed and the scale.
+
+    python -m sdm.generate /var/lib/neo4j/import --scale 10 --seed 0 --workers 8
+"""
+import argparse
+import csv
+import math
+import os
+import re
+from collections import deque
+from multiprocessing import Pool
+
+import numpy as np
+
+from sdm.dataset import EDGES, NODES
+
+CHUNK_PAPERS = 100000
+# Chunks rendered but not yet written, per worker
+CHUNKS_IN_FLIGHT = 2
+# The %d, %0<width>d and %s fields of write lines
+FIELD = re.compile(r"%(0\d+)?([ds])")
+FIRST_YEAR, LAST_YEAR = 2000, 2021
+# Counts at scale 1
+AUTHORS = 10000
+PAPERS = 20000
+KEYWORDS = 500
+CONFERENCES = 50
+JOURNALS = 50
+AFFILIATIONS = 1000
+# The keywords PartD puts in the database community come first, so they are the most used
+KEYWORD_NAMES = ["data management", "database index", "data modeling", "big data", "data processing",
+                 "data store", "database querying", "graph databases", "machine learning", "information retrieval"]
+LANGUAGES = ["en", "en", "en", "en", "es", "de", "fr", "zh"]
+CITIES = ["Barcelona", "Brussels", "Berlin", "Lyon", "Portland", "Seoul", "Cape Town", "Tokyo"]
+DECISIONS = ["accept", "accept", "minor revision", "major revision", "reject"]
+EXTRA_FILES = {
+    "reviewed_v2.csv": ["authorid", "paperid", "review", "suggested_decision"],
+    "affiliation.csv": ["_id", "name"],
+    "affiliated.csv": ["authorid", "affiliationid"],
+}
+
+
+def scatter(ranks, n, salt):
+    # Spreads Zipf ranks over the ids with a fixed bijection of range(n), so the popular
+    # items are not simply the first ids, without holding a permutation of n in memory
+    factor = 2654435761 % n if n > 1 else 1
+    while math.gcd(factor, n) != 1:
+        factor += 1
+    return (ranks * factor + salt) % n
+
+
+def zipf_ids(rng, n, size, exponent, salt=None):
+    # Without salt, id 0 is the most frequent, then id 1, ...
+    ranks = (rng.zipf(exponent, size) - 1) % n
+    return ranks if salt is None else scatter(ranks, n, salt)
+
+
+def digit_bytes(values, width=0):
+    # The decimal digits of the values, right aligned, and the ones in use: those of the value
+    # and the zeros padding it to width, as with %0<width>d
+    values = np.asarray(values, dtype=np.uint64)
+    digits = max(width, len(str(int(values.max(initial=0)))))
+    matrix = np.empty((len(values), digits), dtype=np.uint8)
+    rest = values
+    for position in range(digits - 1, -1, -1):
+        rest, matrix[:, position] = np.divmod(rest, np.uint64(10))
+    used = np.maximum((values[:, None] >= 10 ** np.arange(1, digits, dtype=np.uint64)).sum(axis=1) + 1, width)
+    return matrix + ord("0"), np.arange(digits) >= digits - used[:, None]
+
+
+def utf8_bytes(values):
+    # The UTF-8 bytes of the strings, left aligned, and the ones in use. ASCII strings are taken
+    # straight from the code points of a NumPy string array.
+    values = np.asarray(values, dtype=str)
+    points = values.view(np.uint32).reshape(len(values), values.dtype.itemsize // 4)
+    if points.max(initial=0) < 128:
+        return points.astype(np.uint8), points != 0
+    matrix = np.char.encode(values, "utf-8")
+    matrix = matrix.view(np.uint8).reshape(len(matrix), matrix.dtype.itemsize)
+    return matrix, matrix != 0
+
+
+def literal_bytes(text, rows):
+    matrix = np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+    return np.broadcast_to(matrix, (rows, len(matrix))), np.ones((rows, len(matrix)), dtype=bool)
+
+
+class Generator:
+
+    def __init__(self, out_dir, scale=1.0, seed=0):
+        self.out_dir = out_dir
+        self.scale = scale
+        self.seed = seed
+        self.counts = {}
+        self.authors = max(1, int(AUTHORS * scale))
+        self.papers = max(1, int(PAPERS * scale))
+        self.keywords = max(len(KEYWORD_NAMES), int(KEYWORDS * scale))
+        self.conferences = max(1, int(CONFERENCES * scale))
+        self.journals = max(1, int(JOURNALS * scale))
+        self.affiliations = max(1, int(AFFILIATIONS * scale))
+
+    def rng(self, *stream):
+        # An independent generator per file and chunk, so every file is reproducible on its own
+        return np.random.default_rng([self.seed] + list(stream))
+
+    def open(self, filename, header):
+        f = open(os.path.join(self.out_dir, filename), "w", newline="", encoding="utf-8")
+        csv.writer(f).writerow(header)
+        self.counts[filename] = 0
+        return f
+
+    @staticmethod
+    def write(out, filename, line, *columns):
+        # Renders the %-format line for every position of the columns (arrays or lists) into
+        # out[filename] with whole-column NumPy operations: every part of the line becomes a
+        # rows x width byte matrix and a mask of the bytes in use, and the masked bytes of the
+        # matrices side by side are the text, row after row. Generated values are non-negative
+        # numbers or strings without commas, quotes, newlines or NUL characters.
+        parts = FIELD.split(line)
+        rows = len(columns[0])
+        matrices = [literal_bytes(parts[0], rows)]
+        for column, width, kind, literal in zip(columns, parts[1::3], parts[2::3], parts[3::3]):
+            matrices.append(digit_bytes(column, int(width or 0)) if kind == "d" else utf8_bytes(column))
+            matrices.append(literal_bytes(literal, rows))
+        text = np.hstack([matrix for matrix, used in matrices])[np.hstack([used for matrix, used in matrices])]
+        out.setdefault(filename, []).append((text.tobytes().decode("utf-8"), rows))
+
+    def flush(self, files, out):
+        for filename, parts in out.items():
+            for text, rows in parts:
+                files[filename].write(text)
+                self.counts[filename] += rows
+
+    def generate(self, workers=1):
+        os.makedirs(self.out_dir, exist_ok=True)
+        headers = {filename: list(properties.values()) for filename, label, properties in NODES}
+        headers.update((filename, [start[2], end[2]]) for filename, rel_type, start, end in EDGES)
+        headers.update(EXTRA_FILES)
+        files = {filename: self.open(filename, header) for filename, header in headers.items()}
+        try:
+            out = {}
+            self.write_venues(out)
+            self.write_people(files, out)
+            self.flush(files, out)
+            chunks = [(chunk, first, min(first + CHUNK_PAPERS, self.papers))
+                      for chunk, first in enumerate(range(0, self.papers, CHUNK_PAPERS))]
+            if workers > 1:
+                # At most CHUNKS_IN_FLIGHT chunks per worker wait to be written, in order, so a
+                # slow disk does not pile up rendered chunks in memory
+                with Pool(workers) as pool:
+                    pending = deque()
+                    for chunk in chunks:
+                        if len(pending) >= CHUNKS_IN_FLIGHT * workers:
+                            self.flush(files, pending.popleft().get())
+                        pending.append(pool.apply_async(self.paper_chunk, (chunk,)))
+                    while pending:
+                        self.flush(files, pending.popleft().get())
+            else:
+                for chunk in chunks:
+                    self.flush(files, self.paper_chunk(chunk))
+        finally:
+            for f in files.values():
+                f.close()
+        return self.counts
+
+    def write_venues(self, out):
+        years = np.arange(FIRST_YEAR, LAST_YEAR + 1)
+        self.write(out, "years.csv", "%d\n", years)
+        span = len(years)
+
+        # Conferences with 1 + Poisson(4) consecutive yearly editions
+        rng = self.rng(1)
+        editions = np.minimum(1 + rng.poisson(4, self.conferences), span)
+        starts = rng.integers(0, span - editions + 1)
+        conference = np.repeat(np.arange(self.conferences), editions)
+        number = np.arange(len(conference)) - np.repeat(np.cumsum(editions) - editions, editions) + 1
+        edition_ids = np.arange(len(conference))
+        self.edition_years = years[np.repeat(starts, editions) + number - 1]
+        conferences = np.arange(self.conferences)
+        self.write(out, "conferences.csv", "c%d,Conference %d\n", conferences, conferences)
+        self.write(out, "editions.csv", "e%d,Conference %d edition %d,%d,%s\n", edition_ids, conference, number,
+                   number, np.array(CITIES)[rng.integers(0, len(CITIES), len(conference))])
+        self.write(out, "has_edition.csv", "c%d,e%d\n", conference, edition_ids)
+        self.write(out, "happened_in.csv", "e%d,%d\n", edition_ids, self.edition_years)
+
+        # Journals with 1 + Poisson(6) consecutive yearly volumes
+        rng = self.rng(2)
+        volumes = np.minimum(1 + rng.poisson(6, self.journals), span)
+        starts = rng.integers(0, span - volumes + 1)
+        journal = np.repeat(np.arange(self.journals), volumes)
+        number = np.arange(len(journal)) - np.repeat(np.cumsum(volumes) - volumes, volumes) + 1
+        volume_ids = np.arange(len(journal))
+        self.volume_years = years[np.repeat(starts, volumes) + number - 1]
+        journals = np.arange(self.journals)
+        self.write(out, "journals.csv", "j%d,Journal %d\n", journals, journals)
+        self.write(out, "volumes.csv", "v%d,Journal %d volume %d\n", volume_ids, journal, number)
+        self.write(out, "has_volume.csv", "j%d,v%d\n", journal, volume_ids)
+        self.write(out, "volume_published_in_year.csv", "v%d,%d\n", volume_ids, self.volume_years)
+
+    def write_people(self, files, out):
+        rng = self.rng(3)
+        names = KEYWORD_NAMES + ["keyword %d" % i for i in range(len(KEYWORD_NAMES), self.keywords)]
+        self.write(out, "keywords.csv", "k%d,%s\n", np.arange(self.keywords), names)
+        affiliations = np.arange(self.affiliations)
+        self.write(out, "affiliation.csv", "f%d,Affiliation %d\n", affiliations, affiliations)
+        for first in range(0, self.authors, CHUNK_PAPERS):
+            ids = np.arange(first, min(first + CHUNK_PAPERS, self.authors))
+            self.write(out, "authors.csv", "a%d,Author %d\n", ids, ids)
+            self.write(out, "affiliated.csv", "a%d,f%d\n", ids, zipf_ids(rng, self.affiliations, len(ids), 1.5, 11))
+            self.flush(files, out)
+            out.clear()
+
+    def paper_chunk(self, bounds):
+        # The rows of every paper file for papers first to end - 1, by file name
+        chunk, first, end = bounds
+        out = {}
+        rng = self.rng(4, chunk)
+        ids = np.arange(first, end)
+        n = len(ids)
+        self.write(out, "papers.csv", "p%d,Paper %d,%s,978-%010d,Abstract of paper %d\n", ids, ids,
+                   np.array(LANGUAGES)[rng.integers(0, len(LANGUAGES), n)], ids, ids)
+
+        # 60% in a conference edition, the rest in a journal volume
+        in_conference = rng.random(n) < 0.6
+        self.write(out, "published_in_edition.csv", "p%d,e%d\n", ids[in_conference],
+                   rng.integers(0, len(self.edition_years), in_conference.sum()))
+        self.write(out, "contains.csv", "v%d,p%d\n",
+                   rng.integers(0, len(self.volume_years), n - in_conference.sum()), ids[~in_conference])
+
+        # 1-8 authors per paper, prolific authors by Zipf; the first one is the corresponding author
+        papers, authors = self.pairs(rng, ids, 1 + np.minimum(rng.poisson(2, n), 7), self.authors, 1.6, 3)
+        self.write(out, "wrote.csv", "a%d,p%d\n", authors, papers)
+        firsts = np.r_[True, papers[1:] != papers[:-1]]
+        self.write(out, "corresponding.csv", "a%d,p%d\n", authors[firsts], papers[firsts])
+
+        # Three reviewers per paper, the reviews of PartA.3 on the same pairs
+        papers, reviewers = self.pairs(rng, ids, np.full(n, 3), self.authors, 1.3, 5)
+        self.write(out, "reviewed.csv", "a%d,p%d\n", reviewers, papers)
+        decisions = np.array(DECISIONS)[rng.integers(0, len(DECISIONS), len(papers))]
+        self.write(out, "reviewed_v2.csv", "a%d,p%d,Review %d of paper %d,%s\n",
+                   reviewers, papers, reviewers, papers, decisions)
+
+        papers, keywords = self.pairs(rng, ids, 1 + rng.poisson(2, n), self.keywords, 1.4)
+        self.write(out, "has_keyword.csv", "p%d,k%d\n", papers, keywords)
+
+        # Power-law citations: Zipf popular references, Poisson(9) references per paper
+        papers, references = self.pairs(rng, ids, rng.poisson(9, n), self.papers, 1.8, 7)
+        keep = papers != references
+        self.write(out, "cites.csv", "p%d,p%d\n", papers[keep], references[keep])
+        return out
+
+    @staticmethod
+    def pairs(rng, ids, degrees, n, exponent, salt=None):
+        # degrees[i] Zipf distributed targets for ids[i], without duplicate pairs, by id
+        sources = np.repeat(ids, degrees)
+        targets = zipf_ids(rng, n, len(sources), exponent, salt)
+        pairs = np.unique(np.stack([sources, targets], axis=1), axis=0)
+        return pairs[:, 0], pairs[:, 1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("out_dir", help="directory to write the CSV files to, e.g. the Neo4j import directory")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="scale factor; 1 is %d authors and %d papers" % (AUTHORS, PAPERS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1, help="processes rendering chunks of papers")
+    args = parser.parse_args()
+
+    counts = Generator(args.out_dir, args.scale, args.seed).generate(args.workers)
+    for filename, rows in sorted(counts.items()):
+        print("%-32s %12d rows" % (filename, rows))
+    print("Total: %d rows" % sum(counts.values()))
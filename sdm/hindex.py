@@ -0,0 +1,113 @@
+"""Vectorized h-index of every author from streamed (author, paper, citations) rows.
+
+Rows are processed in chunks of whole authors, each sorted group-wise with NumPy,
+so memory stays bounded by the chunk size whatever the number of authors.
+
+    python -m sdm.hindex --authors 100000 --papers 20
+"""
+import argparse
+import time
+from itertools import islice
+from operator import itemgetter
+
+import numpy as np
+
+CHUNK_SIZE = 100000
+
+
+def h_indexes(authors, citations):
+    # authors: integer code of the author of every row; citations: citation count of the paper.
+    # Returns the distinct author codes and their h-index: within each author the counts are
+    # sorted descending, and h is the number of ranks i with at least i citations.
+    authors = np.asarray(authors, dtype=np.int64)
+    citations = np.asarray(citations, dtype=np.int64)
+    if not len(authors):
+        return authors, np.empty(0, dtype=np.int64)
+    order = np.lexsort((-citations, authors))
+    authors, citations = authors[order], citations[order]
+    starts = np.flatnonzero(np.r_[True, authors[1:] != authors[:-1]])
+    sizes = np.diff(np.r_[starts, len(authors)])
+    ranks = np.arange(len(authors)) - np.repeat(starts, sizes) + 1
+    return authors[starts], np.add.reduceat((citations >= ranks).astype(np.int64), starts)
+
+
+def stream_h_indexes(rows, chunk_size=CHUNK_SIZE):
+    # rows: (author, paper, citations) with all rows of an author next to each other, e.g.
+    # ordered by author. Yields (author, h_index); an author without papers comes as a single
+    # row with 0 citations. Rows are taken chunk_size at a time and grouped by author with
+    # NumPy; the rows of the last author of a chunk wait for the next chunk.
+    rows = iter(rows)
+    pending = []
+    while True:
+        chunk = pending + list(islice(rows, chunk_size))
+        done = len(chunk) < len(pending) + chunk_size
+        if not chunk:
+            return
+        authors = np.array(list(map(itemgetter(0), chunk)), dtype=object)
+        citations = list(map(itemgetter(2), chunk))
+        starts = np.flatnonzero(np.r_[True, authors[1:] != authors[:-1]])
+        end = len(chunk) if done else starts[-1]
+        pending = chunk[end:]
+        if end:
+            yield from _chunk_h_indexes(authors[:end], starts[starts < end], citations[:end])
+        if done:
+            return
+
+
+def _chunk_h_indexes(authors, starts, citations):
+    citations = np.array(citations, dtype=object)
+    citations[np.equal(citations, None)] = 0
+    codes = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(authors)]))
+    found, h = h_indexes(codes, citations.astype(np.int64))
+    return zip(authors[starts[found]].tolist(), h.tolist())
+
+
+def reference_h_indexes(rows):
+    # Per-author sort and scan, the way the Cypher query of PartB.4 computes it
+    papers = {}
+    for author, paper, count in rows:
+        papers.setdefault(author, []).append(count or 0)
+    result = {}
+    for author, counts in papers.items():
+        counts.sort(reverse=True)
+        result[author] = sum(1 for i, count in enumerate(counts, 1) if count >= i)
+    return result
+
+
+def generate_rows(authors, papers, seed=0):
+    # Authors with a Poisson number of papers and Zipf distributed citations, ordered by author
+    rng = np.random.default_rng(seed)
+    counts = rng.poisson(papers, authors)
+    author_ids = np.repeat(np.arange(authors), counts)
+    citations = np.minimum(rng.zipf(1.8, len(author_ids)) - 1, 10000)
+    return [("a%d" % author, "p%d" % i, int(count))
+            for i, (author, count) in enumerate(zip(author_ids.tolist(), citations.tolist()))]
+
+
+def benchmark(authors, papers, chunk_size=CHUNK_SIZE, seed=0):
+    rows = generate_rows(authors, papers, seed)
+    start = time.perf_counter()
+    vectorized = dict(stream_h_indexes(iter(rows), chunk_size))
+    vectorized_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    reference = reference_h_indexes(rows)
+    reference_seconds = time.perf_counter() - start
+    return {
+        "rows": len(rows),
+        "authors": len(reference),
+        "vectorized_seconds": round(vectorized_seconds, 3),
+        "reference_seconds": round(reference_seconds, 3),
+        "equal": vectorized == reference,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark the vectorized h-index on generated rows")
+    parser.add_argument("--authors", type=int, default=100000)
+    parser.add_argument("--papers", type=float, default=20, help="mean number of papers per author")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for key, value in benchmark(args.authors, args.papers, args.chunk_size, args.seed).items():
+        print("%s: %s" % (key, value))
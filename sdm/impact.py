@@ -0,0 +1,48 @@
+"""Impact factors of every journal and year, from the citation counts stored on the papers.
+
+The impact factor of a journal in year Y is the number of citations received in Y by the
+papers it published in the WINDOW years before Y, divided by the number of those papers.
+"""
+from collections import defaultdict
+
+WINDOW = 2
+
+
+def journal_year_stats(papers):
+    # papers: (journal, volume year, citation_years, citations_per_year) once per paper, as
+    # stored by PartA.2 load_citation_stats. Returns {(journal, year): [papers, {citing year: citations}]}.
+    stats = defaultdict(lambda: [0, defaultdict(int)])
+    for journal, year, citation_years, citations_per_year in papers:
+        entry = stats[journal, year]
+        entry[0] += 1
+        for citing_year, citations in zip(citation_years or [], citations_per_year or []):
+            entry[1][citing_year] += citations
+    return stats
+
+
+def impact_factor(stats, journal, year, window=WINDOW):
+    papers = citations = 0
+    for published in range(year - window, year):
+        if (journal, published) in stats:
+            papers += stats[journal, published][0]
+            citations += stats[journal, published][1].get(year, 0)
+    return citations / papers if papers else None
+
+
+def journal_year_rows(papers, window=WINDOW):
+    # One row per journal: [journal, [[year, papers, citation_years, citations_per_year, impact factor], ...]]
+    # with a year for every volume year and the window years after it.
+    stats = journal_year_stats(papers)
+    years = defaultdict(set)
+    for journal, year in stats:
+        years[journal].update(range(year, year + window + 1))
+    rows = []
+    for journal in sorted(years):
+        table = []
+        for year in sorted(years[journal]):
+            papers, citations = stats.get((journal, year), (0, {}))
+            citing_years = sorted(citations)
+            table.append([year, papers, citing_years, [citations[citing] for citing in citing_years],
+                          impact_factor(stats, journal, year, window)])
+        rows.append([journal, table])
+    return rows
@@ -0,0 +1,121 @@
+"""Wall time, row counts and server counters of the load steps, and latencies of the reads."""
+import csv
+import json
+import os
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+COUNTERS = ["nodes_created", "nodes_deleted", "relationships_created", "relationships_deleted", "properties_set"]
+
+
+def count_rows(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return sum(1 for _ in csv.DictReader(f))
+
+
+class LoadMetrics:
+    # Every recorded step is appended to jsonl_path as it finishes; report() prints the
+    # summary table and writes all steps as Prometheus gauges to prometheus_path. The CSV
+    # file of a step is counted once, in a thread started with count() while the server loads
+    # it; close() stops the counts still running.
+
+    def __init__(self, jsonl_path=None, prometheus_path=None, import_dir=None):
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self.import_dir = import_dir
+        self.steps = []
+        self.lock = threading.Lock()
+        self.row_counts = {}
+        self.counter = None
+
+    def count(self, filename):
+        # Starts counting the records of a CSV file of import_dir, if it is there and not counted yet
+        path = os.path.join(self.import_dir or "", filename or "")
+        with self.lock:
+            if not self.import_dir or not filename or filename in self.row_counts or not os.path.isfile(path):
+                return
+            if self.counter is None:
+                self.counter = ThreadPoolExecutor(1)
+            self.row_counts[filename] = self.counter.submit(count_rows, path)
+
+    def record(self, step, seconds, summaries=(), rows=None, filename=None):
+        # Rows read default to the record count of the step's CSV file when it is available locally
+        if rows is None and filename:
+            self.count(filename)
+            if filename in self.row_counts:
+                rows = self.row_counts[filename].result()
+        entry = {
+            "step": step,
+            "seconds": round(seconds, 3),
+            "rows": rows,
+            "rows_per_second": round(rows / seconds, 1) if rows and seconds else None,
+        }
+        for counter in COUNTERS:
+            entry[counter] = sum(getattr(summary.counters, counter) for summary in summaries if summary is not None)
+        with self.lock:
+            self.steps.append(entry)
+            if self.jsonl_path:
+                with open(self.jsonl_path, "a") as f:
+                    f.write(json.dumps(entry) + "\n")
+        return entry
+
+    def close(self):
+        if self.counter is not None:
+            self.counter.shutdown(wait=False, cancel_futures=True)
+
+    def report(self):
+        columns = ["step", "seconds", "rows", "rows_per_second"] + COUNTERS
+        table = [columns] + [["" if step[c] is None else str(step[c]) for c in columns] for step in self.steps]
+        widths = [max(len(row[i]) for row in table) for i in range(len(columns))]
+        print()
+        for row in table:
+            print("  ".join(value.ljust(width) for value, width in zip(row, widths)))
+        print("Total: %.1fs over %d steps" % (sum(step["seconds"] for step in self.steps), len(self.steps)))
+        if self.prometheus_path:
+            self.write_prometheus(self.prometheus_path)
+
+    def write_prometheus(self, path):
+        lines = []
+        for metric in ["seconds", "rows", "rows_per_second"] + COUNTERS:
+            name = "sdm_load_step_" + metric
+            lines.append("# TYPE %s gauge" % name)
+            for step in self.steps:
+                if step[metric] is not None:
+                    label = step["step"].replace("\\", "\\\\").replace('"', '\\"')
+                    lines.append('%s{step="%s"} %s' % (name, label, step[metric]))
+        with open(path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+class ReadStats:
+    # Queries, rows and wall time of the analytics reads per server they were routed to.
+
+    def __init__(self):
+        self.seconds = defaultdict(list)
+        self.rows = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def record(self, server, seconds, rows):
+        server = "%s:%s" % tuple(server) if isinstance(server, tuple) else str(server)
+        with self.lock:
+            self.seconds[server].append(seconds)
+            self.rows[server] += rows
+
+    def report(self):
+        columns = ["server", "queries", "rows", "mean_ms", "p95_ms", "max_ms"]
+        table = [columns]
+        for server, seconds in sorted(self.seconds.items()):
+            ordered = sorted(seconds)
+            table.append([
+                server,
+                str(len(ordered)),
+                str(self.rows[server]),
+                "%.1f" % (1000 * sum(ordered) / len(ordered)),
+                "%.1f" % (1000 * ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]),
+                "%.1f" % (1000 * ordered[-1]),
+            ])
+        widths = [max(len(row[i]) for row in table) for i in range(len(columns))]
+        print()
+        for row in table:
+            print("  ".join(value.ljust(width) for value, width in zip(row, widths)))
@@ -0,0 +1,32 @@
+"""Imports the Part scripts, whose file names are not valid module names."""
+import importlib.util
+import os
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PARTS = {
+    "A.2": "PartA.2_FonsecaRepas.py",
+    "A.3": "PartA.3_FonsecaRepas.py",
+    "B.1": "PartB.1_FonsecaRepas.py",
+    "B.2": "PartB.2_FonsecaRepas.py",
+    "B.3": "PartB.3_FonsecaRepas.py",
+    "B.4": "PartB.4_FonsecaRepas.py",
+    "C.1": "PartC.1_FonsecaRepas.py",
+    "C.2": "PartC.2_FonsecaRepas.py",
+    "D": "PartD_FonsecaRepas.py",
+}
+
+_modules = {}
+_lock = threading.Lock()
+
+
+def load_part(name):
+    with _lock:
+        if name not in _modules:
+            spec = importlib.util.spec_from_file_location("part_" + name.replace(".", "_"),
+                                                          os.path.join(ROOT, PARTS[name]))
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            _modules[name] = module
+        return _modules[name]
@@ -0,0 +1,285 @@
+"""Paper similarity on the keyword graph without the GDS plugin.
+
+The (:Paper)-[:Has]->(:Keyword) graph is held as a binary SciPy CSR matrix
+with a row per paper. The exact mode computes the Jaccard similarity of every
+pair of papers sharing a keyword from blocked products M[block] @ M.T, blocks
+being cut so that no product has more than max_products entries. The minhash
+mode only compares the papers that share a band of their MinHash signatures
+(LSH), so its cost follows the number of similar pairs rather than the number
+of papers sharing popular keywords. Candidates are then scored exactly, so it
+can miss neighbours but never misreports a similarity. Both keep the top_k
+most similar papers of every paper, with a similarity of at least cutoff.
+
+    python -m sdm.similarity --papers 50000 --workers 4    # exact against minhash
+"""
+import argparse
+import time
+from multiprocessing import Pool
+
+import numpy as np
+from scipy import sparse
+
+TOP_K = 10
+SIMILARITY_CUTOFF = 0.1
+MAX_PRODUCTS = 20000000
+BLOCK_ROWS = 4096
+# Score bins of the per-row threshold of the exact mode; two similarities of papers with up to
+# 16 keywords between them always fall in different bins
+BINS = 256
+# 32 bands of 2 rows: pairs with a similarity of 0.18 are candidates with probability 1/2
+BANDS = 32
+BAND_ROWS = 2
+PRIME = 2 ** 31 - 1
+
+_matrix = None
+
+
+def keyword_matrix(rows):
+    # rows: (paper, keywords) pairs. Returns the papers in row order and their CSR matrix.
+    papers, indptr, indices, codes = [], [0], [], {}
+    for paper, keywords in rows:
+        papers.append(paper)
+        indices.extend(sorted({codes.setdefault(keyword, len(codes)) for keyword in keywords}))
+        indptr.append(len(indices))
+    data = np.ones(len(indices), dtype=np.int32)
+    matrix = sparse.csr_matrix((data, np.asarray(indices, dtype=np.int64), np.asarray(indptr, dtype=np.int64)),
+                               shape=(len(papers), max(len(codes), 1)))
+    return papers, matrix
+
+
+def top_k_per_row(rows, columns, scores, top_k, cutoff):
+    # Keeps the top_k highest scores of every row that reach cutoff, ties by column
+    keep = (scores >= cutoff) & (rows != columns)
+    rows, columns, scores = rows[keep], columns[keep], scores[keep]
+    order = np.lexsort((columns, -scores, rows))
+    rows, columns, scores = rows[order], columns[order], scores[order]
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]]) if len(rows) else np.empty(0, dtype=np.int64)
+    ranks = np.arange(len(rows)) - np.repeat(starts, np.diff(np.r_[starts, len(rows)]))
+    keep = ranks < top_k
+    return rows[keep], columns[keep], scores[keep]
+
+
+def exact(matrix, top_k=TOP_K, cutoff=SIMILARITY_CUTOFF, workers=1, max_products=MAX_PRODUCTS):
+    # (rows, columns, similarities) of the exact top_k of every row
+    # Entries of the product of each row with M.T: the papers of each of its keywords
+    products = np.cumsum(matrix @ np.asarray(matrix.sum(axis=0)).ravel())
+    bounds, first = [], 0
+    while first < matrix.shape[0]:
+        budget = (products[first - 1] if first else 0) + max_products
+        end = min(max(first + 1, int(np.searchsorted(products, budget, side="right"))), first + BLOCK_ROWS)
+        bounds.append((first, end, top_k, cutoff))
+        first = end
+    return _concatenate(_map(_exact_block, bounds, matrix, workers))
+
+
+def _exact_block(task):
+    first, end, top_k, cutoff = task
+    matrix = _matrix
+    degrees = np.diff(matrix.indptr)
+    product = matrix[first:end] @ matrix.T
+    product.sort_indices()
+    rows = np.repeat(np.arange(end - first), np.diff(product.indptr))
+    columns = product.indices.astype(np.int64)
+    shared = product.data.astype(np.float64)
+    unions = degrees[rows + first] + degrees[columns] - shared
+    scores = shared / unions
+    keep = (scores >= cutoff) & (rows + first != columns)
+    rows, columns, scores = rows[keep], columns[keep], scores[keep]
+    if not len(rows):
+        return top_k_per_row(rows, columns, scores, top_k, cutoff)
+    keep = _threshold(rows, scores, end - first, top_k, unions.max(initial=0) <= 16)
+    return top_k_per_row(rows[keep] + first, columns[keep], scores[keep], top_k, cutoff)
+
+
+def _threshold(rows, scores, n_rows, top_k, exact_bins):
+    # Which entries can be in the top_k of their row, in linear time, so that only those are
+    # sorted. rows are grouped with the columns ascending within each row. A row keeps the
+    # bins from the best one down to the first with top_k entries. When every bin holds a single
+    # similarity (exact_bins), that last bin only keeps its first columns, as the sort would.
+    if not len(rows):
+        return np.zeros(0, dtype=bool)
+    bins = np.minimum((scores * BINS).astype(np.int64), BINS)
+    counts = np.bincount(rows * (BINS + 1) + bins, minlength=n_rows * (BINS + 1)).reshape(n_rows, BINS + 1)
+    # at_least[r, b]: entries of row r in bin b or above
+    at_least = np.c_[np.cumsum(counts[:, ::-1], axis=1)[:, ::-1], np.zeros(n_rows, dtype=np.int64)]
+    reached = at_least[:, :-1] >= top_k
+    threshold = np.where(reached.any(axis=1), BINS - np.argmax(reached[:, ::-1], axis=1), 0)
+    keep = bins >= threshold[rows]
+    if exact_bins:
+        last = bins == threshold[rows]
+        before = np.cumsum(last) - last
+        starts = np.searchsorted(rows, np.arange(n_rows))
+        rank = before - before[np.minimum(starts, len(before) - 1)][rows]
+        need = top_k - at_least[np.arange(n_rows), threshold + 1]
+        keep &= ~last | (rank < need[rows])
+    return keep
+
+
+def minhash(matrix, top_k=TOP_K, cutoff=SIMILARITY_CUTOFF, workers=1, bands=BANDS, band_rows=BAND_ROWS,
+            window=None, seed=0):
+    # (rows, columns, similarities) of the top_k among the LSH candidates of every row. Papers
+    # sharing a bucket are compared to their window next ones only, so that large buckets of
+    # papers with the same keywords do not bring back a quadratic number of pairs.
+    window = window or 2 * top_k
+    rng = np.random.default_rng(seed)
+    hashes = bands * band_rows
+    a = rng.integers(1, PRIME, hashes, dtype=np.int64)
+    b = rng.integers(0, PRIME, hashes, dtype=np.int64)
+    tasks = [(first, min(first + BLOCK_ROWS, matrix.shape[0]), a, b)
+             for first in range(0, matrix.shape[0], BLOCK_ROWS)]
+    signatures = np.concatenate([np.empty((0, hashes), dtype=np.int64)] +
+                                list(_map(_signature_block, tasks, matrix, workers)))
+    papers = np.flatnonzero(np.diff(matrix.indptr))
+    signatures = signatures[papers]
+
+    candidates = []
+    for band in range(bands):
+        _, buckets = np.unique(signatures[:, band * band_rows:(band + 1) * band_rows], axis=0, return_inverse=True)
+        buckets = buckets.ravel()
+        order = np.argsort(buckets, kind="stable")
+        members, buckets = papers[order], buckets[order]
+        for distance in range(1, min(window, len(members) - 1) + 1):
+            same = buckets[distance:] == buckets[:-distance]
+            candidates.append(members[:-distance][same] * matrix.shape[0] + members[distance:][same])
+    pairs = np.unique(np.concatenate(candidates or [np.empty(0, dtype=np.int64)]))
+    rows, columns = pairs // matrix.shape[0], pairs % matrix.shape[0]
+    # Each pair counts for both papers
+    rows, columns = np.r_[rows, columns], np.r_[columns, rows]
+    tasks = [(rows[first:first + MAX_PRODUCTS // 10], columns[first:first + MAX_PRODUCTS // 10])
+             for first in range(0, len(rows), MAX_PRODUCTS // 10)]
+    scores = np.concatenate([np.empty(0)] + list(_map(_jaccard_pairs, tasks, matrix, workers)))
+    return top_k_per_row(rows, columns, scores, top_k, cutoff)
+
+
+def _signature_block(task):
+    # Minimum of every hash (a * keyword + b) mod PRIME over the keywords of each row of the block
+    first, end, a, b = task
+    block = _matrix[first:end]
+    signatures = np.full((end - first, len(a)), PRIME, dtype=np.int64)
+    filled = np.flatnonzero(np.diff(block.indptr))
+    if len(filled):
+        hashed = (np.outer(block.indices.astype(np.int64), a) + b) % PRIME
+        signatures[filled] = np.minimum.reduceat(hashed, block.indptr[filled], axis=0)
+    return signatures
+
+
+def _jaccard_pairs(task):
+    rows, columns = task
+    degrees = np.diff(_matrix.indptr)
+    shared = np.asarray(_matrix[rows].multiply(_matrix[columns]).sum(axis=1)).ravel().astype(np.float64)
+    return shared / (degrees[rows] + degrees[columns] - shared)
+
+
+def _set_matrix(matrix):
+    global _matrix
+    _matrix = matrix
+
+
+def _map(function, tasks, matrix, workers):
+    # function over tasks in workers processes, which get the matrix once when they start
+    if workers > 1 and len(tasks) > 1:
+        with Pool(workers, initializer=_set_matrix, initargs=(matrix,)) as pool:
+            return pool.map(function, tasks)
+    _set_matrix(matrix)
+    return [function(task) for task in tasks]
+
+
+def _concatenate(blocks):
+    blocks = list(blocks)
+    if not blocks:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+    return tuple(np.concatenate(parts) for parts in zip(*blocks))
+
+
+def similar_pairs(papers, result):
+    # (paper, other paper, similarity) rows of a result, the most similar first
+    rows, columns, scores = result
+    order = np.lexsort((columns, rows, -scores))
+    return [(papers[row], papers[column], score)
+            for row, column, score in zip(rows[order].tolist(), columns[order].tolist(), scores[order].tolist())]
+
+
+def recall(approximate, reference):
+    # Share of the reference neighbours whose similarity is reached at the same rank of the
+    # same paper in the approximate result. Ties make the neighbours themselves arbitrary.
+    found = {}
+    for row, score in zip(*(approximate[0].tolist(), approximate[2].tolist())):
+        found.setdefault(row, []).append(score)
+    hits = 0
+    expected = {}
+    for row, score in zip(reference[0].tolist(), reference[2].tolist()):
+        rank = expected.get(row, 0)
+        expected[row] = rank + 1
+        scores = found.get(row, [])
+        hits += rank < len(scores) and scores[rank] >= score - 1e-9
+    return hits / len(reference[0]) if len(reference[0]) else 1.0
+
+
+def check(seed=0):
+    # Regression cases of the exact mode against a dense brute force: blocks without any pair
+    # at the cutoff (disjoint keywords, a high cutoff, papers without keywords) and a generated graph
+    cases = [
+        (keyword_matrix([("a", ["x"]), ("b", ["y"]), ("c", ["z"])])[1], 0.1),
+        (keyword_matrix([("a", ["x", "y"]), ("b", ["y", "z"]), ("c", ["x", "z"])])[1], 0.9),
+        (sparse.csr_matrix((3, 4), dtype=np.int32), 0.1),
+        (generate_matrix(300, 40, seed), 0.1),
+    ]
+    for matrix, cutoff in cases:
+        dense = matrix.toarray().astype(np.float64)
+        shared = dense @ dense.T
+        unions = dense.sum(axis=1)[:, None] + dense.sum(axis=1)[None, :] - shared
+        scores = np.divide(shared, unions, out=np.zeros_like(shared), where=unions > 0)
+        rows, columns = np.nonzero(shared)
+        expected = top_k_per_row(rows, columns, scores[rows, columns], TOP_K, cutoff)
+        found = exact(matrix, TOP_K, cutoff, max_products=50)
+        if not all(np.array_equal(x, y) for x, y in zip(found, expected)):
+            raise AssertionError("exact similarity differs from the brute force at cutoff %s" % cutoff)
+
+
+def generate_matrix(papers, keywords, seed=0):
+    # Papers with 1 + Poisson(2) Zipf distributed keywords, as in sdm.generate
+    from sdm.generate import Generator
+
+    rng = np.random.default_rng(seed)
+    rows, columns = Generator.pairs(rng, np.arange(papers), 1 + rng.poisson(2, papers), keywords, 1.4)
+    return sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, columns)), shape=(papers, keywords))
+
+
+def benchmark(papers, keywords, top_k=TOP_K, cutoff=SIMILARITY_CUTOFF, workers=1, seed=0):
+    matrix = generate_matrix(papers, keywords, seed)
+    start = time.perf_counter()
+    reference = exact(matrix, top_k, cutoff, workers)
+    exact_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    approximate = minhash(matrix, top_k, cutoff, workers, seed=seed)
+    minhash_seconds = time.perf_counter() - start
+    return {
+        "papers": papers,
+        "keyword_links": matrix.nnz,
+        "exact_pairs": len(reference[0]),
+        "minhash_pairs": len(approximate[0]),
+        "exact_seconds": round(exact_seconds, 3),
+        "minhash_seconds": round(minhash_seconds, 3),
+        "recall": round(recall(approximate, reference), 4),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="compare exact and minhash similarity on a generated graph")
+    parser.add_argument("--papers", type=int, default=20000)
+    parser.add_argument("--keywords", type=int, default=2500)
+    parser.add_argument("--top-k", type=int, default=TOP_K)
+    parser.add_argument("--cutoff", type=float, default=SIMILARITY_CUTOFF)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--check", action="store_true", help="only check the exact mode against a brute force")
+    args = parser.parse_args()
+
+    if args.check:
+        check(args.seed)
+        print("exact similarity matches the brute force")
+        raise SystemExit
+
+    for key, value in benchmark(args.papers, args.keywords, args.top_k, args.cutoff, args.workers,
+                                args.seed).items():
+        print("%s: %s" % (key, value))
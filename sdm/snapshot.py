@@ -0,0 +1,376 @@
+"""Binary snapshots of the graph for offline analytics, opened with NumPy memmaps.
+
+A snapshot is a directory named after the graph epoch (see sdm.cache) with
+one .npy file per array and a manifest.json:
+
+    <Label>.ids.npy, <Label>.order.npy       node keys (bytes) and their sorted order
+    <Label>.<property>.npy                   int64 column, INT_NULL for missing values
+    <Label>.<property>.offsets.npy / .data.npy   string column: UTF-8 bytes and offsets
+    <Start>_<TYPE>_<End>.indptr.npy / .indices.npy   CSR adjacency by start node
+
+Node indices are the positions in <Label>.ids.npy. Arrays are opened read-only
+with mmap_mode="r": opening costs no reads, and processes opening the same
+snapshot share the pages of the OS cache. Snapshots are built from the
+database (epoch of its GraphEpoch node) or straight from the PartA.2 CSV files
+(epoch from their sizes and modification times).
+
+    python -m sdm.snapshot csv /var/lib/neo4j/import snapshots
+    python -m sdm.snapshot export snapshots
+    python -m sdm.snapshot info snapshots
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from sdm.config import load_config
+from sdm.dataset import BATCH_SIZE, EDGES, INDEXES, NODES, TYPES, convert, edge_columns
+
+FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+INT_NULL = np.iinfo(np.int64).min
+
+
+def relationship_key(rel_type, start, end):
+    # Has links conferences to editions as well as papers to keywords, so keys name the endpoints
+    return "%s_%s_%s" % (start, rel_type, end)
+
+
+def csv_epoch(import_dir):
+    digest = hashlib.blake2b(digest_size=8)
+    for filename in sorted({spec[0] for spec in NODES + EDGES}):
+        stat = os.stat(os.path.join(import_dir, filename))
+        digest.update(("%s %d %d;" % (filename, stat.st_size, stat.st_mtime_ns)).encode("utf-8"))
+    return "csv-" + digest.hexdigest()
+
+
+class SnapshotWriter:
+    # Collects the nodes, then the relationships, and writes them under root/<epoch> at once.
+    # Both come in chunks that are converted and appended to the files one at a time, so only
+    # the node keys, needed to resolve the relationship ends, are held in memory.
+
+    def __init__(self, root, epoch):
+        self.root = root
+        self.epoch = epoch
+        self.path = os.path.join(root, epoch)
+        self.tmp = os.path.join(root, ".%s.%d" % (epoch, os.getpid()))
+        self.keys = {}
+        self.manifest = {"version": FORMAT_VERSION, "epoch": epoch, "nodes": {}, "relationships": {}}
+        os.makedirs(self.tmp, exist_ok=True)
+
+    def add_nodes(self, label, properties, chunks):
+        # chunks: (keys, {property: values}) pairs. Nodes without a key are left out. LOAD CSV
+        # creates a node per row, and the edges of a duplicated key reach every copy; here the
+        # first one wins.
+        seen, keys = set(), []
+        columns = {prop: _Column(self.tmp, "%s.%s" % (label, prop), TYPES.get(label, {}).get(prop))
+                   for prop in properties}
+        for chunk_keys, values in chunks:
+            chunk_keys = pd.Series(chunk_keys, dtype=object)
+            valid = chunk_keys.notna()
+            text = chunk_keys.astype(str)
+            first = (valid & ~text.where(valid).duplicated() & ~text.isin(seen)).to_numpy()
+            kept = text[first].tolist()
+            seen.update(kept)
+            keys.extend(kept)
+            for prop, column in columns.items():
+                column.append(pd.Series(values[prop], dtype=object)[first].tolist())
+        keys = pd.Index(keys, dtype=object)
+        self.keys[label] = keys
+        ids = np.array([key.encode("utf-8") for key in keys], dtype=bytes)
+        self._save(label + ".ids", ids)
+        self._save(label + ".order", np.argsort(ids, kind="stable"))
+        self.manifest["nodes"][label] = {"count": len(keys),
+                                         "properties": {prop: column.close() for prop, column in columns.items()}}
+
+    def add_relationships(self, rel_type, start, end, chunks, chunk_size=1000000):
+        # chunks: (start keys, end keys) pairs. Rows whose start or end node does not exist are
+        # left out, as LOAD CSV does not MATCH them. The ends are spooled to disk, then placed by
+        # start node, in file order, in a second pass of chunk_size rows.
+        key = relationship_key(rel_type, start, end)
+        counts = np.zeros(len(self.keys[start]), dtype=np.int64)
+        spool = os.path.join(self.tmp, key + ".pairs")
+        with open(spool, "wb") as f:
+            for start_keys, end_keys in chunks:
+                sources = self._indexer(start, start_keys)
+                targets = self._indexer(end, end_keys)
+                found = (sources >= 0) & (targets >= 0)
+                pairs = np.stack([sources[found], targets[found]], axis=1).astype(np.int64)
+                f.write(pairs.tobytes())
+                counts += np.bincount(pairs[:, 0], minlength=len(counts))
+        indptr = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        indices = np.lib.format.open_memmap(os.path.join(self.tmp, key + ".indices.npy"), mode="w+",
+                                            dtype=np.int64, shape=(int(indptr[-1]),))
+        if len(indices):
+            pairs = np.memmap(spool, dtype=np.int64, mode="r").reshape(-1, 2)
+            cursor = indptr[:-1].copy()
+            for first in range(0, len(pairs), chunk_size):
+                block = np.asarray(pairs[first:first + chunk_size])
+                order = np.argsort(block[:, 0], kind="stable")
+                sources, targets = block[order, 0], block[order, 1]
+                starts = np.flatnonzero(np.r_[True, sources[1:] != sources[:-1]])
+                ranks = np.arange(len(sources)) - np.repeat(starts, np.diff(np.r_[starts, len(sources)]))
+                indices[cursor[sources] + ranks] = targets
+                cursor += np.bincount(sources, minlength=len(cursor))
+            del pairs
+        indices.flush()
+        del indices
+        os.remove(spool)
+        self._save(key + ".indptr", indptr)
+        self.manifest["relationships"][key] = {"type": rel_type, "start": start, "end": end,
+                                               "count": int(indptr[-1])}
+
+    def commit(self):
+        # Moves the finished snapshot in place, so readers never see half of one
+        self.manifest["created"] = time.time()
+        with open(os.path.join(self.tmp, MANIFEST), "w") as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        os.replace(self.tmp, self.path)
+        return self.path
+
+    def _indexer(self, label, keys):
+        keys = pd.Series(keys, dtype=object)
+        return np.where(keys.notna(), self.keys[label].get_indexer(keys.astype(str)), -1)
+
+    def _save(self, name, array):
+        np.save(os.path.join(self.tmp, name + ".npy"), array)
+
+
+class _Column:
+    # A node property appended a chunk at a time to raw files, turned into .npy files by close():
+    # an int64 column, or UTF-8 bytes and their offsets for strings
+
+    def __init__(self, directory, name, value_type):
+        self.directory = directory
+        self.name = name
+        self.type = "int" if value_type == "int" else "string"
+        parts = [""] if self.type == "int" else [".offsets", ".data"]
+        self.files = {part: open(os.path.join(directory, name + part + ".raw"), "wb") for part in parts}
+        self.rows = 0
+        self.size = 0
+        if self.type == "string":
+            self.files[".offsets"].write(np.zeros(1, dtype=np.int64).tobytes())
+
+    def append(self, values):
+        self.rows += len(values)
+        if self.type == "int":
+            column = np.array([INT_NULL if value is None else value for value in values], dtype=np.int64)
+            self.files[""].write(column.tobytes())
+            return
+        encoded = [b"" if value is None else str(value).encode("utf-8") for value in values]
+        offsets = self.size + np.cumsum([len(value) for value in encoded], dtype=np.int64)
+        self.size += sum(len(value) for value in encoded)
+        self.files[".offsets"].write(offsets.astype(np.int64).tobytes())
+        self.files[".data"].write(b"".join(encoded))
+
+    def close(self):
+        # Writes the .npy files and returns the type of the column
+        shapes = {"": (self.rows, np.int64), ".offsets": (self.rows + 1, np.int64), ".data": (self.size, np.uint8)}
+        for part, f in self.files.items():
+            f.close()
+            raw = os.path.join(self.directory, self.name + part + ".raw")
+            length, dtype = shapes[part]
+            with open(os.path.join(self.directory, self.name + part + ".npy"), "wb") as out, open(raw, "rb") as f:
+                np.lib.format.write_array_header_1_0(out, {"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                                                           "fortran_order": False, "shape": (length,)})
+                shutil.copyfileobj(f, out)
+            os.remove(raw)
+        return self.type
+
+
+class Snapshot:
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        if self.manifest["version"] != FORMAT_VERSION:
+            raise ValueError("Snapshot %s has format version %s, expected %d"
+                             % (path, self.manifest["version"], FORMAT_VERSION))
+        self.epoch = self.manifest["epoch"]
+
+    def count(self, label):
+        return self.manifest["nodes"][label]["count"]
+
+    def ids(self, label):
+        return self._load(label + ".ids")
+
+    def index_of(self, label, keys):
+        # Node indices of keys, -1 for the keys that are not in the snapshot
+        ids, order = self.ids(label), self._load(label + ".order")
+        keys = np.array([str(key).encode("utf-8") for key in keys], dtype=bytes)
+        if not len(ids) or not len(keys):
+            return np.full(len(keys), -1, dtype=np.int64)
+        # Keys longer than the widest id are not there, and would be cut to its width
+        fits = np.char.str_len(keys) <= ids.dtype.itemsize
+        keys = keys.astype(ids.dtype)
+        positions = np.minimum(np.searchsorted(ids, keys, sorter=order), len(ids) - 1)
+        found = order[positions]
+        return np.where(fits & (ids[found] == keys), found, -1)
+
+    def property(self, label, prop):
+        # An int64 array, or a StringColumn for string properties
+        if self.manifest["nodes"][label]["properties"][prop] == "int":
+            return self._load("%s.%s" % (label, prop))
+        return StringColumn(self._load("%s.%s.offsets" % (label, prop)), self._load("%s.%s.data" % (label, prop)))
+
+    def adjacency(self, key):
+        # (indptr, indices): the end nodes of start node i are indices[indptr[i]:indptr[i + 1]]
+        return self._load(key + ".indptr"), self._load(key + ".indices")
+
+    def matrix(self, key, dtype=np.int32):
+        # The adjacency as a start x end SciPy CSR matrix on the mapped arrays; only its data of
+        # ones is allocated
+        relationship = self.manifest["relationships"][key]
+        indptr, indices = self.adjacency(key)
+        shape = (self.count(relationship["start"]), self.count(relationship["end"]))
+        return sparse.csr_matrix((np.ones(len(indices), dtype=dtype), indices, indptr), shape=shape)
+
+    def _load(self, name):
+        return np.load(os.path.join(self.path, name + ".npy"), mmap_mode="r")
+
+
+class StringColumn:
+    # Strings decoded on access from the mapped UTF-8 bytes
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+    def tolist(self):
+        return [self[i] for i in range(len(self))]
+
+
+def snapshots(root):
+    # The snapshots under root, the newest first; .<epoch>.<pid> directories are unfinished ones
+    found = []
+    for name in os.listdir(root) if os.path.isdir(root) else []:
+        if not name.startswith(".") and os.path.exists(os.path.join(root, name, MANIFEST)):
+            found.append(Snapshot(os.path.join(root, name)))
+    return sorted(found, key=lambda snapshot: snapshot.manifest["created"], reverse=True)
+
+
+def latest(root):
+    found = snapshots(root)
+    if not found:
+        raise FileNotFoundError("No snapshot in %s" % root)
+    return found[0]
+
+
+def build_from_csv(import_dir, root, chunk_size=1000000):
+    # Reads the node and edge CSV files of PartA.2 chunk_size rows at a time; an unchanged import
+    # directory reuses its snapshot
+    epoch = csv_epoch(import_dir)
+    if os.path.exists(os.path.join(root, epoch, MANIFEST)):
+        return Snapshot(os.path.join(root, epoch))
+    writer = SnapshotWriter(root, epoch)
+    for filename, label, properties in NODES:
+        writer.add_nodes(label, list(properties), _node_chunks(os.path.join(import_dir, filename), label, properties,
+                                                               chunk_size))
+    for filename, rel_type, start, end in EDGES:
+        frames = _read_csv(os.path.join(import_dir, filename), edge_columns(filename), chunk_size)
+        writer.add_relationships(rel_type, start[0], end[0], ((frame[start[2]], frame[end[2]]) for frame in frames),
+                                 chunk_size)
+    return Snapshot(writer.commit())
+
+
+def _node_chunks(path, label, properties, chunk_size):
+    key = INDEXES[label][0]
+    for frame in _read_csv(path, list(properties.values()), chunk_size):
+        columns = {prop: _convert(frame[column], TYPES.get(label, {}).get(prop))
+                   for prop, column in properties.items()}
+        yield columns[key], columns
+
+
+def _read_csv(path, columns, chunk_size):
+    if not os.path.getsize(path):
+        return []
+    return pd.read_csv(path, usecols=columns, dtype=str, keep_default_na=False, chunksize=chunk_size)
+
+
+def _convert(values, value_type):
+    # Empty fields are null, as with LOAD CSV
+    return [convert(value or None, value_type) for value in values.tolist()]
+
+
+def export_database(app, root, batch_size=BATCH_SIZE):
+    # Reads the loaded graph through app (sdm.app.BaseApp) a page of nodes at a time. Pages
+    # follow the internal node ids, which are unique where keys need not be: a key repeated
+    # across a page boundary would otherwise lose the rows after it. The epoch is that of the
+    # database, so a snapshot of the current epoch is reused and one of an older epoch never is.
+    epoch = app.graph_epoch() or "none"
+    if os.path.exists(os.path.join(root, epoch, MANIFEST)):
+        return Snapshot(os.path.join(root, epoch))
+    writer = SnapshotWriter(root, epoch)
+    for filename, label, properties in NODES:
+        query = ("MATCH (n:%s) WHERE id(n) > $after RETURN id(n) AS node, [%s] AS row ORDER BY node LIMIT $limit"
+                 % (label, ", ".join("n." + prop for prop in properties)))
+        writer.add_nodes(label, list(properties),
+                         _node_pages(app.pages(query, batch_size, after=-1), list(properties).index(INDEXES[label][0]),
+                                     list(properties)))
+    for filename, rel_type, start, end in EDGES:
+        query = ("MATCH (a:%s) WHERE id(a) > $after WITH a ORDER BY id(a) LIMIT $limit "
+                 "OPTIONAL MATCH (a)-[:%s]->(b:%s) RETURN id(a) AS node, a.%s AS key, collect(b.%s) AS ends "
+                 "ORDER BY node" % (start[0], rel_type, end[0], start[1], end[1]))
+        pages = (_edge_page(rows) for rows in app.pages(query, batch_size, after=-1))
+        writer.add_relationships(rel_type, start[0], end[0], pages, batch_size)
+    return Snapshot(writer.commit())
+
+
+def _node_pages(pages, key_index, properties):
+    for rows in pages:
+        yield [row[key_index] for node, row in rows], {prop: [row[i] for node, row in rows]
+                                                        for i, prop in enumerate(properties)}
+
+
+def _edge_page(rows):
+    pairs = [(key, end_key) for node, key, ends in rows for end_key in ends]
+    return [pair[0] for pair in pairs], [pair[1] for pair in pairs]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m sdm.snapshot")
+    commands = parser.add_subparsers(dest="command", required=True)
+    from_csv = commands.add_parser("csv", help="build a snapshot from the CSV files of PartA.2")
+    from_csv.add_argument("import_dir")
+    from_csv.add_argument("root", help="directory holding the snapshots")
+    export = commands.add_parser("export", help="build a snapshot of the loaded database")
+    export.add_argument("root")
+    export.add_argument("--config", help="settings file (default: sdm.ini or $SDM_CONFIG)")
+    info = commands.add_parser("info", help="describe the latest snapshot")
+    info.add_argument("root")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == "csv":
+        snapshot = build_from_csv(args.import_dir, args.root)
+    elif args.command == "export":
+        from sdm.app import BaseApp
+
+        app = BaseApp(config=load_config(args.config))
+        try:
+            snapshot = export_database(app, args.root)
+        finally:
+            app.close()
+    else:
+        snapshot = latest(args.root)
+    print("Snapshot %s (%.2fs)" % (snapshot.path, time.perf_counter() - start))
+    for label, node in sorted(snapshot.manifest["nodes"].items()):
+        print("%-32s %12d nodes" % (label, node["count"]))
+    for key, relationship in sorted(snapshot.manifest["relationships"].items()):
+        print("%-32s %12d relationships" % (key, relationship["count"]))
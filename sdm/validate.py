@@ -0,0 +1,106 @@
+"""Offline referential integrity check of the edge CSVs against the node CSVs.
+
+Node keys are held as sorted 64-bit hashes and every edge file is checked in
+vectorized chunks, so only rows whose endpoints exist reach the database.
+"""
+import argparse
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from sdm.dataset import EDGES, INDEXES, NODES
+
+CHUNK_SIZE = 1000000
+REPORT_FILE = "integrity_report.csv"
+
+
+def read_chunks(path, columns=None, chunk_size=CHUNK_SIZE):
+    # Empty fields stay empty strings; LOAD CSV reads them as null, which never matches
+    return pd.read_csv(path, usecols=columns, dtype=str, keep_default_na=False, chunksize=chunk_size)
+
+
+def hash_keys(values):
+    return pd.util.hash_array(np.asarray(values, dtype=object), categorize=False)
+
+
+def node_keys(import_dir, chunk_size=CHUNK_SIZE):
+    # label -> sorted unique hashes of the key column the edge loaders MATCH on
+    keys = {}
+    for filename, label, properties in NODES:
+        column = properties[INDEXES[label][0]]
+        parts = []
+        for chunk in read_chunks(os.path.join(import_dir, filename), [column], chunk_size):
+            values = chunk[column].to_numpy()
+            parts.append(np.unique(hash_keys(values[values != ""])))
+        keys[label] = np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.uint64)
+    return keys
+
+
+def contains(sorted_keys, values):
+    found = np.zeros(len(values), dtype=bool)
+    present = values != ""
+    if len(sorted_keys) and present.any():
+        hashes = hash_keys(values[present])
+        positions = np.minimum(np.searchsorted(sorted_keys, hashes), len(sorted_keys) - 1)
+        found[present] = sorted_keys[positions] == hashes
+    return found
+
+
+def check_edges(import_dir, out_dir, keys, chunk_size=CHUNK_SIZE):
+    # Writes every edge file with its orphan rows removed, plus those rows with the missing
+    # endpoint named, and returns (file, rows, orphans, missing start, missing end) per file
+    report = []
+    for filename, rel_type, start, end in EDGES:
+        stem = filename[:-len(".csv")]
+        rows = orphans = missing_start = missing_end = 0
+        clean_path = os.path.join(out_dir, filename)
+        orphan_path = os.path.join(out_dir, stem + "_orphans.csv")
+        for i, chunk in enumerate(read_chunks(os.path.join(import_dir, filename), chunk_size=chunk_size)):
+            has_start = contains(keys[start[0]], chunk[start[2]].to_numpy())
+            has_end = contains(keys[end[0]], chunk[end[2]].to_numpy())
+            valid = has_start & has_end
+            chunk[valid].to_csv(clean_path, mode="w" if i == 0 else "a", header=i == 0, index=False)
+            orphan_rows = chunk[~valid].assign(missing=np.where(
+                has_start[~valid], end[0], np.where(has_end[~valid], start[0], start[0] + "+" + end[0])))
+            orphan_rows.to_csv(orphan_path, mode="w" if i == 0 else "a", header=i == 0, index=False)
+            rows += len(chunk)
+            orphans += int((~valid).sum())
+            missing_start += int((~has_start).sum())
+            missing_end += int((~has_end).sum())
+        report.append((filename, rows, orphans, missing_start, missing_end))
+        print("%s: %d rows, %d orphans" % (filename, rows, orphans))
+    return report
+
+
+def validate(import_dir, out_dir, chunk_size=CHUNK_SIZE):
+    # out_dir ends up as a complete import directory: cleaned edge files plus the node files
+    os.makedirs(out_dir, exist_ok=True)
+    keys = node_keys(import_dir, chunk_size)
+    for filename, label, properties in NODES:
+        link_or_copy(os.path.join(import_dir, filename), os.path.join(out_dir, filename))
+    report = check_edges(import_dir, out_dir, keys, chunk_size)
+    pd.DataFrame(report, columns=["file", "rows", "orphans", "missing_start", "missing_end"]).to_csv(
+        os.path.join(out_dir, REPORT_FILE), index=False)
+    return report
+
+
+def link_or_copy(source, target):
+    if os.path.exists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("import_dir", help="directory holding the CSV files read by PartA.2")
+    parser.add_argument("out_dir", help="directory to write the cleaned files and the orphan report to")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    report = validate(args.import_dir, args.out_dir, args.chunk_size)
+    print("%d orphan rows in %d edge files" % (sum(row[2] for row in report), len(report)))
@@ -0,0 +1,53 @@
+import json
+
+from sdm.cache import QueryCache, cache_key
+
+
+def test_key_depends_on_query_parameters_and_epoch():
+    key = cache_key("MATCH (n) RETURN n", {"limit": 10}, "e1")
+    assert key == cache_key("MATCH (n) RETURN n", {"limit": 10}, "e1")
+    assert key != cache_key("MATCH (n) RETURN n", {"limit": 10}, "e2")
+    assert key != cache_key("MATCH (n) RETURN n", {"limit": 5}, "e1")
+    assert key != cache_key("MATCH (m) RETURN m", {"limit": 10}, "e1")
+
+
+def test_rows_come_back_as_lists():
+    cache = QueryCache()
+    cache.put("k", [("a", 1), ("b", None)])
+    assert cache.get("k") == [["a", 1], ["b", None]]
+    assert cache.get("other") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_goes_first():
+    cache = QueryCache(max_entries=2)
+    cache.put("a", [1])
+    cache.put("b", [2])
+    cache.get("a")
+    cache.put("c", [3])
+    assert cache.get("b") is None
+    assert cache.get("a") == [1] and cache.get("c") == [3]
+
+
+def test_byte_budget():
+    rows = [["x" * 10]]
+    size = len(json.dumps(rows, separators=(",", ":")))
+    cache = QueryCache(max_bytes=2 * size)
+    for key in "abc":
+        cache.put(key, rows)
+    assert cache.size <= 2 * size
+    assert cache.get("a") is None and cache.get("c") == rows
+
+
+def test_file_is_shared_and_bounded(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    first = QueryCache(max_entries=2, path=path)
+    for key in "abc":
+        first.put(key, [key])
+    first.close()
+    second = QueryCache(max_entries=2, path=path)
+    try:
+        assert second.get("a") is None
+        assert second.get("b") == ["b"] and second.get("c") == ["c"]
+    finally:
+        second.close()
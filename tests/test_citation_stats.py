@@ -0,0 +1,80 @@
+import pytest
+
+from sdm.config import DEFAULTS
+from sdm.dataset import EDGES
+from sdm.parts import load_part
+
+part = load_part("A.2")
+
+# Related ids as the graph would return them
+REFERENCES = {"p3": {"p4"}}
+AUTHORS = {"p2": {"a2"}, "p4": {"a4"}}
+PAPER_JOURNALS = {"p2": {"j2"}, "p4": {"j4"}}
+VOLUME_JOURNALS = {"v1": {"j1"}}
+
+
+class RecordingApp(part.App):
+    # _refresh_citation_stats with the graph reads and the materializing writes replaced:
+    # records which ids every step recomputes, None for all of them
+
+    def __init__(self):
+        super().__init__(driver=object(), config=dict(DEFAULTS))
+        self.recomputed = {}
+
+    def _materialize_paper_citations(self, session, paper_ids, batch_size):
+        self.recomputed["papers"] = paper_ids
+
+    def _materialize_author_citations(self, session, author_ids, batch_size):
+        self.recomputed["authors"] = author_ids
+
+    def _materialize_journal_years(self, session, journal_ids, batch_size):
+        self.recomputed["journals"] = journal_ids
+
+    def _references_of_papers(self, session, paper_ids, batch_size):
+        return set().union(*[REFERENCES.get(paper, set()) for paper in paper_ids])
+
+    def _authors_of_papers(self, session, paper_ids, batch_size):
+        return set().union(*[AUTHORS.get(paper, set()) for paper in paper_ids])
+
+    def _journals_of_papers(self, session, paper_ids, batch_size):
+        return set().union(*[PAPER_JOURNALS.get(paper, set()) for paper in paper_ids])
+
+    def _journals_of_volumes(self, session, volume_ids, batch_size):
+        return set().union(*[VOLUME_JOURNALS.get(volume, set()) for volume in volume_ids])
+
+
+def refresh(**changes):
+    changed = {filename: set() for filename, rel_type, start, end in EDGES}
+    changed.update((filename + ".csv", keys) for filename, keys in changes.items())
+    app = RecordingApp()
+    app._refresh_citation_stats(None, changed, 100)
+    return app.recomputed
+
+
+def test_nothing_changed():
+    assert refresh() == {"papers": set(), "authors": set(), "journals": set()}
+
+
+def test_new_citation():
+    # The cited paper, its authors and its journal
+    assert refresh(cites={("p1", "p2")}) == {"papers": {"p2"}, "authors": {"a2"}, "journals": {"j2"}}
+
+
+def test_paper_moved_to_another_volume():
+    # The papers p3 cites now count in another year; the journal of the volume changes too
+    assert refresh(contains={("v1", "p3")}) == {"papers": {"p4"}, "authors": {"a4"}, "journals": {"j1", "j4"}}
+
+
+def test_new_authorship_and_journal_volume():
+    assert refresh(wrote={("a9", "p7")}, has_volume={("j9", "v9")}) == {
+        "papers": set(), "authors": {"a9"}, "journals": {"j9"}}
+
+
+@pytest.mark.parametrize("changes", [
+    {"cites": None},
+    {"has_volume": None},
+    {"happened_in": {("e1", "2001")}},
+    {"volume_published_in_year": {("v1", "2001")}},
+])
+def test_full_recompute(changes):
+    assert refresh(**changes) == {"papers": None, "authors": None, "journals": None}
@@ -0,0 +1,80 @@
+import pytest
+
+from sdm.delta import Manifest
+
+ROWS = [["a1", "Ann"], ["a2", "Bob"], ["a3", "Cid"]]
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    manifest = Manifest(str(tmp_path / "manifest.sqlite"))
+    yield manifest
+    manifest.close()
+
+
+def upserts(manifest, filename):
+    return [row for batch in manifest.upserts(filename, 2) for row in batch]
+
+
+def deletes(manifest, filename):
+    return [key for batch in manifest.deletes(filename, 2) for key in batch]
+
+
+def test_first_load_upserts_everything(manifest):
+    manifest.stage("authors.csv", ROWS, [0])
+    assert not manifest.has_applied("authors.csv")
+    assert sorted(upserts(manifest, "authors.csv")) == ROWS
+    assert deletes(manifest, "authors.csv") == []
+
+
+def test_diff_against_the_committed_load(manifest):
+    manifest.stage("authors.csv", ROWS, [0])
+    manifest.commit("authors.csv")
+    manifest.stage("authors.csv", ROWS, [0])
+    assert upserts(manifest, "authors.csv") == []
+    assert deletes(manifest, "authors.csv") == []
+
+    manifest.stage("authors.csv", [["a1", "Ann"], ["a2", "Bea"], ["a4", "Dan"]], [0])
+    assert sorted(upserts(manifest, "authors.csv")) == [["a2", "Bea"], ["a4", "Dan"]]
+    assert deletes(manifest, "authors.csv") == [["a3"]]
+    assert sorted(manifest.changed_keys("authors.csv")) == [("a2",), ("a3",), ("a4",)]
+
+
+def test_uncommitted_changes_come_back(manifest):
+    manifest.stage("authors.csv", ROWS, [0])
+    manifest.commit("authors.csv")
+    manifest.stage("authors.csv", ROWS[:1], [0])
+    # An interrupted load does not commit: the next stage sees the same changes
+    manifest.stage("authors.csv", ROWS[:1], [0])
+    assert deletes(manifest, "authors.csv") == [["a2"], ["a3"]]
+
+
+def test_edges_keyed_by_both_endpoints(manifest):
+    manifest.stage("wrote.csv", [["a1", "p1"], ["a1", "p2"]], [0, 1])
+    manifest.commit("wrote.csv")
+    manifest.stage("wrote.csv", [["a1", "p2"], ["a2", "p1"]], [0, 1])
+    assert sorted(manifest.changed_keys("wrote.csv")) == [("a1", "p1"), ("a2", "p1")]
+
+
+def test_unstaged_rows_are_tried_again(manifest):
+    manifest.stage("wrote.csv", [["a1", "p1"], ["a9", "p1"]], [0, 1])
+    rows = [row for batch in manifest.upserts("wrote.csv", 10, with_key=True) for row in batch]
+    assert sorted(rows) == [["a1", "p1", "a1\x1fp1"], ["a9", "p1", "a9\x1fp1"]]
+    # a9 is not loaded yet
+    manifest.unstage("wrote.csv", ["a9\x1fp1"])
+    manifest.commit("wrote.csv")
+    manifest.stage("wrote.csv", [["a1", "p1"], ["a9", "p1"]], [0, 1])
+    assert upserts(manifest, "wrote.csv") == [["a9", "p1"]]
+
+
+def test_empty_file_counts_as_applied(manifest, tmp_path):
+    manifest.stage("reviewed.csv", [], [0, 1])
+    manifest.commit("reviewed.csv")
+    assert manifest.has_applied("reviewed.csv")
+    manifest.close()
+    reopened = Manifest(str(tmp_path / "manifest.sqlite"))
+    try:
+        assert reopened.has_applied("reviewed.csv")
+        assert not reopened.has_applied("cites.csv")
+    finally:
+        reopened.close()
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from sdm.hindex import generate_rows, h_indexes, reference_h_indexes, stream_h_indexes
+
+
+def brute_force(counts):
+    # The largest h with h papers of at least h citations each
+    return max(h for h in range(len(counts) + 1) if sum(count >= h for count in counts) >= h)
+
+
+def test_h_indexes_matches_brute_force():
+    rng = np.random.default_rng(0)
+    authors = rng.integers(0, 50, 2000)
+    citations = rng.integers(0, 30, 2000)
+    found, h = h_indexes(authors, citations)
+    for author, value in zip(found.tolist(), h.tolist()):
+        assert value == brute_force(citations[authors == author].tolist())
+    assert found.tolist() == sorted(set(authors.tolist()))
+
+
+def test_h_indexes_of_nothing():
+    found, h = h_indexes([], [])
+    assert len(found) == len(h) == 0
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 1000, 100000])
+def test_stream_matches_reference_for_any_chunk_size(chunk_size):
+    rows = generate_rows(300, 5, seed=1)
+    assert dict(stream_h_indexes(iter(rows), chunk_size)) == reference_h_indexes(rows)
+
+
+def test_stream_authors_without_papers():
+    # Authors without papers come as a single row with a null paper and 0 or null citations
+    rows = [("a", None, 0), ("b", "p1", 3), ("b", "p2", 1), ("c", None, None)]
+    assert dict(stream_h_indexes(rows, 2)) == {"a": 0, "b": 1, "c": 0}
@@ -0,0 +1,52 @@
+import numpy as np
+
+from sdm.impact import impact_factor, journal_year_rows, journal_year_stats
+
+
+def generate_papers(seed=0):
+    # (journal, volume year, citation_years, citations_per_year) of random papers
+    rng = np.random.default_rng(seed)
+    papers = []
+    for _ in range(300):
+        years = sorted(set(rng.integers(2000, 2012, rng.integers(0, 5)).tolist()))
+        papers.append(("j%d" % rng.integers(0, 4), int(rng.integers(2000, 2010)), years,
+                       rng.integers(1, 6, len(years)).tolist()))
+    return papers
+
+
+def brute_force(papers, journal, year, window=2):
+    published = [paper for paper in papers if paper[0] == journal and year - window <= paper[1] < year]
+    citations = sum(count for paper in published for citing, count in zip(paper[2], paper[3]) if citing == year)
+    return citations / len(published) if published else None
+
+
+def test_impact_factor_matches_brute_force():
+    papers = generate_papers()
+    stats = journal_year_stats(papers)
+    for journal in ["j0", "j1", "j2", "j3", "j9"]:
+        for year in range(1998, 2014):
+            assert impact_factor(stats, journal, year) == brute_force(papers, journal, year)
+
+
+def test_journal_year_rows():
+    papers = generate_papers(1)
+    rows = journal_year_rows(papers)
+    assert [journal for journal, table in rows] == sorted({paper[0] for paper in papers})
+    for journal, table in rows:
+        volume_years = {paper[1] for paper in papers if paper[0] == journal}
+        assert [entry[0] for entry in table] == sorted({year + offset for year in volume_years for offset in range(3)})
+        for year, count, citing_years, citations, factor in table:
+            published = [paper for paper in papers if paper[0] == journal and paper[1] == year]
+            assert count == len(published)
+            totals = {}
+            for paper in published:
+                for citing, citing_count in zip(paper[2], paper[3]):
+                    totals[citing] = totals.get(citing, 0) + citing_count
+            assert citing_years == sorted(totals)
+            assert citations == [totals[citing] for citing in citing_years]
+            assert factor == brute_force(papers, journal, year)
+
+
+def test_papers_without_citations():
+    rows = journal_year_rows([("j", 2001, None, None)])
+    assert rows == [["j", [[2001, 1, [], [], None], [2002, 0, [], [], 0.0], [2003, 0, [], [], 0.0]]]]
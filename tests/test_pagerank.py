@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from sdm.pagerank import (adjacency_matrix, align, citation_matrix, generate_matrix, page_rank, read_cites, subgraph,
+                          top)
+
+
+def dense_page_rank(matrix, damping=0.85, personalization=None):
+    # The stationary vector of the dense Google matrix: dangling papers link to every paper in
+    # proportion to the teleport distribution
+    n = matrix.shape[0]
+    links = matrix.toarray()
+    out_degrees = links.sum(axis=0)
+    teleport = np.full(n, 1.0 / n) if personalization is None else personalization / personalization.sum()
+    transition = np.where(out_degrees > 0, links / np.maximum(out_degrees, 1), teleport[:, None])
+    google = damping * transition + (1 - damping) * teleport[:, None]
+    values, vectors = np.linalg.eig(google)
+    vector = np.real(vectors[:, np.argmin(np.abs(values - 1))])
+    return vector / vector.sum()
+
+
+@pytest.mark.parametrize("papers, citations, seed", [(50, 3, 0), (200, 5, 1), (300, 1, 2)])
+def test_page_rank_matches_dense(papers, citations, seed):
+    matrix = generate_matrix(papers, citations, seed)
+    scores, iterations = page_rank(matrix, tolerance=1e-12, max_iterations=1000)
+    assert np.allclose(scores, dense_page_rank(matrix), atol=1e-9)
+    assert scores.sum() == pytest.approx(1.0)
+
+
+def test_personalized_page_rank_matches_dense():
+    matrix = generate_matrix(100, 4, seed=4)
+    personalization = np.random.default_rng(4).random(100)
+    scores, _ = page_rank(matrix, tolerance=1e-12, max_iterations=1000, personalization=personalization)
+    assert np.allclose(scores, dense_page_rank(matrix, personalization=personalization), atol=1e-9)
+
+
+def test_warm_start_converges_to_the_same_scores():
+    matrix = generate_matrix(200, 5, seed=6)
+    cold, cold_iterations = page_rank(matrix)
+    warm, warm_iterations = page_rank(matrix, start=cold)
+    assert np.allclose(warm, cold, atol=1e-8)
+    assert warm_iterations < cold_iterations
+
+
+def test_matrices_count_duplicate_citations_once():
+    edges = [("a", "b"), ("a", "b"), ("b", "c"), ("c", "a")]
+    papers, matrix = citation_matrix(edges)
+    assert papers == ["a", "b", "c"]
+    assert matrix.toarray().tolist() == [[0, 0, 1], [1, 0, 0], [0, 1, 0]]
+    # The CSR adjacency of a snapshot gives the same matrix
+    indptr, indices = np.array([0, 2, 3, 4]), np.array([1, 1, 2, 0])
+    assert (adjacency_matrix(indptr, indices) != matrix).nnz == 0
+
+
+def test_citation_matrix_keeps_the_given_papers():
+    papers, matrix = citation_matrix([("a", "b"), ("a", "z")], ["c", "b", "a"])
+    assert papers == ["c", "b", "a"]
+    assert matrix.toarray().tolist() == [[0, 0, 0], [0, 0, 1], [0, 0, 0]]
+
+
+def test_read_cites(tmp_path):
+    path = tmp_path / "cites.csv"
+    path.write_text("referenceid,paperid\np2,p1\np3,p1\n")
+    assert list(read_cites(str(path))) == [("p1", "p2"), ("p1", "p3")]
+
+
+def test_subgraph_top_and_align():
+    papers, matrix = citation_matrix([("a", "b"), ("b", "c"), ("c", "a"), ("d", "a")])
+    # c cites a: the row of a, the column of c
+    assert subgraph(matrix, [2, 0]).toarray().tolist() == [[0, 0], [1, 0]]
+    assert top(papers, np.array([0.1, 0.4, 0.4, 0.1]), 3) == [("b", 0.4), ("c", 0.4), ("a", 0.1)]
+    assert align(["a", "e"], ["a", "b"], np.array([0.2, 0.6])).tolist() == [0.2, 0.4]
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from scipy import sparse
+
+from sdm.similarity import exact, generate_matrix, keyword_matrix, minhash, recall, top_k_per_row
+
+
+def brute_force(matrix, top_k, cutoff):
+    # Jaccard similarity of every pair of rows from the dense matrix
+    dense = matrix.toarray().astype(np.float64)
+    shared = dense @ dense.T
+    unions = dense.sum(axis=1)[:, None] + dense.sum(axis=1)[None, :] - shared
+    scores = np.divide(shared, unions, out=np.zeros_like(shared), where=unions > 0)
+    rows, columns = np.nonzero(shared)
+    return top_k_per_row(rows, columns, scores[rows, columns], top_k, cutoff)
+
+
+CASES = [
+    (keyword_matrix([("a", ["x"]), ("b", ["y"]), ("c", ["z"])])[1], 0.1),
+    (keyword_matrix([("a", ["x", "y"]), ("b", ["y", "z"]), ("c", ["x", "z"])])[1], 0.9),
+    (sparse.csr_matrix((3, 4), dtype=np.int32), 0.1),
+    (generate_matrix(300, 40, seed=0), 0.1),
+    (generate_matrix(500, 25, seed=3), 0.3),
+]
+
+
+@pytest.mark.parametrize("matrix, cutoff", CASES)
+@pytest.mark.parametrize("max_products", [50, 20000000])
+def test_exact_matches_brute_force(matrix, cutoff, max_products):
+    found = exact(matrix, 10, cutoff, max_products=max_products)
+    expected = brute_force(matrix, 10, cutoff)
+    for x, y in zip(found, expected):
+        assert np.array_equal(x, y)
+
+
+def test_exact_on_workers():
+    matrix = generate_matrix(400, 30, seed=5)
+    single = exact(matrix, 5, 0.1, max_products=500)
+    parallel = exact(matrix, 5, 0.1, workers=2, max_products=500)
+    for x, y in zip(single, parallel):
+        assert np.array_equal(x, y)
+
+
+def test_minhash_recall():
+    matrix = generate_matrix(1000, 60, seed=2)
+    reference = exact(matrix, 10, 0.1)
+    assert recall(minhash(matrix, 10, 0.1, seed=2), reference) > 0.8
+
+
+def test_keyword_matrix_deduplicates_keywords():
+    papers, matrix = keyword_matrix([("a", ["x", "x", "y"]), ("b", [])])
+    assert papers == ["a", "b"]
+    assert matrix.toarray().tolist() == [[1, 1], [0, 0]]
@@ -0,0 +1,87 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sdm.dataset import EDGES, INDEXES, NODES, TYPES, convert, edge_columns
+from sdm.generate import Generator
+from sdm.snapshot import INT_NULL, SnapshotWriter, build_from_csv, latest, relationship_key
+
+
+@pytest.fixture(scope="module")
+def import_dir(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("import"))
+    Generator(path, scale=0.02, seed=3).generate()
+    # A duplicated paper, a citation of a missing paper and a paper without an id
+    with open(os.path.join(path, "papers.csv"), "a") as f:
+        f.write("p1,Copy of paper 1,en,978-0000000001,Copy\n,No id,en,,None\n")
+    with open(os.path.join(path, "cites.csv"), "a") as f:
+        f.write("p1,p999999\n")
+    return path
+
+
+def read(import_dir, filename, columns):
+    return pd.read_csv(os.path.join(import_dir, filename), usecols=columns, dtype=str, keep_default_na=False)
+
+
+@pytest.mark.parametrize("chunk_size", [97, 1000000])
+def test_build_from_csv_matches_the_files(import_dir, tmp_path, chunk_size):
+    snapshot = build_from_csv(import_dir, str(tmp_path), chunk_size)
+    for filename, label, properties in NODES:
+        frame = read(import_dir, filename, list(properties.values()))
+        key = properties[INDEXES[label][0]]
+        # The first row of every key, rows without a key left out
+        frame = frame[frame[key] != ""].drop_duplicates(key)
+        assert [value.decode() for value in snapshot.ids(label)] == frame[key].tolist()
+        for prop, column in properties.items():
+            values = snapshot.property(label, prop)
+            # Typed as LOAD CSV does, nulls stored as INT_NULL or an empty string
+            value_type = TYPES.get(label, {}).get(prop)
+            expected = [convert(value or None, value_type) for value in frame[column]]
+            if value_type == "int":
+                assert np.asarray(values).tolist() == [INT_NULL if value is None else value for value in expected]
+            else:
+                assert values.tolist() == ["" if value is None else str(value) for value in expected]
+    for filename, rel_type, start, end in EDGES:
+        frame = read(import_dir, filename, edge_columns(filename))
+        starts = snapshot.index_of(start[0], frame[start[2]])
+        ends = snapshot.index_of(end[0], frame[end[2]])
+        found = (starts >= 0) & (ends >= 0)
+        indptr, indices = snapshot.adjacency(relationship_key(rel_type, start[0], end[0]))
+        expected = sorted(zip(starts[found].tolist(), ends[found].tolist()))
+        actual = [(node, int(end_node)) for node in range(len(indptr) - 1)
+                  for end_node in indices[indptr[node]:indptr[node + 1]]]
+        assert sorted(actual) == expected
+
+
+def test_chunk_size_does_not_change_the_arrays(import_dir, tmp_path):
+    small = build_from_csv(import_dir, str(tmp_path / "small"), 50)
+    large = build_from_csv(import_dir, str(tmp_path / "large"))
+    assert small.manifest["nodes"] == large.manifest["nodes"]
+    for name in sorted(os.listdir(large.path)):
+        if name.endswith(".npy"):
+            assert np.array_equal(np.load(os.path.join(small.path, name)), np.load(os.path.join(large.path, name)))
+
+
+def test_unchanged_directory_reuses_its_snapshot(import_dir, tmp_path):
+    first = build_from_csv(import_dir, str(tmp_path))
+    created = first.manifest["created"]
+    assert build_from_csv(import_dir, str(tmp_path)).manifest["created"] == created
+    assert latest(str(tmp_path)).path == first.path
+    assert not [name for name in os.listdir(str(tmp_path)) if name.startswith(".")]
+
+
+def test_index_of_and_relationship_order(tmp_path):
+    writer = SnapshotWriter(str(tmp_path), "e1")
+    writer.add_nodes("Paper", ["id"], [(["b", "a"], {"id": ["b", "a"]}), (["c", "a", None], {"id": ["c", "a", None]})])
+    # The ends of a start node keep the order of the rows, across chunks
+    writer.add_relationships("Cites", "Paper", "Paper", [(["a", "b", "a"], ["c", "a", "b"]),
+                                                         (["x", "a", "c"], ["a", "a", "y"])], chunk_size=2)
+    path = writer.commit()
+    snapshot = latest(str(tmp_path))
+    assert snapshot.path == path
+    assert snapshot.index_of("Paper", ["a", "c", "zz", "cc"]).tolist() == [1, 2, -1, -1]
+    indptr, indices = snapshot.adjacency(relationship_key("Cites", "Paper", "Paper"))
+    assert indptr.tolist() == [0, 1, 4, 4]
+    assert indices.tolist() == [1, 2, 0, 1]